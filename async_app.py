@@ -0,0 +1,59 @@
+"""
+aiohttp entry point serving the same /webhook and /health as main_app.
+
+    python async_app.py [--host 0.0.0.0] [--port 5000]
+
+One event loop accepts and acks events without a thread per request.
+Ingestion (token check, event de-duplication, hand-off to the per-chat
+worker pool) is shared with the Flask app through lark_bot.ingest, so
+commands, crawls and the scheduler behave identically under either server.
+"""
+import argparse
+import json
+import logging
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+INGEST = web.AppKey("ingest", object)
+
+# The bot modules are imported in create_app(), not here: thumbnail pool
+# workers re-import this file as their __main__ and must not pull in the
+# state manager or start a scheduler.
+
+async def webhook(request: web.Request) -> web.Response:
+    try:
+        data = json.loads(await request.read() or b"{}")
+    except ValueError:
+        return web.json_response({"error": "Invalid JSON"}, status=400)
+    if not isinstance(data, dict):
+        return web.json_response({"error": "Invalid payload"}, status=400)
+    # Lock-protected dict/deque updates only: safe and cheap to run on the loop
+    body, status = request.app[INGEST].ingest_event(data)
+    return web.json_response(body, status=status)
+
+async def health_check(request: web.Request) -> web.Response:
+    ingest = request.app[INGEST]
+    return web.json_response({"status": "ok", "message": "Bot is running", "webhook": ingest.webhook_pool.stats(),
+                              "dedupe_keys": len(ingest.event_deduper)})
+
+def create_app() -> web.Application:
+    from lark_bot import ingest
+    import main_app
+
+    # Same scheduler service as under gunicorn
+    main_app.start_scheduler()
+    app = web.Application(client_max_size=1024 * 1024)
+    app[INGEST] = ingest
+    app.router.add_post("/webhook", webhook)
+    app.router.add_get("/health", health_check)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Async webhook server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    # Request access logs would dominate CPU at high event rates
+    web.run_app(create_app(), host=args.host, port=args.port, access_log=None)
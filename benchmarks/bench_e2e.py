@@ -0,0 +1,146 @@
+"""
+End-to-end latency harness: replay webhook events into main_app, offline.
+
+Usage:
+    python benchmarks/bench_e2e.py [--events 20] [--rate 2] [--lark-latency 0.05]
+
+Starts a FakeLarkServer and a FixtureAdsServer, points the bot at the fake
+Lark, swaps FacebookAdsCrawler for FixtureCrawler (no Chrome, no Facebook),
+then POSTs N "/search <domain>" events to main_app's /webhook through
+Flask's test client at the given rate. Reports p50/p95/p99 of:
+
+    time-to-card        webhook POST -> first card reply for that message
+    time-to-first-file  webhook POST -> first file message for that message
+    time-to-done        webhook POST -> search finished (state cleared)
+
+plus completed searches per minute. Nothing leaves 127.0.0.1.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_lark import FakeLarkServer  # noqa: E402
+
+
+def _pct(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _event(i, token):
+    return {
+        "schema": "2.0",
+        "header": {"event_id": f"ev_bench_{i}", "event_type": "im.message.receive_v1", "token": token},
+        "event": {
+            "sender": {"sender_id": {"user_id": f"u_bench_{i}"}},
+            "message": {
+                "chat_id": f"oc_bench_{i}",
+                "message_id": f"om_bench_{i}",
+                "chat_type": "group",
+                "content": json.dumps({"text": f"/search shop{i}.example.com"}),
+            },
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=2.0, help="Webhook events per second")
+    parser.add_argument("--lark-latency", type=float, default=0.05)
+    parser.add_argument("--lark-jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--advertisers", type=int, default=3)
+    parser.add_argument("--ads", type=int, default=15, help="Ads per advertiser")
+    parser.add_argument("--page-delay", type=float, default=0.05, help="Simulated page load per advertiser")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    lark = FakeLarkServer(latency=args.lark_latency, jitter=args.lark_jitter,
+                          error_rate=args.error_rate).start()
+    os.environ["LARK_BASE_URL"] = lark.base_url
+    os.environ.setdefault("VERIFICATION_TOKEN", "bench-token")
+    os.environ["LARK_FILE_KEY_CACHE"] = ""
+
+    # Imported only now so config picks up the fake endpoints
+    from lark_bot import config
+    if config.LARK_BASE_URL != lark.base_url:
+        sys.exit(f"LARK_BASE_URL is {config.LARK_BASE_URL} (set in .env?); refusing to run against it")
+    from benchmarks.fake_ads_library import FixtureAdsServer, FixtureCrawler
+    import lark_bot.command_handlers as handlers
+    from lark_bot.state_managers import state_manager
+    import main_app
+
+    ads = FixtureAdsServer(advertisers=args.advertisers, ads_per_advertiser=args.ads).start()
+    FixtureCrawler.fixture_url = ads.base_url
+    FixtureCrawler.page_delay = args.page_delay
+    handlers.FacebookAdsCrawler = FixtureCrawler
+
+    client = main_app.app.test_client()
+    sent_at, done_at, seen_running = {}, {}, set()
+    token = config.VERIFICATION_TOKEN
+
+    def watch():
+        while len(done_at) < args.events:
+            for i in list(sent_at):
+                if i in done_at:
+                    continue
+                state = state_manager.get_state(f"u_bench_{i}")
+                if state == "IN_PROGRESS":
+                    seen_running.add(i)
+                elif i in seen_running:
+                    done_at[i] = time.perf_counter()
+            time.sleep(0.02)
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+
+    t0 = time.perf_counter()
+    for i in range(args.events):
+        target = t0 + i / args.rate
+        time.sleep(max(0.0, target - time.perf_counter()))
+        sent_at[i] = time.perf_counter()
+        resp = client.post("/webhook", json=_event(i, token))
+        if resp.status_code != 200:
+            print(f"event {i}: webhook answered {resp.status_code}")
+
+    watcher.join(timeout=args.timeout)
+    elapsed = time.perf_counter() - t0
+
+    to_card, to_file, to_done = [], [], []
+    for i, start in sent_at.items():
+        events = lark.events_for(f"om_bench_{i}")
+        card = next((e["t"] for e in events if e["kind"] == "card"), None)
+        file = next((e["t"] for e in events if e["kind"] == "file"), None)
+        if card:
+            to_card.append(card - start)
+        if file:
+            to_file.append(file - start)
+        if i in done_at:
+            to_done.append(done_at[i] - start)
+
+    print(f"\n{args.events} events at {args.rate}/s, Lark latency {args.lark_latency * 1000:.0f}ms, "
+          f"error rate {args.error_rate:.0%}, {args.advertisers}x{args.ads} ads per search")
+    print(f"{'metric':<20}{'n':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name, values in (("time-to-card", to_card), ("time-to-first-file", to_file), ("time-to-done", to_done)):
+        print(f"{name:<20}{len(values):>5}" + "".join(
+            f"{_pct(values, q):>8.2f}s" for q in (0.50, 0.95, 0.99)) + f"{max(values, default=float('nan')):>8.2f}s")
+    mean = statistics.mean(to_done) if to_done else float("nan")
+    print(f"completed {len(done_at)}/{args.events} in {elapsed:.1f}s "
+          f"({len(done_at) / elapsed * 60:.1f} searches/min, mean {mean:.2f}s)")
+    print(f"fake Lark calls: {lark.counts}")
+
+    ads.stop()
+    lark.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark thumbnail throughput (images/sec) per pipeline configuration.
+
+Usage:
+    python benchmarks/bench_thumbnails.py [--images 200] [--size 1080]
+
+Source images are synthetic JPEGs served from memory, so only the
+decode/resize/encode stage is measured.
+"""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+
+from lark_bot.file_processor import ExcelImageExporter  # noqa: E402
+
+
+def _make_jpeg(size: int, seed: int) -> bytes:
+    img = Image.effect_mandelbrot((size, size), (-2 + seed % 7 * 0.01, -1.5, 1, 1.5), 60).convert("RGB")
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+class _MemoryExporter(ExcelImageExporter):
+    """Exporter whose 'download' step reads from an in-memory dict."""
+
+    def __init__(self, sources: dict, **kwargs):
+        super().__init__(**kwargs)
+        self.sources = sources
+
+    def _download_image(self, url):
+        return self.sources.get(url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--size", type=int, default=1080, help="Source image edge in pixels")
+    args = parser.parse_args()
+
+    distinct = [_make_jpeg(args.size, i) for i in range(8)]
+    sources = {f"https://img.example/{i}.jpg": distinct[i % len(distinct)] for i in range(args.images)}
+    tasks = {row: url for row, url in enumerate(sources, start=2)}
+    print(f"{args.images} source JPEGs at {args.size}x{args.size}, {os.cpu_count()} CPUs")
+    print(f"{'format':<8}{'quality':>8}{'processes':>11}{'img/s':>10}{'avg_KB':>9}")
+
+    for fmt, quality in (("PNG", 0), ("JPEG", 85), ("WEBP", 80)):
+        for processes in (0, None):
+            exporter = _MemoryExporter(
+                sources, image_size=(100, 100), max_workers=10,
+                process_workers=processes, thumbnail_format=fmt, thumbnail_quality=quality or 85,
+            )
+            t0 = time.perf_counter()
+            out = exporter._fetch_images(tasks)
+            elapsed = time.perf_counter() - t0
+            ok = [b for b in out.values() if b]
+            avg_kb = sum(len(b) for b in ok) / max(1, len(ok)) / 1024
+            label = "threads" if processes == 0 else str(exporter.process_workers)
+            print(f"{fmt:<8}{quality or '-':>8}{label:>11}{len(ok) / elapsed:>10.1f}{avg_kb:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
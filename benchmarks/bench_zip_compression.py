@@ -0,0 +1,56 @@
+"""
+Benchmark zip packing CPU time and output size per compression policy.
+
+Usage:
+    python benchmarks/bench_zip_compression.py [--videos 40] [--images 200]
+
+Payloads are random bytes (incompressible, like real JPEG/MP4 data) so no
+network access is needed.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lark_bot.file_processor import pack_media_parts  # noqa: E402
+
+
+def _make_blobs(n_videos: int, n_images: int, video_mb: float):
+    blobs = []
+    no = 1
+    for i in range(n_videos):
+        blobs.append((no, f"https://video.example/v/{i}.mp4", os.urandom(int(video_mb * 1024 * 1024))))
+        no += 1
+    for i in range(n_images):
+        blobs.append((no, f"https://scontent.example/i/{i}.jpg", os.urandom(120 * 1024)))
+        no += 1
+    return blobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--videos", type=int, default=40)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--video-mb", type=float, default=2.0)
+    parser.add_argument("--pack-workers", type=int, default=4)
+    args = parser.parse_args()
+
+    blobs = _make_blobs(args.videos, args.images, args.video_mb)
+    raw = sum(len(b) for _, _, b in blobs)
+    print(f"{len(blobs)} entries, {raw / 1024 / 1024:.1f} MB raw")
+    print(f"{'policy':<10}{'workers':>8}{'cpu_s':>10}{'wall_s':>10}{'parts':>7}{'out_MB':>10}")
+
+    for policy in ("deflate", "auto", "store"):
+        for workers in (1, args.pack_workers):
+            cpu0, wall0 = time.process_time(), time.perf_counter()
+            parts = pack_media_parts(blobs, "ad_url", "bench", compression=policy, pack_workers=workers)
+            cpu = time.process_time() - cpu0
+            wall = time.perf_counter() - wall0
+            size = sum(buf.getbuffer().nbytes for _, buf in parts)
+            print(f"{policy:<10}{workers:>8}{cpu:>10.2f}{wall:>10.2f}{len(parts):>7}{size / 1024 / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
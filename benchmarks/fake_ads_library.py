@@ -0,0 +1,215 @@
+"""
+Fixture Ads Library server plus a crawler that reads from it instead of Chrome.
+
+FixtureAdsServer serves deterministic advertisers, ads and media for any
+search word:
+
+    GET /advertisers?q=<word>          -> {"advertisers": [...]}
+    GET /ads?q=<word>&page=<name>      -> {"ads": [ad records]}
+    GET /media/<id>.jpg | .mp4         -> image / video bytes
+
+FixtureCrawler is a FacebookAdsCrawler whose browser stages (driver start,
+page loads, scrolling, card scraping) fetch from that server, with
+configurable per-page delays. crawl() itself, the ad and advertiser
+listeners, queueing, card updates and data_to_dataframe all run unchanged,
+so everything downstream of the browser is measured for real.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+import requests
+from PIL import Image
+
+from tools import FacebookAdsCrawler, domain_processing_card
+
+
+def _seed(*parts) -> int:
+    return int(hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:8], 16)
+
+
+class FixtureAdsServer:
+    """Deterministic stand-in for the Ads Library pages and the ad media CDN."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, advertisers: int = 5,
+                 ads_per_advertiser: int = 20, image_px: int = 600, video_kb: int = 256,
+                 latency: float = 0.0):
+        """
+        Args:
+            advertisers: Advertisers returned per search word
+            ads_per_advertiser: Ads per advertiser page
+            image_px: Edge of the generated JPEG creatives
+            video_kb: Size of the (random, incompressible) video payloads
+            latency: Delay added to every response, seconds
+        """
+        self.advertisers = advertisers
+        self.ads_per_advertiser = ads_per_advertiser
+        self.image_px = image_px
+        self.video_kb = video_kb
+        self.latency = latency
+        self._jpeg_cache = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True, name="fake-ads").start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Fixture data -------------------------------------------------------
+
+    def advertiser_names(self, word):
+        return [f"Brand{_seed(word, i) % 9000 + 1000} Store" for i in range(self.advertisers)]
+
+    def ads(self, word, page):
+        rng = random.Random(_seed(word, page))
+        out = []
+        for i in range(self.ads_per_advertiser):
+            lib_id = str(_seed(word, page, i) * 10 + i)
+            is_video = rng.random() < 0.3
+            media = f"{self.base_url}/media/{lib_id}"
+            out.append({
+                "text_snippet": f"Library ID: {lib_id} ...",
+                "library_id": lib_id,
+                "ad_start_date": f"{rng.randint(1, 28)} Jan 2025",
+                "company": page,
+                "avatar_url": None,
+                "image_url": None if is_video else f"{media}.jpg",
+                "video_url": f"{media}.mp4" if is_video else None,
+                "thumbnail_url": f"{media}.jpg",
+                "destination_url": f"https://{word}/p/{i}",
+                "pixel_id": None if rng.random() < 0.5 else f"{rng.getrandbits(48)}",
+                "primary_text": "Limited offer! " * rng.randint(1, 8),
+                "headline_text": "Shop now",
+            })
+        return out
+
+    def _jpeg(self, key):
+        # A handful of distinct creatives, like real campaigns reusing assets
+        variant = _seed(key) % 6
+        with self._lock:
+            if variant not in self._jpeg_cache:
+                img = Image.effect_mandelbrot((self.image_px, self.image_px),
+                                              (-2 + variant * 0.05, -1.5, 1, 1.5), 40).convert("RGB")
+                buf = BytesIO()
+                img.save(buf, format="JPEG", quality=85)
+                self._jpeg_cache[variant] = buf.getvalue()
+            return self._jpeg_cache[variant]
+
+    def _video(self, key):
+        return random.Random(_seed(key)).randbytes(self.video_kb * 1024)
+
+    # HTTP ---------------------------------------------------------------
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body: bytes, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                parts = urlsplit(self.path)
+                q = {k: v[0] for k, v in parse_qs(parts.query).items()}
+                if parts.path == "/advertisers":
+                    body = {"advertisers": server.advertiser_names(q.get("q", ""))}
+                    return self._send(200, json.dumps(body).encode(), "application/json")
+                if parts.path == "/ads":
+                    body = {"ads": server.ads(q.get("q", ""), q.get("page", ""))}
+                    return self._send(200, json.dumps(body).encode(), "application/json")
+                if parts.path.startswith("/media/"):
+                    name = parts.path[len("/media/"):]
+                    if name.endswith(".jpg"):
+                        return self._send(200, server._jpeg(name), "image/jpeg")
+                    if name.endswith(".mp4"):
+                        return self._send(200, server._video(name), "video/mp4")
+                self._send(404, b"{}", "application/json")
+
+            do_HEAD = do_GET
+
+        return Handler
+
+
+class FixtureCrawler(FacebookAdsCrawler):
+    """FacebookAdsCrawler reading advertisers and ads from a FixtureAdsServer."""
+
+    # Set by the harness before any crawler is built
+    fixture_url = None
+    page_delay = 0.0      # per advertiser page load
+    scroll_delay = 0.0    # per advertiser scroll-to-bottom
+
+    def initialize_driver(self):
+        if self.should_stop():
+            return False
+        self._http = requests.Session()
+        self._page_ads = []
+        return True
+
+    def fetch_ads_page(self):
+        self.outbox.update_card(
+            self.lark_api, self.message_id,
+            card=domain_processing_card(search_word=self.keyword, progress_percent=10),
+            chat=self.lark_chat_id
+        )
+        return True
+
+    def get_dim_keyword(self) -> pd.DataFrame:
+        r = self._http.get(f"{self.fixture_url}/advertisers", params={"q": self.keyword}, timeout=10)
+        r.raise_for_status()
+        return pd.DataFrame({"name": r.json()["advertisers"]})
+
+    def fetch_ads_page_by_id(self, page_name: str) -> bool:
+        time.sleep(self.page_delay)
+        r = self._http.get(f"{self.fixture_url}/ads", params={"q": self.keyword, "page": page_name}, timeout=10)
+        if r.status_code != 200:
+            return False
+        self._page_ads = r.json()["ads"]
+        return bool(self._page_ads)
+
+    def scroll_to_bottom(self):
+        time.sleep(self.scroll_delay)
+
+    def scrape_current_page_ads(self):
+        for ad_data in self._page_ads:
+            if self.should_stop():
+                return
+            ad_data = dict(ad_data, ad_number=len(self.ads_data) + 1)
+            self.ads_data.append(ad_data)
+            for listener in self.ad_listeners:
+                try:
+                    listener(ad_data)
+                except Exception:
+                    pass
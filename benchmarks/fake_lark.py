@@ -0,0 +1,212 @@
+"""
+Local stand-in for the Lark Open API, for offline latency and regression runs.
+
+Usage:
+    python benchmarks/fake_lark.py [--port 9100] [--latency 0.05] [--error-rate 0.01]
+
+Then point the bot at it with LARK_BASE_URL=http://127.0.0.1:9100/open-apis.
+
+Implements the endpoints the bot uses: tenant token, message reply, card
+PATCH, v4 send, IM file upload and the Drive chunked upload. Every request
+can be delayed (`latency` +/- `jitter` seconds) and can fail with a 429 or
+500 at `error_rate`. Each message-level call is recorded with its arrival
+time and the root message it belongs to, so a driver can measure
+time-to-card and time-to-first-file per conversation.
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+class FakeLarkServer:
+    """Threaded fake Lark server. Use start()/stop() or as a context manager."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        """
+        Args:
+            host, port: Bind address (port 0 picks a free port)
+            latency: Base delay added to every request, seconds
+            jitter: Uniform +/- jitter added to the delay, seconds
+            error_rate: Probability a message/file call answers 429 or 500 instead
+            seed: RNG seed so runs are reproducible
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._root_of = {}     # bot message id -> root (user) message id
+        self.events = []       # dicts: t, kind, root, message_id, msg_type
+        self.counts = {}
+        self._uploads = {}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/open-apis"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True, name="fake-lark")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Bookkeeping --------------------------------------------------------
+
+    def _new_id(self, prefix="om") -> str:
+        return f"{prefix}_fake{next(self._ids)}"
+
+    def _record(self, kind, message_id, msg_type=None, new_id=None):
+        with self._lock:
+            root = self._root_of.get(message_id, message_id)
+            if new_id:
+                self._root_of[new_id] = root
+            self.events.append({"t": time.perf_counter(), "kind": kind, "root": root,
+                                "message_id": message_id, "msg_type": msg_type})
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def events_for(self, root: str):
+        with self._lock:
+            return [e for e in self.events if e["root"] == root]
+
+    def _delay_and_fault(self, faultable: bool):
+        with self._lock:
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            fault = faultable and self._rng.random() < self.error_rate
+            status = self._rng.choice((429, 500)) if fault else None
+        if delay:
+            time.sleep(delay)
+        return status
+
+    # HTTP ---------------------------------------------------------------
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body, headers=None):
+                raw = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+
+            def _route(self, method):
+                raw = self._body()
+                path = urlsplit(self.path).path
+                if path.startswith("/open-apis"):
+                    path = path[len("/open-apis"):]
+
+                if path == "/auth/v3/tenant_access_token/internal":
+                    server._delay_and_fault(False)
+                    server._record("token", None)
+                    return self._reply(200, {"code": 0, "tenant_access_token": "t-fake", "expire": 7200})
+
+                status = server._delay_and_fault(True)
+                if status == 429:
+                    return self._reply(429, {"code": 99991400, "msg": "rate limited"},
+                                       {"x-ogw-ratelimit-reset": "0"})
+                if status:
+                    return self._reply(status, {"code": 1, "msg": "injected failure"})
+
+                m = re.fullmatch(r"/im/v1/messages/([^/]+)/reply", path)
+                if m and method == "POST":
+                    msg_type = json.loads(raw or b"{}").get("msg_type")
+                    new_id = server._new_id()
+                    kind = {"interactive": "card", "file": "file"}.get(msg_type, "reply")
+                    server._record(kind, m.group(1), msg_type, new_id=new_id)
+                    return self._reply(200, {"code": 0, "data": {"message_id": new_id}})
+
+                m = re.fullmatch(r"/im/v1/messages/([^/]+)", path)
+                if m and method == "PATCH":
+                    server._record("patch", m.group(1))
+                    return self._reply(200, {"code": 0, "data": {}})
+
+                if path == "/message/v4/send/" and method == "POST":
+                    body = json.loads(raw or b"{}")
+                    new_id = server._new_id()
+                    server._record("send", body.get("chat_id"), body.get("msg_type"), new_id=new_id)
+                    return self._reply(200, {"code": 0, "data": {"message_id": new_id}})
+
+                if path == "/im/v1/files" and method == "POST":
+                    server._record("upload", None)
+                    return self._reply(200, {"code": 0, "data": {"file_key": server._new_id("file")}})
+
+                if path == "/drive/v1/files/upload_prepare":
+                    size = json.loads(raw or b"{}").get("size", 0)
+                    block = 4 * 1024 * 1024
+                    upload_id = server._new_id("up")
+                    return self._reply(200, {"code": 0, "data": {
+                        "upload_id": upload_id, "block_size": block, "block_num": max(1, -(-size // block))}})
+                if path == "/drive/v1/files/upload_part":
+                    server._record("upload_part", None)
+                    return self._reply(200, {"code": 0, "data": {}})
+                if path == "/drive/v1/files/upload_finish":
+                    return self._reply(200, {"code": 0, "data": {"file_token": server._new_id("box")}})
+
+                return self._reply(404, {"code": 404, "msg": f"no fake for {method} {path}"})
+
+            def do_POST(self):
+                self._route("POST")
+
+            def do_PATCH(self):
+                self._route("PATCH")
+
+            def do_GET(self):
+                self._route("GET")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeLarkServer(port=args.port, latency=args.latency, jitter=args.jitter,
+                            error_rate=args.error_rate).start()
+    print(f"Fake Lark listening at {server.base_url} (Ctrl-C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"calls: {server.counts}")
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
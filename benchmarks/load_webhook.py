@@ -0,0 +1,113 @@
+"""
+Load test for the webhook ack path.
+
+Usage:
+    python benchmarks/load_webhook.py [--url http://127.0.0.1:5000/webhook] [--events 20000] [--concurrency 200]
+
+Fires unique im.message.receive_v1 events (plain chat text, so handlers
+log and return without calling Lark) plus a share of re-delivered
+duplicates, and reports acked events/sec and p50/p95/p99 ack latency.
+Without --url it starts async_app in-process on a free port; run with
+`taskset -c 0` to hold the server and client to a single core.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp  # noqa: E402
+
+
+def _event(i, token):
+    return {
+        "schema": "2.0",
+        "header": {"event_id": f"ev_load_{i}", "event_type": "im.message.receive_v1", "token": token},
+        "event": {
+            "sender": {"sender_id": {"user_id": f"u_load_{i % 500}"}},
+            "message": {
+                "chat_id": f"oc_load_{i % 500}",
+                "message_id": f"om_load_{i}",
+                "chat_type": "group",
+                "content": json.dumps({"text": "just chatting"}),
+            },
+        },
+    }
+
+
+async def _run(url, events, concurrency, token, dup_rate):
+    latencies, statuses = [], {}
+    ids = list(range(events))
+    # Re-deliveries of already-sent events, as Lark does on slow acks
+    ids += random.Random(0).sample(ids, int(events * dup_rate))
+    queue = asyncio.Queue()
+    for i in ids:
+        queue.put_nowait(json.dumps(_event(i, token)).encode())
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def worker():
+            while not queue.empty():
+                body = queue.get_nowait()
+                t0 = time.perf_counter()
+                async with session.post(url, data=body, headers={"Content-Type": "application/json"}) as resp:
+                    await resp.read()
+                    statuses[resp.status] = statuses.get(resp.status, 0) + 1
+                latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+    return latencies, statuses, elapsed
+
+
+async def _serve_in_process(token):
+    os.environ.setdefault("VERIFICATION_TOKEN", token)
+    from aiohttp import web
+    import async_app
+    runner = web.AppRunner(async_app.create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/webhook"
+
+
+async def main_async(args):
+    runner = None
+    url = args.url
+    token = args.token
+    if not url:
+        runner, url = await _serve_in_process(token)
+        from lark_bot.config import VERIFICATION_TOKEN
+        token = VERIFICATION_TOKEN
+    latencies, statuses, elapsed = await _run(url, args.events, args.concurrency, token, args.dup_rate)
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"{len(latencies)} requests ({args.dup_rate:.0%} duplicates), concurrency {args.concurrency}")
+    print(f"statuses: {statuses}")
+    print(f"throughput: {len(latencies) / elapsed:,.0f} events/s over {elapsed:.2f}s")
+    print(f"ack latency ms: p50 {pick(0.50):.1f}  p95 {pick(0.95):.1f}  p99 {pick(0.99):.1f}")
+    if runner:
+        from lark_bot.ingest import webhook_pool
+        print(f"worker pool: {webhook_pool.stats()}")
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default=None, help="Existing /webhook URL (default: start async_app in-process)")
+    parser.add_argument("--token", default="load-token", help="VERIFICATION_TOKEN expected by the server")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--dup-rate", type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
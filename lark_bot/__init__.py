@@ -1,3 +1,11 @@
 from .lark_api import LarkAPI
-from .state_managers import state_manager
-from .config import *
\ No newline at end of file
+from .dispatcher import LarkDispatcher, get_dispatcher
+from .config import *
+
+def __getattr__(name):
+    # Loaded on first use: creating the state manager starts threads and opens stores,
+    # which thumbnail worker processes importing this package must not do
+    if name == "state_manager":
+        from .state_managers import state_manager
+        return state_manager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,104 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class CrawlBatch:
+    """
+    A group of searches (e.g. one schedule's domains) run as a single job.
+
+    At most `parallel` items are handed to the crawl system at a time and the
+    next one is started as soon as one finishes, so the batch moves exactly
+    as fast as the crawl queue drains while interactive searches can still
+    get in between. `start(item, done)` must start the work and arrange for
+    `done(status, count)` to be called once it ends; a falsy return (or an
+    exception) records the item as "skipped".
+    """
+
+    def __init__(self, items, start, parallel: int = 2, on_progress=None, on_complete=None):
+        """
+        Args:
+            items: Items to run, in order
+            start: Called as start(item, done) -> bool
+            parallel: Items in flight at once
+            on_progress: Called as on_progress(batch) after each item finishes
+            on_complete: Called as on_complete(batch) once, after the last item
+        """
+        self.items = list(items)
+        self.start = start
+        self.parallel = max(1, parallel)
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self.results = {}             # item -> (status, count), in completion order
+        self._pending = list(self.items)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def total(self) -> int:
+        return len(self.items)
+
+    @property
+    def unstarted(self) -> int:
+        """Items not yet handed to the crawl system."""
+        with self._lock:
+            return len(self._pending)
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    def run(self):
+        """Start the first items and return immediately."""
+        if not self.items:
+            self._complete()
+            return self
+        for _ in range(min(self.parallel, len(self.items))):
+            self._start_next()
+        return self
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _start_next(self):
+        with self._lock:
+            if not self._pending:
+                return
+            item = self._pending.pop(0)
+        finished = threading.Event()
+
+        def done(status: str, count: int = 0):
+            # Guard against callers reporting twice
+            if not finished.is_set():
+                finished.set()
+                self._finish(item, status, count)
+
+        try:
+            started = self.start(item, done)
+        except Exception as e:
+            logger.error(f"[Batch] Could not start {item}: {e}")
+            started = False
+        if not started:
+            done("skipped")
+
+    def _finish(self, item, status: str, count: int):
+        with self._lock:
+            self.results[item] = (status, count)
+            last = len(self.results) == len(self.items)
+        if self.on_progress:
+            try:
+                self.on_progress(self)
+            except Exception as e:
+                logger.warning(f"[Batch] Progress callback failed: {e}")
+        if last:
+            self._complete()
+        else:
+            self._start_next()
+
+    def _complete(self):
+        self._done.set()
+        if self.on_complete:
+            try:
+                self.on_complete(self)
+            except Exception as e:
+                logger.warning(f"[Batch] Completion callback failed: {e}")
@@ -0,0 +1,207 @@
+import json
+import os
+import sqlite3
+import threading
+
+from .config import CHAT_CONFIG_DB
+
+class ChatConfigStore:
+    """
+    Per-chat domains, daily schedules and schedule fire records in SQLite (WAL).
+
+    Every change is a single-row (or single-transaction batch) write, so its
+    cost no longer grows with the number of chats, and readers never block
+    the writer. Each thread gets its own connection; no Python lock is held.
+    A schedules version counter lets other processes notice changes.
+    """
+
+    def __init__(self, path: str = CHAT_CONFIG_DB, domains_json: str = None, schedules_json: str = None):
+        """
+        Args:
+            path: SQLite file
+            domains_json: Legacy {chat_id: [domain, ...]} file to import once
+            schedules_json: Legacy {chat_id: [{hour, minute, tz_offset}, ...]} file to import once
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS domains (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id TEXT NOT NULL, domain TEXT NOT NULL,
+                UNIQUE (chat_id, domain));
+            CREATE TABLE IF NOT EXISTS schedules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id TEXT NOT NULL,
+                hour INTEGER NOT NULL, minute INTEGER NOT NULL, tz_offset INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS schedules_chat ON schedules (chat_id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS schedule_fires (
+                schedule_id TEXT PRIMARY KEY, minute TEXT NOT NULL, fired_at REAL NOT NULL,
+                owner TEXT, catchup INTEGER NOT NULL DEFAULT 0);
+        """)
+        self._migrate(domains_json, schedules_json)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _tx(self):
+        return _Transaction(self._conn())
+
+    # ---------------- Domains ----------------
+    def get_domains(self, chat_id) -> list:
+        rows = self._conn().execute("SELECT domain FROM domains WHERE chat_id=? ORDER BY id",
+                                    (str(chat_id),)).fetchall()
+        return [r[0] for r in rows]
+
+    def add_domains(self, chat_id, domains) -> list:
+        """Add domains in one transaction; return those that were not already present."""
+        added = []
+        with self._tx() as conn:
+            for domain in domains:
+                cur = conn.execute("INSERT OR IGNORE INTO domains (chat_id, domain) VALUES (?, ?)",
+                                   (str(chat_id), domain))
+                if cur.rowcount:
+                    added.append(domain)
+        return added
+
+    def remove_domains(self, chat_id, domains=None) -> list:
+        """Remove the given domains (all of the chat's with None) in one transaction; return those removed."""
+        cid = str(chat_id)
+        with self._tx() as conn:
+            if domains is None:
+                removed = [r[0] for r in conn.execute(
+                    "SELECT domain FROM domains WHERE chat_id=? ORDER BY id", (cid,)).fetchall()]
+                conn.execute("DELETE FROM domains WHERE chat_id=?", (cid,))
+                return removed
+            return [d for d in domains
+                    if conn.execute("DELETE FROM domains WHERE chat_id=? AND domain=?", (cid, d)).rowcount]
+
+    def all_domains(self) -> dict:
+        result = {}
+        for cid, domain in self._conn().execute("SELECT chat_id, domain FROM domains ORDER BY id"):
+            result.setdefault(cid, []).append(domain)
+        return result
+
+    # ---------------- Schedules ----------------
+    def get_schedules(self, chat_id) -> list:
+        rows = self._conn().execute(
+            "SELECT hour, minute, tz_offset FROM schedules WHERE chat_id=? ORDER BY tz_offset, hour, minute, id",
+            (str(chat_id),)).fetchall()
+        return [{"hour": h, "minute": m, "tz_offset": tz} for h, m, tz in rows]
+
+    def add_schedule(self, chat_id, hour: int, minute: int, tz_offset: int, allow_duplicate: bool = False) -> bool:
+        with self._tx() as conn:
+            if not allow_duplicate and conn.execute(
+                    "SELECT 1 FROM schedules WHERE chat_id=? AND hour=? AND minute=? AND tz_offset=?",
+                    (str(chat_id), hour, minute, tz_offset)).fetchone():
+                return False
+            conn.execute("INSERT INTO schedules (chat_id, hour, minute, tz_offset) VALUES (?, ?, ?, ?)",
+                         (str(chat_id), hour, minute, tz_offset))
+            self._bump_version(conn)
+        return True
+
+    def remove_schedules(self, chat_id, entries=None) -> int:
+        """
+        Remove schedules in one transaction; return how many rows were deleted.
+
+        Args:
+            entries: (hour, minute, tz_offset) tuples, or None for all of the chat's schedules
+        """
+        cid = str(chat_id)
+        with self._tx() as conn:
+            if entries is None:
+                removed = conn.execute("DELETE FROM schedules WHERE chat_id=?", (cid,)).rowcount
+            else:
+                removed = sum(conn.execute(
+                    "DELETE FROM schedules WHERE chat_id=? AND hour=? AND minute=? AND tz_offset=?",
+                    (cid, h, m, tz)).rowcount for h, m, tz in entries)
+            if removed:
+                self._bump_version(conn)
+        return removed
+
+    def all_schedules(self) -> dict:
+        result = {}
+        for cid, h, m, tz in self._conn().execute(
+                "SELECT chat_id, hour, minute, tz_offset FROM schedules ORDER BY chat_id, tz_offset, hour, minute, id"):
+            result.setdefault(cid, []).append({"hour": h, "minute": m, "tz_offset": tz})
+        return result
+
+    def schedules_version(self) -> int:
+        row = self._conn().execute("SELECT value FROM meta WHERE key='schedules_version'").fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _bump_version(conn):
+        conn.execute("INSERT INTO meta (key, value) VALUES ('schedules_version', '1') "
+                     "ON CONFLICT(key) DO UPDATE SET value=CAST(value AS INTEGER) + 1")
+
+    # ---------------- Schedule fire records ----------------
+    def get_fire(self, schedule_id):
+        """Last fire of a schedule as {minute, at, by, catchup}, or None."""
+        row = self._conn().execute(
+            "SELECT minute, fired_at, owner, catchup FROM schedule_fires WHERE schedule_id=?",
+            (schedule_id,)).fetchone()
+        if not row:
+            return None
+        return {"minute": row[0], "at": row[1], "by": row[2], "catchup": bool(row[3])}
+
+    def record_fire(self, schedule_id, minute: str, fired_at: float, owner: str, catchup: bool = False) -> bool:
+        """Record that `schedule_id` fired for local minute `minute`; False if that minute was already recorded."""
+        cur = self._conn().execute(
+            "INSERT INTO schedule_fires (schedule_id, minute, fired_at, owner, catchup) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(schedule_id) DO UPDATE SET minute=excluded.minute, fired_at=excluded.fired_at, "
+            "owner=excluded.owner, catchup=excluded.catchup WHERE schedule_fires.minute != excluded.minute",
+            (schedule_id, minute, fired_at, owner, int(catchup)))
+        return cur.rowcount == 1
+
+    # ---------------- Migration ----------------
+    def _migrate(self, domains_json, schedules_json):
+        with self._tx() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key='json_migrated'").fetchone():
+                return
+            domains = _load_json(domains_json)
+            for cid, items in domains.items():
+                for domain in items or []:
+                    conn.execute("INSERT OR IGNORE INTO domains (chat_id, domain) VALUES (?, ?)", (str(cid), domain))
+            schedules = _load_json(schedules_json)
+            for cid, items in schedules.items():
+                # Old files stored a single schedule as a dict
+                if isinstance(items, dict):
+                    items = [items]
+                for s in items if isinstance(items, list) else []:
+                    conn.execute("INSERT INTO schedules (chat_id, hour, minute, tz_offset) VALUES (?, ?, ?, ?)",
+                                 (str(cid), int(s.get("hour", 0)), int(s.get("minute", 0)),
+                                  int(s.get("tz_offset", 0))))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', '1')")
+        if domains or schedules:
+            print(f"Imported {len(domains)} chats' domains and {len(schedules)} chats' schedules into {self.path}")
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block, on an autocommit connection."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+def _load_json(path) -> dict:
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"Could not import {path}: {e}")
+        return {}
+    return data if isinstance(data, dict) else {}
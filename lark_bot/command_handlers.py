@@ -1,6 +1,11 @@
 from .state_managers import state_manager
 from .lark_api import LarkAPI
-from .file_processor import generate_excel_report, build_media_zip
+from .dispatcher import get_dispatcher
+from .file_processor import generate_excel_report, build_media_zip, MediaPrefetcher
+from .progressive import ProgressiveReporter
+from .batch import CrawlBatch
+from .config import (PROGRESSIVE_RESULTS, PROGRESSIVE_EVERY_N, PROGRESSIVE_CHUNK_ROWS, MEDIA_ZIP_PART_BYTES,
+                     SCHEDULE_BATCH_PARALLEL)
 from tools import *
 import threading
 import re
@@ -51,6 +56,7 @@ def now_str(tz_offset_hours: int | None = None) -> str:
 class CommandHandler:
     def __init__(self):
         self.lark_api = LarkAPI()
+        self.outbox = get_dispatcher()
         self.start_reponse = {
             "help": self.show_help_menu,
             "hi": self.show_help_menu,
@@ -94,7 +100,12 @@ class CommandHandler:
         
         elif text.startswith("search "):
             domain = text[7:].strip()  # More efficient slicing
-            self.handle_search_term(user_id, domain)
+            # "/search foo.com --live" opts into partial results while crawling
+            progressive = None
+            if domain.endswith("--live"):
+                domain = domain[:-len("--live")].strip()
+                progressive = True
+            self.handle_search_term(user_id, domain, progressive=progressive)
         elif text == "search":
             self.lark_api.reply_to_message(message_id, 
                 "❌ Please provide a domain to search.\n\n💡 Example: 'search chatbuypro.com'")
@@ -132,15 +143,10 @@ class CommandHandler:
             self.lark_api.reply_to_message(message_id=message_id, card=card, reply_in_thread=True)
             return
 
-        added, skipped = [], []
-        for domain in candidates:
-            if not self.is_valid_domain(message_id, domain):
-                skipped.append(domain)
-                continue
-            if state_manager.add_domain(chat_id, domain):
-                added.append(domain)
-            else:
-                skipped.append(domain)  # duplicate in storage
+        valid = [d for d in candidates if self.is_valid_domain(message_id, d)]
+        added = state_manager.add_domains(chat_id, valid)  # one write for the whole command
+        # invalid, or duplicate in storage
+        skipped = [d for d in candidates if d not in added]
 
         current_list_md = self._format_domains_md(chat_id)
 
@@ -297,16 +303,7 @@ class CommandHandler:
             if not scheds:
                 status = "ℹ️ No schedules to remove."
             else:
-                removed = 0
-                for s in list(scheds):
-                    if state_manager.remove_schedule(
-                        chat_id,
-                        int(s.get("hour", 0)),
-                        int(s.get("minute", 0)),
-                        int(s.get("tz_offset", 0))
-                    ):
-                        removed += 1
-                        
+                removed = state_manager.remove_schedules(chat_id)
                 result = ",".join([f"{s['hour']:02d}:{s['minute']:02d}" for s in scheds]) 
                 status = f"🗑️ Removed **all {removed}** schedules:{result}"
                 
@@ -356,10 +353,7 @@ class CommandHandler:
             if not domains:
                 parts = ["ℹ️ No domains to remove.", "", "**Current domains:**", "(none)"]
             else:
-                removed = 0
-                for d in list(domains):
-                    if state_manager.remove_domain(chat_id, d):
-                        removed += 1
+                removed = len(state_manager.remove_domains(chat_id))
                 parts = [
                     f"🗑️ Removed **all {removed}** domains.", "",
                     "**Current domains:**",
@@ -401,12 +395,8 @@ class CommandHandler:
                 seen.add(d)
                 candidates.append(d)
 
-        removed, missing = [], []
-        for d in candidates:
-            if state_manager.remove_domain(chat_id, d):
-                removed.append(d)
-            else:
-                missing.append(d)
+        removed = state_manager.remove_domains(chat_id, candidates)
+        missing = [d for d in candidates if d not in removed]
 
         current_list_md = self._format_domains_md(chat_id)
 
@@ -507,7 +497,16 @@ class CommandHandler:
             daemon=True
         ).start()
 
-    def handle_search_term(self, user_id, search_term):
+    def handle_search_term(self, user_id, search_term, progressive=None, on_done=None):
+        """
+        Validate a search term and start its crawl in the background.
+
+        Args:
+            on_done: Optional callback, called as on_done(status, num_results) when the search ends
+
+        Returns:
+            bool: True if the search was started
+        """
         message_info = state_manager.get_message_info(user_id)
         message_id = message_info["message_id"]
         chat_id = state_manager.get_chat_id(user_id)
@@ -544,44 +543,76 @@ class CommandHandler:
         # Start background thread
         threading.Thread(
             target=self.process_search_async,
-            args=(user_id, search_term, reply_message_id),
+            args=(user_id, search_term, reply_message_id, progressive, on_done),
             daemon=True
         ).start()
+        return True
     
-    def process_search_async(self, user_id, search_term, bot_reply_id):
+    def process_search_async(self, user_id, search_term, bot_reply_id, progressive=None, on_done=None):
+        """
+        Crawl, export and deliver one search. With progressive=True (default from
+        PROGRESSIVE_RESULTS) partial results are posted while the crawl runs.
+        on_done(status, num_results) is called at the end with status "done",
+        "no_results", "cancelled" or "failed".
+        """
+        if progressive is None:
+            progressive = PROGRESSIVE_RESULTS
         message_info = state_manager.get_message_info(user_id)
         message_id = message_info["message_id"]
         chat_id = state_manager.get_chat_id(user_id)
         
         if not chat_id:
             print(f"Error: No chat_id for user {user_id}")
+            # A waiting batch must still hear that this item ended
+            if on_done is not None:
+                on_done("failed", 0)
             return
         
+        media = None
+        reporter = None
+        status, num_results = "failed", 0
         try:
             crawler = FacebookAdsCrawler(search_term, chat_id, bot_reply_id)
+            # Download media while the crawl is still running so export mostly reads cached results
+            media = MediaPrefetcher(image_size=(100, 100), max_workers=4)
+            crawler.ad_listeners.append(media.feed_ad)
+            if progressive:
+                reporter = ProgressiveReporter(self.lark_api, message_id, search_term,
+                                               every_n=PROGRESSIVE_EVERY_N,
+                                               send_chunks=PROGRESSIVE_CHUNK_ROWS > 0,
+                                               chunk_rows=PROGRESSIVE_CHUNK_ROWS)
+                reporter.attach(crawler)
             state_manager.register_process(user_id, crawler, chat_id)
             
             # Check cancellation before starting
             if state_manager.should_cancel(user_id):
                 self.lark_api.reply_to_message(message_id, "⛔ Process cancelled before starting!")
+                status = "cancelled"
                 return
                     
-            file_buffer, filename, df = generate_excel_report(crawler)
+            file_buffer, filename, df = generate_excel_report(crawler, media=media)
+            if reporter is not None:
+                # Deliver the last partial batch before the consolidated report
+                reporter.flush()
+                reporter.close(wait=not state_manager.should_cancel(user_id))
             encoded_term = urllib.parse.quote(search_term)
             link = f"https://www.facebook.com/ads/library/?active_status=active&ad_type=all&country=ALL&is_targeted_country=false&media_type=all&q={encoded_term}&search_type=keyword_unordered"
             
             # Handle results if not cancelled
             if not state_manager.should_cancel(user_id):
                 if df.empty:
+                    status = "no_results"
                     card = search_no_result_card(search_word=search_term, href=link)
-                    self.lark_api.update_card_message(bot_reply_id, card=card)
+                    # Same lane as the crawler's progress updates, so the final card lands last
+                    self.outbox.update_card(self.lark_api, bot_reply_id, card=card, chat=chat_id).result()
                 else:
+                    status, num_results = "done", df.shape[0]
                     card = search_complete_card(
                         search_word=search_term,
                         num_results=df.shape[0],
                         href=link
                     )
-                    self.lark_api.update_card_message(message_id=bot_reply_id, card=card)
+                    self.outbox.update_card(self.lark_api, bot_reply_id, card=card, chat=chat_id).result()
                     self.lark_api.send_file(message_id, file_buffer, filename, content_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
                     base = search_term.replace(".", "-").replace(" ", "_") or "results"
@@ -591,51 +622,56 @@ class CommandHandler:
                     if "No" not in crawler.df.columns:
                         crawler.df.insert(0, "No", range(1, len(crawler.df) + 1))
 
-                    # 1) ad_url packs
-                    for zip_name, zip_buf in build_media_zip(
-                        df=crawler.df,
-                        col="ad_url",
-                        zip_basename_prefix=base,
-                        max_workers=2,
-                        max_zip_bytes= 28 * 1024 * 1024,
-                    ):
-                        self.lark_api.send_file(
-                            message_id=message_id,
-                            file_buffer=zip_buf,
-                            filename=zip_name,
-                            content_type="application/zip",
+                    # 1) ad_url packs, uploaded a few at a time while later parts are still packing
+                    self.lark_api.send_files(message_id, (
+                        (zip_name, zip_buf, "application/zip")
+                        for zip_name, zip_buf in build_media_zip(
+                            df=crawler.df,
+                            col="ad_url",
+                            zip_basename_prefix=base,
+                            max_workers=2,
+                            max_zip_bytes=MEDIA_ZIP_PART_BYTES,
+                            pack_workers=2,
+                            media=media,
                         )
+                    ))
 
                     # 2) thumbnail_url packs
-                    for zip_name, zip_buf in build_media_zip(
-                        df=crawler.df,
-                        col="thumbnail_url",
-                        zip_basename_prefix=base,
-                        max_workers=2,
-                        max_zip_bytes= 28 * 1024 * 1024,
-                    ):
-                        self.lark_api.send_file(
-                            message_id=message_id,
-                            file_buffer=zip_buf,
-                            filename=zip_name,
-                            content_type="application/zip",
+                    self.lark_api.send_files(message_id, (
+                        (zip_name, zip_buf, "application/zip")
+                        for zip_name, zip_buf in build_media_zip(
+                            df=crawler.df,
+                            col="thumbnail_url",
+                            zip_basename_prefix=base,
+                            max_workers=2,
+                            max_zip_bytes=MEDIA_ZIP_PART_BYTES,
+                            media=media,
                         )
+                    ))
 
             else:
+                status = "cancelled"
                 self.lark_api.reply_to_message(message_id, "⛔ Process cancelled successfully!")
         except Exception as e:
             if not state_manager.should_cancel(user_id):
                 self.lark_api.reply_to_message(message_id, f"❌ Error processing request: {str(e)}")
             else:
+                status = "cancelled"
                 self.lark_api.reply_to_message(message_id, "⛔ Process cancelled due to error!")
         finally:
             # Cleanup resources
+            if media is not None:
+                media.close()
+            if reporter is not None:
+                reporter.close(wait=False)
             if 'file_buffer' in locals() and file_buffer:
                 try:
                     file_buffer.close()
                 except:
                     pass
             state_manager.clear_state(user_id)
+            if on_done is not None:
+                on_done(status, num_results)
 
     def show_help_menu(self, chat_id):
         self.lark_api.send_interactive_card(chat_id)
@@ -663,15 +699,20 @@ class CommandHandler:
 
     def run_scheduled_crawl(self, chat_id: str, hour: int | None = None, minute: int | None = None, tz_offset: int = 7):
         """
-        Run all domains for this chat sequentially. When called by the scheduler,
+        Run all domains for this chat as one batch. When called by the scheduler,
         we also announce a single header with the schedule time that just fired,
-        then visibly post '/search domain' lines for each domain before running them.
-        """
-        import time as _t
+        then visibly post '/search domain' lines for each domain as it is started.
 
+        The batch hands SCHEDULE_BATCH_PARALLEL domains to the crawl queue at a
+        time and starts the next one as each finishes; a card under the header
+        tracks progress and becomes the summary once every domain is done.
+
+        Returns:
+            CrawlBatch | None: The running batch (call .wait() to block until it ends)
+        """
         domains = state_manager.get_domains(chat_id)
         if not domains:
-            return
+            return None
 
         # 1) Header: "Start searching for schedule at HH:MM GMT±X"
         if hour is not None and minute is not None:
@@ -679,27 +720,65 @@ class CommandHandler:
         else:
             # fall back to your helper (defaults to GMT+7)
             stamp = now_str()
-        self.lark_api.send_text(chat_id, f"🚀 Start searching for schedule at {stamp}")
-
-        # 2) For each domain: post "/search domain" then run it in that thread
-        for domain in sorted(domains):
-            # show the command visibly
-            search_cmd_text = f"/search {domain}"
-            root_id = self.lark_api.send_text(chat_id, search_cmd_text)
-            if not root_id:
-                # if we failed to create the message to anchor the thread, skip cleanly
-                continue
+        header_id = self.lark_api.send_text(chat_id, f"🚀 Start searching for schedule at {stamp}")
+
+        domains = sorted(domains)
+        summary_id = None
+        if header_id:
+            summary_id = self.lark_api.reply_to_message(
+                message_id=header_id,
+                card=schedule_batch_card(schedule_time=stamp, results={}, total=len(domains)),
+                reply_in_thread=True
+            )
 
-            # 2) Create a synthetic user id so state/threads are isolated per domain
-            synthetic_user = f"schedule:{chat_id}:{domain}"
-            # Map state so handlers know which chat/message to reply on
-            state_manager.set_state(synthetic_user, None, chat_id, root_id, root_id)
+        def on_progress(batch):
+            if summary_id:
+                self.outbox.update_card(self.lark_api, summary_id,
+                                        card=schedule_batch_card(schedule_time=stamp, results=dict(batch.results),
+                                                                 total=batch.total),
+                                        chat=chat_id)
+
+        def on_complete(batch):
+            print(f"Scheduled batch {stamp} for {chat_id} finished: {batch.results}")
+
+        # 2) Each domain reuses the same flow as the interactive command
+        return CrawlBatch(
+            domains,
+            start=lambda domain, done: self._start_scheduled_search(chat_id, domain, done),
+            parallel=SCHEDULE_BATCH_PARALLEL,
+            on_progress=on_progress,
+            on_complete=on_complete,
+        ).run()
+
+    def prewarm_scheduled_crawl(self, chat_id: str, fire_at: float | None = None):
+        """
+        Warm up ahead of a scheduled batch so it produces results right at fire time:
+        Lark token and connection, a started Chrome and fresh advertiser lists.
+
+        Args:
+            chat_id: Chat whose domains are about to run
+            fire_at: Timestamp the batch will fire at
+        """
+        domains = state_manager.get_domains(chat_id)
+        if not domains:
+            return
+        self.lark_api.warm_up(valid_until=fire_at)
+        prewarm_crawl(sorted(domains), deadline=fire_at)
+
+    def _start_scheduled_search(self, chat_id, domain, on_done) -> bool:
+        # show the command visibly
+        root_id = self.lark_api.send_text(chat_id, f"/search {domain}")
+        if not root_id:
+            # if we failed to create the message to anchor the thread, skip cleanly
+            return False
 
-            # 3) Reuse the same flow as interactive command
-            #    (this creates the processing card and spawns the worker thread)
-            self.handle_search_term(synthetic_user, domain)
+        # Create a synthetic user id so state/threads are isolated per domain
+        synthetic_user = f"schedule:{chat_id}:{domain}"
+        # Map state so handlers know which chat/message to reply on
+        state_manager.set_state(synthetic_user, None, chat_id, root_id, root_id)
 
-            _t.sleep(60)  # tiny gap for safety
+        # (this creates the processing card and spawns the worker thread)
+        return bool(self.handle_search_term(synthetic_user, domain, on_done=on_done))
 
 
 
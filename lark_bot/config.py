@@ -8,4 +8,77 @@ APP_ID = os.getenv("LARK_APP_ID")
 APP_SECRET = os.getenv("LARK_APP_SECRET")
 VERIFICATION_TOKEN = os.getenv("VERIFICATION_TOKEN")
 DATE_NOW = datetime.now().strftime("%d %b %Y")
+
+# Progressive results: post partial results while a search is still crawling
+PROGRESSIVE_RESULTS = os.getenv("PROGRESSIVE_RESULTS", "0") == "1"
+PROGRESSIVE_EVERY_N = int(os.getenv("PROGRESSIVE_EVERY_N", "25"))
+# Partial results also post CSV files of at least this many new rows (0 = card only)
+PROGRESSIVE_CHUNK_ROWS = int(os.getenv("PROGRESSIVE_CHUNK_ROWS", "0"))
+
+# Lark HTTP client: base URL (point at a local stand-in for testing), connection pool and retries
+LARK_BASE_URL = os.getenv("LARK_BASE_URL", "https://open.larksuite.com/open-apis").rstrip("/")
+LARK_POOL_SIZE = int(os.getenv("LARK_POOL_SIZE", "10"))
+LARK_CONNECT_TIMEOUT = float(os.getenv("LARK_CONNECT_TIMEOUT", "5"))
+LARK_READ_TIMEOUT = float(os.getenv("LARK_READ_TIMEOUT", "30"))
+LARK_MAX_RETRIES = int(os.getenv("LARK_MAX_RETRIES", "3"))
+# Tenant token: renew this many seconds before expiry; optional file to persist it across restarts
+LARK_TOKEN_RENEW_MARGIN = int(os.getenv("LARK_TOKEN_RENEW_MARGIN", "300"))
+LARK_TOKEN_CACHE = os.getenv("LARK_TOKEN_CACHE", "")
+# Outbound dispatcher: calls/sec per API and per chat, and sender threads
+LARK_API_RATE = float(os.getenv("LARK_API_RATE", "20"))
+LARK_CHAT_RATE = float(os.getenv("LARK_CHAT_RATE", "4"))
+LARK_DISPATCH_WORKERS = int(os.getenv("LARK_DISPATCH_WORKERS", "4"))
+# Large files: Drive folder for chunked uploads (empty = IM upload only), link template, parallelism
+LARK_DRIVE_FOLDER = os.getenv("LARK_DRIVE_FOLDER", "")
+LARK_DRIVE_FILE_URL = os.getenv("LARK_DRIVE_FILE_URL", "https://www.larksuite.com/file/{token}")
+LARK_UPLOAD_PARALLEL = int(os.getenv("LARK_UPLOAD_PARALLEL", "3"))
+# Media zip part size; can exceed the 30 MB IM file limit once LARK_DRIVE_FOLDER is set
+MEDIA_ZIP_PART_BYTES = int(os.getenv("MEDIA_ZIP_PART_BYTES", str(28 * 1024 * 1024)))
+# Content hash -> uploaded file_key cache (empty path = in-memory only) and entry lifetime in seconds
+LARK_FILE_KEY_CACHE = os.getenv("LARK_FILE_KEY_CACHE", "logs/file_keys.json")
+LARK_FILE_KEY_TTL = int(os.getenv("LARK_FILE_KEY_TTL", str(7 * 24 * 3600)))
+
+# Webhook handling: worker threads and how many events may wait before replying "busy"
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_MAX_QUEUE = int(os.getenv("WEBHOOK_MAX_QUEUE", "200"))
+# Webhook de-duplication: keys kept, seconds kept (Lark retries for hours), optional snapshot file;
+# with a shared STATE_BACKEND keys are claimed there for EVENT_DEDUPE_TTL instead (MAX and FILE unused)
+EVENT_DEDUPE_MAX = int(os.getenv("EVENT_DEDUPE_MAX", "10000"))
+EVENT_DEDUPE_TTL = int(os.getenv("EVENT_DEDUPE_TTL", str(8 * 3600)))
+EVENT_DEDUPE_FILE = os.getenv("EVENT_DEDUPE_FILE", "")
 # THREAD_ID = os.getenv("THREAD_ID")
+
+# Shared state (user states, cancel flags, crawl queue, schedule debounce):
+# "memory" (single worker), "sqlite:///logs/state.db" (several workers, one host) or "redis://host:6379/0"
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+# Seconds a crawl slot / queued request survives without a heartbeat from its worker
+CRAWL_LEASE_TTL = int(os.getenv("CRAWL_LEASE_TTL", "60"))
+# Assumed duration (seconds) of one crawl until real crawl times have been measured
+CRAWL_ESTIMATE_SECONDS = int(os.getenv("CRAWL_ESTIMATE_SECONDS", "300"))
+# Per-chat domains and schedules (SQLite, WAL); logs/domains.json and logs/schedules.json are
+# imported into it on first start
+CHAT_CONFIG_DB = os.getenv("CHAT_CONFIG_DB", "logs/chat_config.db")
+# Scheduler: leader lease lifetime (failover time) and how late a fire may still run, seconds
+SCHEDULER_LEASE_TTL = int(os.getenv("SCHEDULER_LEASE_TTL", "15"))
+SCHEDULER_GRACE_SECONDS = int(os.getenv("SCHEDULER_GRACE_SECONDS", "300"))
+# Missed runs (e.g. restarts across a scheduled minute) up to this many seconds old are run on
+# startup, one at a time with this spacing, once the crawler is idle; 0 disables catch-up
+SCHEDULER_CATCHUP_WINDOW = int(os.getenv("SCHEDULER_CATCHUP_WINDOW", str(6 * 3600)))
+SCHEDULER_CATCHUP_SPACING = int(os.getenv("SCHEDULER_CATCHUP_SPACING", "60"))
+# Domains of one scheduled batch handed to the crawl queue at a time (the next starts when one finishes)
+SCHEDULE_BATCH_PARALLEL = int(os.getenv("SCHEDULE_BATCH_PARALLEL", "2"))
+# Each chat's fires are shifted by a fixed per-chat offset within this many seconds, so chats
+# sharing a round time do not all hit the crawl queue in the same minute
+SCHEDULER_JITTER_WINDOW = int(os.getenv("SCHEDULER_JITTER_WINDOW", "300"))
+# A batch is held back while the crawl queue's estimated drain time exceeds this many seconds,
+# but never for longer than SCHEDULER_MAX_DEFER seconds
+SCHEDULER_MAX_BACKLOG = int(os.getenv("SCHEDULER_MAX_BACKLOG", "1800"))
+SCHEDULER_MAX_DEFER = int(os.getenv("SCHEDULER_MAX_DEFER", "3600"))
+# Minutes before a scheduled fire to warm up (Lark token and connections, Chrome, advertiser lists);
+# 0 disables. Warm Chrome instances not used within PREWARM_DRIVER_TTL seconds are closed.
+SCHEDULER_PREWARM_MINUTES = int(os.getenv("SCHEDULER_PREWARM_MINUTES", "3"))
+PREWARM_BROWSERS = int(os.getenv("PREWARM_BROWSERS", "1"))
+PREWARM_DRIVER_TTL = int(os.getenv("PREWARM_DRIVER_TTL", "900"))
+# Advertiser lists the pre-fire warm-up scraped less than this many seconds ago are reused
+# (0 always re-scrapes); other lists, e.g. committed ref_data files, are always re-scraped
+ADVERTISER_LIST_TTL = int(os.getenv("ADVERTISER_LIST_TTL", "3600"))
@@ -0,0 +1,160 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from .config import EVENT_DEDUPE_MAX, EVENT_DEDUPE_TTL, EVENT_DEDUPE_FILE
+from .state_backends import MemoryBackend
+
+class EventDeduper:
+    """
+    LRU + TTL set of recently seen webhook keys (event_id, message_id).
+
+    Lark re-delivers an event when the ack is slow; check_and_add() lets the
+    webhook drop those repeats before any work starts. With `path` set a
+    background thread snapshots the set to disk every `save_interval`
+    seconds while it has changed (and once more at exit), so a restart does
+    not re-run commands Lark delivers again afterwards. The per-event path
+    only touches memory.
+    """
+
+    def __init__(self, max_entries: int = EVENT_DEDUPE_MAX, ttl: float = EVENT_DEDUPE_TTL,
+                 path: str = EVENT_DEDUPE_FILE, save_interval: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path or None
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._seen = OrderedDict()    # key -> expires_at (monotonic order of insertion)
+        self._dirty = False
+        self._flusher = None
+        self._load()
+        if self.path:
+            atexit.register(self.flush)
+
+    def check_and_add(self, *keys) -> bool:
+        """
+        Record the given keys; return True if any was already seen (a duplicate).
+
+        None keys are ignored, so callers can pass optional ids directly.
+        """
+        keys = [k for k in keys if k]
+        if not keys:
+            return False
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if any(k in self._seen for k in keys):
+                return True
+            for k in keys:
+                self._seen[k] = now + self.ttl
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            self._dirty = True
+        if self.path:
+            self._start_flusher()
+        return False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._seen)
+
+    def flush(self):
+        """Write the set to disk now if it changed since the last write."""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                snapshot = dict(self._seen)
+                self._dirty = False
+            if not self._save(snapshot):
+                with self._lock:
+                    self._dirty = True
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True,
+                                                 name="webhook-dedupe-flush")
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.save_interval)
+            self.flush()
+
+    def _expire(self, now):
+        # Entries are inserted in time order with a fixed TTL, so expired ones sit at the front
+        while self._seen:
+            key, expires_at = next(iter(self._seen.items()))
+            if expires_at > now:
+                break
+            self._seen.popitem(last=False)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return
+        now = time.time()
+        for key, expires_at in sorted(data.items(), key=lambda kv: kv[1]):
+            if expires_at > now:
+                self._seen[key] = expires_at
+
+    def _save(self, snapshot) -> bool:
+        tmp = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, self.path)
+            return True
+        except OSError as e:
+            print(f"Could not persist webhook dedupe store {self.path}: {e}")
+            return False
+
+class SharedEventDeduper:
+    """
+    Webhook de-duplication across every worker sharing a StateBackend.
+
+    Each key is claimed as a lease that lives `ttl` seconds under a fresh
+    owner id, so only the first delivery, on whichever worker it lands,
+    wins; a re-delivery fails the claim.
+    """
+
+    def __init__(self, backend, ttl: float = EVENT_DEDUPE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._claimed = 0             # keys this process has claimed, for /health
+
+    def check_and_add(self, *keys) -> bool:
+        """Claim the given keys; return True if any was already claimed (a duplicate)."""
+        keys = [k for k in keys if k]
+        if not keys:
+            return False
+        owner = uuid.uuid4().hex
+        for k in keys:
+            if not self.backend.claim(f"event:{k}", owner, self.ttl):
+                return True
+        self._claimed += len(keys)
+        return False
+
+    def __len__(self):
+        return self._claimed
+
+def make_event_deduper(backend):
+    """In-process store for the memory backend; backend claims when workers share state."""
+    if isinstance(backend, MemoryBackend):
+        return EventDeduper()
+    return SharedEventDeduper(backend)
@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from .config import LARK_API_RATE, LARK_CHAT_RATE, LARK_DISPATCH_WORKERS
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token; return how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+class _Job:
+    __slots__ = ("api", "fn", "args", "kwargs", "future", "coalesce_key")
+
+    def __init__(self, api, fn, args, kwargs, coalesce_key=None):
+        self.api = api
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.coalesce_key = coalesce_key
+
+class LarkDispatcher:
+    """
+    Outbound queue for Lark calls made from crawl and queue threads.
+
+    Calls are grouped into one FIFO lane per `chat` key, so messages to a chat
+    keep their order while different chats are served in parallel by a few
+    worker threads. Callers pass the chat id as `chat`; without it a call
+    falls back to a lane of its own message id, which neither orders it
+    against nor rate-limits it with the rest of the chat. Each call first
+    takes a token from its API's bucket and from its lane's bucket. Card updates to the same message coalesce: a newer
+    card replaces one that has not been sent yet, and both callers' futures
+    resolve with the single send. Callers never wait on Lark unless they
+    call .result() on the returned future.
+    """
+
+    MAX_CHAT_BUCKETS = 1024
+
+    def __init__(self, api_rate: float = LARK_API_RATE, chat_rate: float = LARK_CHAT_RATE,
+                 workers: int = LARK_DISPATCH_WORKERS):
+        """
+        Args:
+            api_rate: Calls per second allowed per API (reply, patch, file, ...)
+            chat_rate: Calls per second allowed per chat
+            workers: Threads sending concurrently (to different chats)
+        """
+        self.api_rate = api_rate
+        self.chat_rate = chat_rate
+        self._cond = threading.Condition()
+        self._lanes = {}           # chat -> deque[_Job]
+        self._ready = deque()      # chats with queued jobs and no worker on them
+        self._busy = set()
+        self._api_buckets = {}
+        self._chat_buckets = OrderedDict()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._worker, daemon=True, name=f"lark-dispatch-{i}")
+            for i in range(max(1, workers))
+        ]
+        for t in self._workers:
+            t.start()
+
+    # Public API ---------------------------------------------------------
+
+    def submit(self, api: str, chat: str, fn, *args, **kwargs) -> Future:
+        """
+        Queue fn(*args, **kwargs) on `chat`'s lane, rate-limited under `api`.
+
+        Args:
+            api: Bucket name for the per-API limit (e.g. "reply", "patch", "file")
+            chat: Ordering/rate key, the chat id
+            fn: Callable performing the Lark request
+        """
+        return self._enqueue(chat, _Job(api, fn, args, kwargs))
+
+    def update_card(self, lark_api, message_id: str, card: dict, chat: str = None) -> Future:
+        """Queue a card PATCH; a pending PATCH for the same message is replaced, not resent."""
+        job = _Job("patch", lark_api.update_card_message, (message_id,), {"card": card},
+                   coalesce_key=("patch", message_id))
+        return self._enqueue(chat or message_id, job)
+
+    def reply(self, lark_api, message_id: str, *args, chat: str = None, **kwargs) -> Future:
+        return self.submit("reply", chat or message_id, lark_api.reply_to_message, message_id, *args, **kwargs)
+
+    def send_file(self, lark_api, message_id: str, *args, chat: str = None, **kwargs) -> Future:
+        return self.submit("file", chat or message_id, lark_api.send_file, message_id, *args, **kwargs)
+
+    def close(self, wait: bool = True):
+        """Stop accepting work; with wait=True, drain queued calls first."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._workers:
+                t.join()
+
+    # Internals ----------------------------------------------------------
+
+    def _enqueue(self, chat, job: _Job) -> Future:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("dispatcher is closed")
+            lane = self._lanes.setdefault(chat, deque())
+            if job.coalesce_key is not None:
+                for pending in lane:
+                    if pending.coalesce_key == job.coalesce_key:
+                        # Keep the queue position, send only the latest state
+                        pending.args, pending.kwargs = job.args, job.kwargs
+                        return pending.future
+            lane.append(job)
+            if chat not in self._busy and len(lane) == 1:
+                self._ready.append(chat)
+                self._cond.notify()
+        return job.future
+
+    def _bucket(self, table, key, rate):
+        bucket = table.get(key)
+        if bucket is None:
+            bucket = table[key] = TokenBucket(rate)
+        if isinstance(table, OrderedDict):
+            table.move_to_end(key)
+            while len(table) > self.MAX_CHAT_BUCKETS:
+                table.popitem(last=False)
+        return bucket
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._closed:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                chat = self._ready.popleft()
+                self._busy.add(chat)
+                job = self._lanes[chat].popleft()
+                api_bucket = self._bucket(self._api_buckets, job.api, self.api_rate)
+                chat_bucket = self._bucket(self._chat_buckets, chat, self.chat_rate)
+
+            api_bucket.acquire()
+            chat_bucket.acquire()
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    job.future.set_result(job.fn(*job.args, **job.kwargs))
+                except Exception as e:
+                    logger.warning(f"Lark {job.api} call for {chat} failed: {e}")
+                    job.future.set_exception(e)
+
+            with self._cond:
+                self._busy.discard(chat)
+                if self._lanes[chat]:
+                    self._ready.append(chat)
+                    self._cond.notify()
+                else:
+                    del self._lanes[chat]
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher() -> LarkDispatcher:
+    """Return the process-wide dispatcher (created on first use)."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = LarkDispatcher()
+        return _dispatcher
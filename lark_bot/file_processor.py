@@ -3,30 +3,111 @@ from io import BytesIO
 from openpyxl import Workbook
 from openpyxl.drawing.image import Image as OpenPyxlImage
 from openpyxl.utils import get_column_letter
+from openpyxl.cell import Cell
 from openpyxl.styles import Font, PatternFill, Alignment
 from PIL import Image
 import requests
 import logging
-from typing import Optional, Tuple
+from typing import Iterator, Optional, Tuple
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import threading
+from collections import deque
 from datetime import datetime
 
-from zipfile import ZipFile, ZIP_DEFLATED
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
 import hashlib
+import re
 from urllib.parse import urlparse
 import os
 
+from .thumbnails import make_thumbnail, submit_thumbnail
+
+HYPERLINK_COLUMNS = ("destination_url", "ad_url", "thumbnail_url")
+WRAP_COLUMN_WIDTHS = {"primary_text": 25, "headline_text": 50}
+
+def _nonblank_mask(series: pd.Series) -> list:
+    """Per-row flags: value is present and not just whitespace."""
+    present = series.notna()
+    return (present & series.where(present, "").astype(str).str.strip().ne("")).tolist()
+
+# Formats openpyxl can register in the workbook manifest
+_EMBEDDABLE_FORMATS = ("PNG", "JPEG")
+
+def image_dhash(img_bytes: bytes, hash_size: int = 8) -> Optional[int]:
+    """
+    64-bit difference hash of an image; near-identical creatives differ in only a few bits.
+    """
+    try:
+        with Image.open(BytesIO(img_bytes)) as img:
+            small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+            px = list(small.getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (px[offset + col] > px[offset + col + 1])
+    return bits
+
+_MEDIA_TARGET_RE = re.compile(r'Target="(/?xl/media/[^"]+)"')
+
+def dedupe_xlsx_media(xlsx: BytesIO) -> BytesIO:
+    """
+    Collapse byte-identical xl/media parts of a saved workbook into one part
+    and repoint every drawing relationship at the surviving copy.
+    """
+    xlsx.seek(0)
+    with ZipFile(xlsx) as src:
+        infos = src.infolist()
+        canonical = {}  # sha1 -> kept part name
+        alias = {}      # duplicate part name -> kept part name
+        for info in infos:
+            if info.filename.startswith("xl/media/"):
+                digest = hashlib.sha1(src.read(info)).digest()
+                if digest in canonical:
+                    alias[info.filename] = canonical[digest]
+                else:
+                    canonical[digest] = info.filename
+        if not alias:
+            xlsx.seek(0)
+            return xlsx
+
+        def _repoint(match):
+            target = match.group(1)
+            kept = alias.get(target.lstrip("/"))
+            if kept is None:
+                return match.group(0)
+            return f'Target="{"/" if target.startswith("/") else ""}{kept}"'
+
+        out = BytesIO()
+        with ZipFile(out, "w", compression=ZIP_DEFLATED) as dst:
+            for info in infos:
+                if info.filename in alias:
+                    continue
+                data = src.read(info)
+                if info.filename.startswith("xl/drawings/_rels/"):
+                    data = _MEDIA_TARGET_RE.sub(_repoint, data.decode("utf-8")).encode("utf-8")
+                dst.writestr(info, data)
+    out.seek(0)
+    return out
+
 class ExcelImageExporter:
     """Optimized Excel exporter with parallel image processing."""
-    """Optimized Excel exporter with parallel image processing."""
 
     def __init__(self, 
                     image_size: Tuple[int, int] = (80, 80),
                     row_height: int = 80,
                     image_col_width: int = 18,
                     timeout: int = 10,
-                    max_workers: int = 2):
+                    max_workers: int = 2,
+                    process_workers: Optional[int] = None,
+                    thumbnail_format: str = "PNG",
+                    thumbnail_quality: int = 85,
+                    image_dedupe: str = "exact",
+                    phash_distance: int = 4,
+                    media: Optional["MediaPrefetcher"] = None):
         """
         Initialize the Excel exporter.
         
@@ -36,36 +117,141 @@ class ExcelImageExporter:
             image_col_width: Width of the image column
             timeout: Request timeout in seconds
             max_workers: Max threads for parallel image downloads
+            process_workers: 0 resizes inline in the download threads; otherwise the shared process pool is used
+            thumbnail_format: Thumbnail format - "PNG" or "JPEG" ("WEBP" only outside .xlsx)
+            thumbnail_quality: Encoder quality for JPEG/WEBP thumbnails
+            image_dedupe: "off", "exact" (identical bytes share one media part) or
+                "perceptual" (also merge creatives within phash_distance bits)
+            phash_distance: Max Hamming distance between dHashes for "perceptual" mode
+            media: Prefetcher filled during the crawl; its downloads/thumbnails are reused
         """
         self.image_size = image_size
         self.row_height = row_height
         self.image_col_width = image_col_width
         self.timeout = timeout
         self.max_workers = max_workers
+        self.process_workers = 1 if process_workers is None else process_workers
+        self.thumbnail_format = thumbnail_format.upper()
+        self.thumbnail_quality = thumbnail_quality
+        self.image_dedupe = image_dedupe
+        self.phash_distance = phash_distance
+        self.media = media
         self.logger = logging.getLogger(__name__)
 
-    def _download_and_process_image(self, url: str) -> Optional[bytes]:
-        """
-        Download and process an image from URL.
-        """
+    def _download_image(self, url: str) -> Optional[bytes]:
+        """Download raw image bytes (I/O only)."""
+        if self.media is not None and self.media.has(url):
+            return self.media.fetch(url)
         try:
             headers = {'User-Agent': 'Mozilla/5.0'}
             response = requests.get(url, headers=headers, timeout=self.timeout)
             response.raise_for_status()
-            
-            with Image.open(BytesIO(response.content)) as img:
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                img.thumbnail(self.image_size, Image.Resampling.LANCZOS)
-                
-                with BytesIO() as buffer:
-                    img.save(buffer, format="PNG", optimize=True)
-                    return buffer.getvalue()
-                    
+            return response.content
         except Exception as e:
-            self.logger.warning(f"Image processing failed for {url}: {str(e)}")
+            self.logger.warning(f"Image download failed for {url}: {str(e)}")
+            return None
+
+    def _download_and_process_image(self, url: str) -> Optional[bytes]:
+        """
+        Download and process an image from URL.
+        """
+        raw = self._download_image(url)
+        if raw is None:
             return None
+        thumb = make_thumbnail(raw, self.image_size, self.thumbnail_format, self.thumbnail_quality)
+        if thumb is None:
+            self.logger.warning(f"Image processing failed for {url}")
+        return thumb
+
+    def _fetch_images(self, download_tasks: dict) -> dict:
+        """
+        Download and thumbnail every {row_idx: url} task.
+
+        Downloads run on a thread pool; each finished download is handed to a
+        process pool for decode/resize/encode so the GIL does not serialize it.
+        """
+        image_data = {}
+        spec = (tuple(self.image_size), self.thumbnail_format, self.thumbnail_quality)
+        if self.media is not None and self.media.thumbnail_spec == spec:
+            # Thumbnails resized while the crawl was still running
+            remaining = {}
+            for row_idx, url in download_tasks.items():
+                prefetched = self.media.thumbnail(url)
+                if prefetched is None:
+                    remaining[row_idx] = url
+                    continue
+                try:
+                    image_data[row_idx] = prefetched.result()
+                except Exception:
+                    image_data[row_idx] = None
+            download_tasks = remaining
+
+        if not download_tasks:
+            return image_data
+
+        if self.process_workers <= 0:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                future_to_row = {
+                    executor.submit(self._download_and_process_image, url): row_idx
+                    for row_idx, url in download_tasks.items()
+                }
+                for future in as_completed(future_to_row):
+                    image_data[future_to_row[future]] = future.result()
+            return image_data
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as io_pool:
+            download_to_row = {
+                io_pool.submit(self._download_image, url): row_idx
+                for row_idx, url in download_tasks.items()
+            }
+            resize_to_row = {}
+            for future in as_completed(download_to_row):
+                row_idx = download_to_row[future]
+                raw = future.result()
+                if raw is None:
+                    image_data[row_idx] = None
+                    continue
+                try:
+                    resize = submit_thumbnail(raw, self.image_size, self.thumbnail_format, self.thumbnail_quality)
+                except Exception as e:
+                    image_data[row_idx] = None
+                    self.logger.warning(f"Image processing failed for {download_tasks[row_idx]}: {e}")
+                    continue
+                resize_to_row[resize] = row_idx
+
+            for future in as_completed(resize_to_row):
+                row_idx = resize_to_row[future]
+                try:
+                    image_data[row_idx] = future.result()
+                except Exception as e:
+                    image_data[row_idx] = None
+                    self.logger.warning(f"Image processing failed for {download_tasks[row_idx]}: {e}")
+                    continue
+                if image_data[row_idx] is None:
+                    self.logger.warning(f"Image processing failed for {download_tasks[row_idx]}")
+        return image_data
+
+    def _merge_similar_images(self, image_data: dict) -> dict:
+        """
+        Point near-identical thumbnails at one representative's bytes so the
+        exact-dedupe pass stores them once.
+        """
+        representatives = []  # (dhash, bytes)
+        merged = {}
+        for row_idx in sorted(image_data):
+            img_bytes = image_data[row_idx]
+            h = image_dhash(img_bytes) if img_bytes else None
+            if h is None:
+                merged[row_idx] = img_bytes
+                continue
+            for rep_hash, rep_bytes in representatives:
+                if bin(h ^ rep_hash).count("1") <= self.phash_distance:
+                    merged[row_idx] = rep_bytes
+                    break
+            else:
+                representatives.append((h, img_bytes))
+                merged[row_idx] = img_bytes
+        return merged
 
     def _setup_header_styling(self, ws, num_cols: int):
         """Apply styling to header row."""
@@ -81,23 +267,10 @@ class ExcelImageExporter:
             cell.font = header_font
             cell.alignment = header_alignment
 
-    def _auto_adjust_column_widths(self, ws, df: pd.DataFrame):
-        """Auto-adjust column widths based on content."""
-        # --- MODIFIED ---
-        # This function now uses the final column order for adjusting width.
-        # We also need to skip the 'Image' column which has a fixed width.
-        for col_idx, column in enumerate(df.columns, 1):
-            if column == 'Image':
-                continue
-            
-            # Check if the column exists in the DataFrame before trying to access it
-            if column in df:
-                max_length = max(
-                    len(str(column)),
-                    df[column].astype(str).str.len().max()
-                )
-                adjusted_width = min(max_length + 2, 50)
-                ws.column_dimensions[get_column_letter(col_idx)].width = adjusted_width
+    def _apply_column_widths(self, ws, widths: dict):
+        """Set column widths from {1-based column index: content length}."""
+        for col_idx, max_length in widths.items():
+            ws.column_dimensions[get_column_letter(col_idx)].width = min(max_length + 2, 50)
 
     def export_to_excel(self, 
                         df: pd.DataFrame, 
@@ -107,6 +280,8 @@ class ExcelImageExporter:
         """
         if image_column not in df.columns:
             raise ValueError(f"Image column '{image_column}' not found in DataFrame")
+        if self.thumbnail_format not in _EMBEDDABLE_FORMATS:
+            raise ValueError(f"Thumbnail format '{self.thumbnail_format}' cannot be embedded in .xlsx; use PNG or JPEG")
         
         df = df.reset_index(drop=True).copy()
         if "No" not in df.columns:
@@ -134,49 +309,69 @@ class ExcelImageExporter:
         ws = wb.active
         ws.title = "Data with Images"
         
-        # --- MODIFIED ---
         # Write headers based on our new `final_excel_columns` list.
-        for col_idx, col_name in enumerate(final_excel_columns, 1):
-            ws.cell(row=1, column=col_idx, value=col_name)
-        
-        # --- REMOVE ---
-        # We no longer need this part because the 'Image' header is already in our list.
-        # image_col_idx = len(df.columns) + 1
-        # ws.cell(row=1, column=image_col_idx, value="Image")
+        ws.append(final_excel_columns)
         
         # Apply header styling based on the final number of columns
         self._setup_header_styling(ws, len(final_excel_columns))
         
-        # Phase 1: Write data and collect image URLs
+        # Precompute per-column arrays, hyperlink masks and layout roles so the
+        # row loop below touches every row exactly once.
+        columns = [
+            df[c].tolist() if c in df.columns and c != 'Image' else None
+            for c in final_excel_columns
+        ]
+        link_masks = {
+            j: _nonblank_mask(df[c])
+            for j, c in enumerate(final_excel_columns)
+            if c in HYPERLINK_COLUMNS and c in df.columns
+        }
+        wrap_cols = {j for j, c in enumerate(final_excel_columns) if c in WRAP_COLUMN_WIDTHS}
+        auto_cols = [
+            j for j, c in enumerate(final_excel_columns)
+            if columns[j] is not None and j not in link_masks and j not in wrap_cols
+        ]
+        widths = {j: len(str(final_excel_columns[j])) for j in auto_cols}
+        image_mask = _nonblank_mask(df[image_column])
+        image_urls = df[image_column].tolist()
+
+        link_font = Font(color="0563C1", underline="single")
+        wrap_alignment = Alignment(wrap_text=True, vertical="top")
+
+        # Phase 1: Write data, hyperlinks and wrap styles in one pass; collect image URLs
         download_tasks = {}
-        for row_idx, (_, row) in enumerate(df.iterrows(), start=2):
-            # --- MODIFIED ---
-            # Write data cell by cell from the original 'row' object,
-            # but into the correct column positions defined by 'final_excel_columns'.
-            for col_idx, col_name in enumerate(final_excel_columns, 1):
-                if col_name != 'Image' and col_name in row:
-                    ws.cell(row=row_idx, column=col_idx, value=row[col_name])
-            
-            if pd.notna(row[image_column]) and str(row[image_column]).strip():
-                download_tasks[row_idx] = str(row[image_column])
-
-        # Phase 2: Parallel image downloads (This part is unchanged)
-        image_data = {}
-        if download_tasks:
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                future_to_row = {
-                    executor.submit(self._download_and_process_image, url): row_idx
-                    for row_idx, url in download_tasks.items()
-                }
-                
-                for future in as_completed(future_to_row):
-                    row_idx = future_to_row[future]
-                    image_data[row_idx] = future.result()
+        for i in range(len(df)):
+            row_idx = i + 2
+            out = [values[i] if values is not None else None for values in columns]
+            for j in auto_cols:
+                length = len(str(out[j]))
+                if length > widths[j]:
+                    widths[j] = length
+            for j, mask in link_masks.items():
+                if mask[i]:
+                    cell = Cell(ws, row=row_idx, column=j + 1, value="Click here")
+                    cell.hyperlink = str(out[j])
+                    cell.font = link_font
+                    out[j] = cell
+            for j in wrap_cols:
+                cell = Cell(ws, row=row_idx, column=j + 1, value=out[j])
+                cell.alignment = wrap_alignment
+                out[j] = cell
+            ws.append(out)
+
+            if image_mask[i]:
+                download_tasks[row_idx] = str(image_urls[i])
+
+        # Phase 2: Parallel image downloads, resize/encode in worker processes
+        image_data = self._fetch_images(download_tasks)
 
         # --- ADD ---
         # Get the new 1-based index for the 'Image' column for placing images.
         image_col_idx = final_excel_columns.index('Image') + 1
 
+        if self.image_dedupe == "perceptual":
+            image_data = self._merge_similar_images(image_data)
+
         # Phase 3: Insert images into worksheet
         successful_images = 0
         failed_images = 0
@@ -201,44 +396,12 @@ class ExcelImageExporter:
             else:
                 failed_images += 1
         
-        # --- MODIFIED ---
-        # The logic for wrapping text columns now uses the correct indices from the final layout.
-        for col_name in ("primary_text", "headline_text"):
-            if col_name in final_excel_columns:
-                col_idx = final_excel_columns.index(col_name) + 1
-
-                if col_name == "primary_text":
-                    ws.column_dimensions[get_column_letter(col_idx)].width = 25
-                elif col_name == "headline_text":
-                    ws.column_dimensions[get_column_letter(col_idx)].width = 50
-
-                for row_idx in range(2, ws.max_row + 1):
-                    cell = ws.cell(row=row_idx, column=col_idx)
-                    cell.alignment = Alignment(wrap_text=True, vertical="top")
-
-        # --- MODIFIED & IMPROVED ---
-        # First, auto-adjust widths for all columns EXCEPT the ones we want to size manually.
-        # Create a temporary DataFrame without the manually sized columns.
-        cols_to_auto_adjust = [c for c in df.columns if c not in ('primary_text', 'headline_text')]
-        df_for_auto_adjust = df[cols_to_auto_adjust]
-        self._auto_adjust_column_widths(ws, df_for_auto_adjust)
-        
-        # Process hyperlinks (This logic remains largely the same but uses the final column indices)
-        hyperlink_columns = ["destination_url", "ad_url", "thumbnail_url"]
-        for col_name in hyperlink_columns:
-            if col_name in final_excel_columns:
-                # --- MODIFIED ---
-                # Get index from the final list
-                col_idx = final_excel_columns.index(col_name) + 1
-                for row_idx, (_, row) in enumerate(df.iterrows(), start=2):
-                    url = row.get(col_name) # Use .get() for safety
-                    if pd.notna(url) and str(url).strip():
-                        cell = ws.cell(row=row_idx, column=col_idx)
-                        cell.value = "Click here"
-                        cell.hyperlink = str(url)
-                        cell.font = Font(color="0563C1", underline="single")
-                
-                ws.column_dimensions[get_column_letter(col_idx)].width = 15
+        # Fixed widths for wrapped text and hyperlink columns, content-based for the rest
+        self._apply_column_widths(ws, {j + 1: w for j, w in widths.items()})
+        for j in wrap_cols:
+            ws.column_dimensions[get_column_letter(j + 1)].width = WRAP_COLUMN_WIDTHS[final_excel_columns[j]]
+        for j in link_masks:
+            ws.column_dimensions[get_column_letter(j + 1)].width = 15
 
         # Set image column width
         image_col_letter = get_column_letter(image_col_idx)
@@ -248,6 +411,8 @@ class ExcelImageExporter:
         
         output = BytesIO()
         wb.save(output)
+        if self.image_dedupe != "off" and successful_images > 1:
+            output = dedupe_xlsx_media(output)
         output.seek(0)
         return output
 
@@ -275,15 +440,351 @@ def _download_bytes(url: str, timeout: int = 20) -> bytes | None:
     except Exception:
         return None
 
+class MediaPrefetcher:
+    """
+    Background media stage shared by the crawl, Excel and zip steps of one search.
+
+    The crawler feeds each ad record in as soon as it is scraped. Downloads run
+    on a bounded thread pool and thumbnails are resized in a process pool as
+    soon as their bytes arrive, so by the time the crawl finishes the export
+    steps mostly read finished results instead of downloading everything again.
+    """
+
+    def __init__(self,
+                 image_size: Tuple[int, int] = (100, 100),
+                 thumbnail_format: str = "PNG",
+                 thumbnail_quality: int = 85,
+                 max_workers: int = 4,
+                 process_workers: Optional[int] = None,
+                 max_pending: int = 128,
+                 timeout: int = 20):
+        """
+        Args:
+            image_size: Thumbnail bounding box, must match the exporter's
+            thumbnail_format: Thumbnail format, must match the exporter's
+            thumbnail_quality: Thumbnail quality, must match the exporter's
+            max_workers: Download threads
+            process_workers: 0 resizes inline; otherwise the shared process pool is used
+            max_pending: Max downloads in flight before prefetch() blocks the producer
+            timeout: Per-download timeout in seconds
+        """
+        self.thumbnail_spec = (tuple(image_size), thumbnail_format.upper(), thumbnail_quality)
+        self.timeout = timeout
+        self.process_workers = 1 if process_workers is None else process_workers
+        self._io_pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._downloads: dict[str, Future] = {}
+        self._thumbnails: dict[str, Future] = {}
+        self._closed = False
+        self.logger = logging.getLogger(__name__)
+
+    def feed_ad(self, ad: dict):
+        """Crawler listener: queue the media of one freshly scraped ad record."""
+        # Same rule as FacebookAdsCrawler.data_to_dataframe: keep ads with exactly one of image/video
+        image_url, video_url = ad.get("image_url"), ad.get("video_url")
+        if (image_url is None) == (video_url is None):
+            return
+        self.prefetch(image_url if image_url is not None else video_url)
+        self.prefetch(ad.get("thumbnail_url"), thumbnail=True)
+
+    def prefetch(self, url, thumbnail: bool = False):
+        """Start downloading url (once); with thumbnail=True also resize it when it lands."""
+        url = str(url).strip() if url else ""
+        if not url:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            download = self._downloads.get(url)
+        if download is None:
+            # Backpressure: the producer waits while max_pending downloads are in flight
+            self._slots.acquire()
+            with self._lock:
+                download = self._downloads.get(url)
+                if download is None and not self._closed:
+                    download = self._io_pool.submit(_download_bytes, url, self.timeout)
+                    self._downloads[url] = download
+                    download.add_done_callback(lambda _: self._slots.release())
+                else:
+                    self._slots.release()
+            if download is None:
+                return
+        if thumbnail:
+            with self._lock:
+                if self._closed or url in self._thumbnails:
+                    return
+                self._thumbnails[url] = out = Future()
+            download.add_done_callback(lambda f: self._start_thumbnail(f, out))
+
+    def _start_thumbnail(self, download: Future, out: Future):
+        try:
+            raw = None if download.cancelled() else download.result()
+            if raw is None:
+                out.set_result(None)
+            elif self.process_workers <= 0:
+                out.set_result(make_thumbnail(raw, *self.thumbnail_spec))
+            else:
+                resize = submit_thumbnail(raw, *self.thumbnail_spec)
+                resize.add_done_callback(lambda f: out.set_result(f.result()))
+        except Exception as e:
+            self.logger.warning(f"Thumbnail prefetch failed: {e}")
+            if not out.done():
+                out.set_result(None)
+
+    def has(self, url: str) -> bool:
+        with self._lock:
+            return url in self._downloads
+
+    def fetch(self, url: str) -> Optional[bytes]:
+        """Bytes for url: the prefetched result (waiting if in flight), else a direct download."""
+        with self._lock:
+            download = self._downloads.get(url)
+        if download is None:
+            return _download_bytes(url, self.timeout)
+        try:
+            return download.result()
+        except Exception:
+            return None
+
+    def thumbnail(self, url: str) -> Optional[Future]:
+        """Future of the prefetched thumbnail for url, or None if it was never queued."""
+        with self._lock:
+            return self._thumbnails.get(url)
+
+    def close(self):
+        """Drop pending downloads and release the download threads; the shared process pool stays up."""
+        with self._lock:
+            self._closed = True
+        self._io_pool.shutdown(wait=False, cancel_futures=True)
+
+def _probe_size(url: str, timeout: int = 10) -> int | None:
+    """Learn an object's size from a HEAD request's Content-Length, without fetching it."""
+    try:
+        r = requests.head(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=timeout, allow_redirects=True)
+        r.raise_for_status()
+        length = int(r.headers.get("Content-Length", ""))
+        return length if length > 0 else None
+    except Exception:
+        return None
+
+# Per-entry allowance for zip headers and the manifest line
+_ZIP_ENTRY_OVERHEAD = 2048
+
+def plan_media_parts(sizes: dict, max_zip_bytes: int) -> tuple[list[list], list]:
+    """
+    Assign objects to zip parts with first-fit-decreasing bin packing.
+
+    Args:
+        sizes: {key: size in bytes} for every object to pack
+        max_zip_bytes: Size budget per part
+
+    Returns:
+        (bins, oversize): bins is a list of key lists, one per part;
+        oversize lists keys that cannot fit in any part on their own
+    """
+    bins: list[list] = []
+    free: list[int] = []
+    oversize = []
+    for key, size in sorted(sizes.items(), key=lambda kv: kv[1], reverse=True):
+        need = size + _ZIP_ENTRY_OVERHEAD
+        if need > max_zip_bytes:
+            oversize.append(key)
+            continue
+        for i, room in enumerate(free):
+            if room >= need:
+                bins[i].append(key)
+                free[i] -= need
+                break
+        else:
+            bins.append([key])
+            free.append(max_zip_bytes - need)
+    return bins, oversize
+
+# Payloads that are already compressed; deflating them burns CPU for ~0% gain.
+_STORED_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif",
+    ".mp4", ".m4v", ".mov", ".webm", ".mkv", ".mp3", ".m4a", ".aac",
+    ".zip", ".gz", ".7z", ".xlsx",
+}
+
+def _compress_type_for(fname: str, policy: str = "auto") -> int:
+    """
+    Pick the zip compression method for one entry.
+
+    - "auto": store known media/archive formats, deflate everything else
+    - "deflate": deflate every entry (legacy behaviour)
+    - "store": store every entry
+    """
+    if policy == "store":
+        return ZIP_STORED
+    if policy == "deflate":
+        return ZIP_DEFLATED
+    _, ext = os.path.splitext(fname.lower())
+    return ZIP_STORED if ext in _STORED_EXTENSIONS else ZIP_DEFLATED
+
+# Fixed entry timestamp: identical media must give byte-identical zips so FileKeyCache can reuse uploads
+_ZIP_ENTRY_DATE = (1980, 1, 1, 0, 0, 0)
+
+def _write_entry(zf: ZipFile, fname: str, data: bytes, policy: str):
+    info = ZipInfo(fname, date_time=_ZIP_ENTRY_DATE)
+    info.compress_type = _compress_type_for(fname, policy)
+    info.external_attr = 0o644 << 16
+    zf.writestr(info, data)
+
+def _pack_zip_part(
+    entries: list[tuple[str, int | None, str, bytes]],
+    col: str,
+    compression: str,
+    oversize: list[tuple[int | None, str, int]] | None = None,
+) -> BytesIO:
+    """Write one zip part (media entries + manifest.csv, optionally oversize.csv) into memory."""
+    buf = BytesIO()
+    with ZipFile(buf, "w") as zf:
+        for fname, _, _, data in entries:
+            _write_entry(zf, fname, data, compression)
+        manifest = "No,column,url\n" + "\n".join(f"{no},{col},{u}" for _, no, u, _ in entries)
+        _write_entry(zf, "manifest.csv", manifest.encode("utf-8"), compression)
+        if oversize:
+            listing = "No,column,url,bytes\n" + "\n".join(f"{no},{col},{u},{size}" for no, u, size in oversize)
+            _write_entry(zf, "oversize.csv", listing.encode("utf-8"), compression)
+    buf.seek(0)
+    return buf
+
+def _split_oversize(blobs, max_zip_bytes: int):
+    """Drop failed downloads and separate objects too large for any part."""
+    fits, oversize = [], []
+    for no_val, u, data in blobs:
+        if not data:
+            continue
+        if len(data) + _ZIP_ENTRY_OVERHEAD > max_zip_bytes:
+            oversize.append((no_val, u, len(data)))
+        else:
+            fits.append((no_val, u, data))
+    return fits, oversize
+
+def _group_greedy(blobs, max_zip_bytes: int) -> list[list]:
+    """Fill parts in the given order, starting a new part when the budget is reached."""
+    groups, current, written_bytes = [], [], 0
+    for blob in blobs:
+        estimated_added = len(blob[2]) + _ZIP_ENTRY_OVERHEAD
+        if written_bytes + estimated_added > max_zip_bytes and written_bytes > 0:
+            groups.append(current)
+            current, written_bytes = [], 0
+        current.append(blob)
+        written_bytes += estimated_added
+    if current:
+        groups.append(current)
+    return groups
+
+def _pack_groups(
+    groups: list[list[tuple[int | None, str, bytes]]],
+    col: str,
+    zip_basename_prefix: str,
+    compression: str,
+    pack_workers: int,
+    oversize: list[tuple[int | None, str, int]],
+) -> Iterator[tuple[str, BytesIO]]:
+    """
+    Turn planned blob groups into named zip parts, yielded in order as they are packed;
+    oversize objects are listed in part 1.
+
+    At most `pack_workers` parts are packed ahead of the consumer, and each
+    group's blobs are released once its part is built, so memory holds the
+    unpacked remainder plus a few parts instead of every part.
+    """
+    if oversize:
+        for no_val, u, size in oversize:
+            logging.warning(f"Not zipping {u}: {size} bytes exceeds the part limit, listed in oversize.csv")
+        if not groups:
+            groups = [[]]
+    groups = deque(groups)
+
+    def _pack(idx, group):
+        entries = []
+        for no_val, u, data in group:
+            # build filename
+            base_fname = _filename_from_url(u, prefix=col)
+            fname = f"{no_val}_{base_fname}" if no_val is not None else base_fname
+            entries.append((fname, no_val, u, data))
+        return _pack_zip_part(entries, col, compression, oversize if idx == 0 else None)
+
+    def _name(idx):
+        return f"{zip_basename_prefix}_{col}_media_part{idx + 1}.zip"
+
+    if pack_workers > 1 and len(groups) > 1:
+        with ThreadPoolExecutor(max_workers=pack_workers) as ex:
+            window = deque()
+            idx = 0
+            while groups or window:
+                while groups and len(window) < pack_workers:
+                    window.append((idx, ex.submit(_pack, idx, groups.popleft())))
+                    idx += 1
+                done_idx, fut = window.popleft()
+                yield _name(done_idx), fut.result()
+    else:
+        idx = 0
+        while groups:
+            yield _name(idx), _pack(idx, groups.popleft())
+            idx += 1
+
+def _blob_order(blob):
+    no_val = blob[0]
+    return (no_val is None, no_val if no_val is not None else 0, blob[1])
+
+def pack_media_parts(
+    blobs: list[tuple[int | None, str, bytes | None]],
+    col: str,
+    zip_basename_prefix: str,
+    max_zip_bytes: int = 28 * 1024 * 1024,
+    compression: str = "auto",
+    pack_workers: int = 1,
+    plan: str = "ffd",
+) -> list[tuple[str, BytesIO]]:
+    """
+    Split downloaded (No, url, bytes) blobs into zip parts under max_zip_bytes.
+
+    Args:
+        blobs: Downloaded payloads; entries with no data are skipped
+        col: Source column name, used for entry and part names
+        zip_basename_prefix: Prefix for the part filenames
+        max_zip_bytes: Size budget per part
+        compression: "auto", "deflate" or "store" (see _compress_type_for)
+        pack_workers: Threads used to pack parts concurrently (zlib releases the GIL)
+        plan: "ffd" (first-fit-decreasing, fewest parts) or "greedy" (input order)
+
+    Returns:
+        List of (filename, BytesIO) parts, in order. Objects larger than
+        max_zip_bytes are never zipped; they are listed in part 1's oversize.csv.
+    """
+    fits, oversize = _split_oversize(blobs, max_zip_bytes)
+    if plan == "greedy":
+        groups = _group_greedy(fits, max_zip_bytes)
+    else:
+        by_url = {u: (no_val, u, data) for no_val, u, data in fits}
+        bins, _ = plan_media_parts({u: len(b[2]) for u, b in by_url.items()}, max_zip_bytes)
+        groups = [sorted((by_url[u] for u in b), key=_blob_order) for b in bins]
+    if not groups and not oversize:
+        groups = [[]]
+    return list(_pack_groups(groups, col, zip_basename_prefix, compression, pack_workers, oversize))
+
 def build_media_zip(
      df: pd.DataFrame,
     col: str,
     zip_basename_prefix: str,
     max_workers: int = 2,
     max_zip_bytes: int = 28 * 1024 * 1024,  # ~28MB safe under 30MB
-) -> list[tuple[str, BytesIO]]:
+    compression: str = "auto",
+    pack_workers: int = 1,
+    media: Optional[MediaPrefetcher] = None,
+) -> Iterator[tuple[str, BytesIO]]:
+    """
+    Download the media in `col` and yield (filename, BytesIO) zip parts under
+    max_zip_bytes as each one is packed, so the caller can upload a part
+    while later ones are still being built.
+    """
     if col not in df.columns:
-        return []
+        return
 
     # Collect (No, url) pairs
     rows = []
@@ -299,68 +800,48 @@ def build_media_zip(
             rows.append((no_val, val))
 
     # Deduplicate by URL string
-    seen = set()
-    unique_rows = []
+    no_by_url = {}
     for no_val, u in rows:
-        if u not in seen:
-            seen.add(u)
-            unique_rows.append((no_val, u))
-
-    # Parallel download
-    blobs: list[tuple[int | None, str, bytes | None]] = []
-    if unique_rows:
-        with ThreadPoolExecutor(max_workers=max_workers) as ex:
-            futs = {ex.submit(_download_bytes, u): (no_val, u) for no_val, u in unique_rows}
-            for fut in as_completed(futs):
-                no_val, u = futs[fut]
-                data = fut.result()
-                blobs.append((no_val, u, data))
-
-    parts: list[tuple[str, BytesIO]] = []
-    if not blobs:
-        return parts
-
-    part_idx = 1
-    current = BytesIO()
-    zf = ZipFile(current, "w", compression=ZIP_DEFLATED)
-    written_bytes = 0
-    manifest_rows = []
-
-    def _close_and_push():
-        nonlocal current, zf, manifest_rows, written_bytes, part_idx, parts
-        zf.writestr("manifest.csv", "No,column,url\n".encode("utf-8") +
-                    "\n".join([f"{no},{col},{u}" for no, u in manifest_rows]).encode("utf-8"))
-        zf.close()
-        current.seek(0)
-        fname = f"{zip_basename_prefix}_{col}_media_part{part_idx}.zip"
-        parts.append((fname, current))
-        part_idx += 1
-        current = BytesIO()
-        zf = ZipFile(current, "w", compression=ZIP_DEFLATED)
-        manifest_rows = []
-        written_bytes = 0
-
-    for no_val, u, data in blobs:
-        if not data:
-            continue
-        # build filename
-        base_fname = _filename_from_url(u, prefix=col)
-        if no_val is not None:
-            fname = f"{no_val}_{base_fname}"
-        else:
-            fname = base_fname
-
-        estimated_added = len(data) + 2048
-        if written_bytes + estimated_added > max_zip_bytes and written_bytes > 0:
-            _close_and_push()
-        zf.writestr(fname, data)
-        manifest_rows.append((no_val, u))
-        written_bytes += estimated_added
+        no_by_url.setdefault(u, no_val)
+    if not no_by_url:
+        return
+    urls = list(no_by_url)
+
+    # Objects already prefetched during the crawl are sized from their bytes
+    fetch = media.fetch if media is not None else _download_bytes
+    data_by_url = {u: fetch(u) for u in urls if media is not None and media.has(u)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        # 1) Learn sizes up front; objects without a Content-Length are fetched now instead
+        probe = [u for u in urls if u not in data_by_url]
+        sizes = dict(zip(probe, ex.map(_probe_size, probe)))
+        sizes.update((u, len(data) if data else None) for u, data in data_by_url.items())
+        unknown = [u for u in probe if sizes[u] is None]
+        data_by_url.update(zip(unknown, ex.map(fetch, unknown)))
+        for u in unknown:
+            sizes[u] = len(data_by_url[u]) if data_by_url[u] else None
+
+        # 2) Plan the minimal set of parts, then fetch what the plan needs
+        bins, oversize_urls = plan_media_parts(
+            {u: size for u, size in sizes.items() if size is not None}, max_zip_bytes
+        )
+        pending = [u for b in bins for u in b if u not in data_by_url]
+        data_by_url.update(zip(pending, ex.map(fetch, pending)))
 
-    if written_bytes > 0 or not parts:
-        _close_and_push()
+    oversize = [(no_by_url[u], u, sizes[u]) for u in oversize_urls]
+    groups = []
+    for b in bins:
+        # pop: the groups become the only owners of the bytes, freed part by part
+        blobs = sorted(((no_by_url[u], u, data_by_url.pop(u, None)) for u in b), key=_blob_order)
+        # Content-Length can be wrong; re-check real sizes and split a bin if it overflows
+        fits, extra = _split_oversize(blobs, max_zip_bytes)
+        oversize.extend(extra)
+        groups.extend(_group_greedy(fits, max_zip_bytes))
 
-    return parts
+    data_by_url.clear()
+    if not groups and not oversize:
+        return
+    yield from _pack_groups(groups, col, zip_basename_prefix, compression, pack_workers, oversize)
 
 
 def export_dataframe_with_images(df: pd.DataFrame, 
@@ -380,8 +861,12 @@ def export_dataframe_with_images(df: pd.DataFrame,
     exporter = ExcelImageExporter(**kwargs)
     return exporter.export_to_excel(df, image_column)
 
-def generate_excel_report(crawler):
-    """Generate Excel report from crawler data with robust error handling."""
+def generate_excel_report(crawler, media: Optional[MediaPrefetcher] = None):
+    """
+    Generate Excel report from crawler data with robust error handling.
+
+    Pass the MediaPrefetcher fed by the crawler to reuse thumbnails fetched during the crawl.
+    """
     today = datetime.now().strftime("%Y-%m-%d")
     time.sleep(1)  # Reduced sleep time
     
@@ -403,7 +888,8 @@ def generate_excel_report(crawler):
             image_size=(100, 100),
             row_height=100,
             timeout=15,
-            max_workers=10
+            max_workers=10,
+            media=media
         )
         
         excel_buffer = exporter.export_to_excel(
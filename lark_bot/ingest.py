@@ -0,0 +1,102 @@
+import json
+import logging
+
+from .config import VERIFICATION_TOKEN
+from .core import handle_incoming_message
+from .command_handlers import command_handler
+from .dedupe import make_event_deduper
+from .dispatcher import get_dispatcher
+from .state_managers import state_manager
+from .worker_pool import ChatWorkerPool
+
+logger = logging.getLogger(__name__)
+
+# Bounded, per-chat ordered handler pool instead of one thread per event
+webhook_pool = ChatWorkerPool()
+# Event/message ids already accepted, so Lark's re-deliveries never start a second run;
+# claimed in the shared backend when there is one, since a re-delivery may reach another worker
+event_deduper = make_event_deduper(state_manager.backend)
+
+def verify_token(data):
+    """Verify the incoming request token"""
+    received_token = data.get('header', {}).get('token')
+    return received_token == VERIFICATION_TOKEN
+
+def ingest_event(data):
+    """
+    Validate, de-duplicate and enqueue one webhook payload.
+
+    Only cheap checks run here so the HTTP ack returns immediately; logging
+    the payload and handling the command happen on the worker pool.
+
+    Returns:
+        tuple: (response body dict, HTTP status)
+    """
+    # URL verification
+    if data.get('type') == 'url_verification':
+        return {'challenge': data.get('challenge')}, 200
+
+    # 1. Verify the token first
+    if not verify_token(data):
+        return {'error': 'Invalid token'}, 403
+
+    header = data.get("header", {})
+    if header.get("event_type") != "im.message.receive_v1":
+        return {"code": 0, "message": "Event ignored"}, 200
+
+    message = data.get("event", {}).get("message", {})
+    # 2. Drop re-deliveries before any work starts
+    if event_deduper.check_and_add(header.get("event_id"), message.get("message_id")):
+        logger.info(f"Duplicate event {header.get('event_id')} / {message.get('message_id')} ignored")
+        return {"code": 0, "message": "Duplicate event"}, 200
+
+    # 3. Xử lý sự kiện tin nhắn không đồng bộ
+    chat_id = message.get("chat_id")
+    if not webhook_pool.submit(chat_id, process_message_async, data, message.get("chat_type")):
+        logger.warning(f"Webhook pool full, rejecting message in chat {chat_id}")
+        try:
+            is_command = json.loads(message.get("content") or "{}").get("text", "").strip().startswith("/")
+        except ValueError:
+            is_command = False
+        if is_command:
+            get_dispatcher().reply(command_handler.lark_api, message.get("message_id"),
+                                   "⏳ I'm busy right now. Please try again in a minute.", chat=chat_id)
+    return {"code": 0}, 200
+
+def process_message_async(data, chat_type):
+    """Xử lý tin nhắn trong luồng riêng"""
+    try:
+        logger.debug("Received event: %s", json.dumps(data, indent=2))
+        # Extract message content
+        message_content = data.get('event', {}).get('message', {}).get('content', {})
+        message_json = json.loads(message_content)
+        text = message_json.get('text', '').strip()
+        
+        logger.info(f"Processing message: {text}, chat_type: {chat_type}")
+        
+        # Group chat logic - only respond to commands starting with /
+        # if chat_type == "group":
+        if text.startswith('/'):
+            # Remove the / prefix from the text
+            modified_text = text[1:]  # Remove first character (/)
+            logger.info(f"Group command detected, modified: '{text}' -> '{modified_text}'")
+            
+            # Modify the data to remove the / prefix
+            message_json['text'] = modified_text
+            data['event']['message']['content'] = json.dumps(message_json)
+            
+            # Process the command in group
+            handle_incoming_message(data)
+        else:
+            logger.warning("No command in group")
+        
+        # P2P chat logic - respond to all messages
+        # elif chat_type == "p2p":
+            # logger.info("Processing P2P message")
+            # handle_incoming_message(data)
+        
+        # else:
+        #     logger.warning(f"Unknown chat type: {chat_type}")
+            
+    except Exception as e:
+        logger.error(f"Message processing error: {e}")
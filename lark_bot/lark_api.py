@@ -1,69 +1,479 @@
 import requests
+from requests.adapters import HTTPAdapter
 # import os
+import hashlib
 import json
+import os
+import random
+import re
+import threading
 import time
+import zlib
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from datetime import datetime, timedelta
-from .config import APP_ID, APP_SECRET
+from urllib.parse import urlsplit
+from .config import (APP_ID, APP_SECRET, LARK_BASE_URL, LARK_POOL_SIZE,
+                     LARK_CONNECT_TIMEOUT, LARK_READ_TIMEOUT, LARK_MAX_RETRIES,
+                     LARK_TOKEN_RENEW_MARGIN, LARK_TOKEN_CACHE, LARK_DRIVE_FOLDER,
+                     LARK_DRIVE_FILE_URL, LARK_UPLOAD_PARALLEL, LARK_FILE_KEY_CACHE,
+                     LARK_FILE_KEY_TTL)
 from .logger import message_logger
 
 # imports at top of file
 import mimetypes
 
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# /im/v1/files rejects anything larger; bigger files go through Drive's chunked upload
+IM_FILE_LIMIT = 30 * 1024 * 1024
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "PATCH", "OPTIONS"}
+
+class EndpointLatency:
+    """Thread-safe per-endpoint latency recorder (last `window` samples per endpoint)."""
+
+    _ID_RE = re.compile(r"/(om|oc|ou|file)_[A-Za-z0-9_-]+")
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts = defaultdict(int)
+        self._errors = defaultdict(int)
+
+    def endpoint(self, method: str, url: str) -> str:
+        path = urlsplit(url).path
+        if path.startswith("/open-apis"):
+            path = path[len("/open-apis"):]
+        path = self._ID_RE.sub(r"/:\1_id", path)
+        return f"{method.upper()} {path}"
+
+    def record(self, method: str, url: str, seconds: float, ok: bool = True):
+        key = self.endpoint(method, url)
+        with self._lock:
+            self._samples[key].append(seconds)
+            self._counts[key] += 1
+            if not ok:
+                self._errors[key] += 1
+
+    def stats(self) -> dict:
+        """{endpoint: {count, errors, p50_ms, p95_ms, max_ms}} over the recent window."""
+        with self._lock:
+            snapshot = {k: sorted(v) for k, v in self._samples.items()}
+            counts, errors = dict(self._counts), dict(self._errors)
+        out = {}
+        for key, samples in snapshot.items():
+            if not samples:
+                continue
+            pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+            out[key] = {
+                "count": counts[key],
+                "errors": errors.get(key, 0),
+                "p50_ms": round(pick(0.50) * 1000, 1),
+                "p95_ms": round(pick(0.95) * 1000, 1),
+                "max_ms": round(samples[-1] * 1000, 1),
+            }
+        return out
+
+# Process-wide keep-alive session and latency stats shared by every LarkAPI instance
+_session_lock = threading.Lock()
+_shared_session = None
+latency_stats = EndpointLatency()
+
+def _build_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_shared_session() -> requests.Session:
+    global _shared_session
+    with _session_lock:
+        if _shared_session is None:
+            _shared_session = _build_session(LARK_POOL_SIZE)
+        return _shared_session
+
+def _retry_delay(attempt, response=None):
+    """Jittered exponential backoff, honouring the server's reset hint on 429."""
+    if response is not None:
+        hint = response.headers.get("Retry-After") or response.headers.get("x-ogw-ratelimit-reset")
+        try:
+            return min(float(hint), 30.0) + random.uniform(0, 0.25)
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(8.0, 0.5 * (2 ** attempt)))
+
+class TenantTokenProvider:
+    """
+    Process-wide tenant_access_token cache shared by every LarkAPI instance.
+
+    Refreshes are single-flight: concurrent callers that find the token stale
+    (or hit a 401 with the same token) wait on one refresh instead of each
+    fetching their own. A daemon thread renews the token `renew_margin`
+    seconds before it expires so request paths normally never block on it,
+    and the token can be persisted to `cache_path` to survive restarts.
+    """
+
+    # Tokens this close to expiry are never handed out
+    HARD_MARGIN = 60
+
+    def __init__(self, base_url: str, app_id: str, app_secret: str, session: requests.Session,
+                 renew_margin: int = LARK_TOKEN_RENEW_MARGIN, cache_path: str = LARK_TOKEN_CACHE,
+                 timeout=None, max_retries: int = LARK_MAX_RETRIES):
+        self.url = f"{base_url}/auth/v3/tenant_access_token/internal"
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.session = session
+        self.renew_margin = max(renew_margin, self.HARD_MARGIN)
+        self.cache_path = cache_path or None
+        self.timeout = timeout or (LARK_CONNECT_TIMEOUT, LARK_READ_TIMEOUT)
+        self.max_retries = max_retries
+
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+        self._renewer = None
+        self._wake = threading.Event()
+        self._load_cache()
+
+    def token(self) -> str:
+        """Return a valid token, refreshing (once, for all waiting threads) if needed."""
+        if not self._valid():
+            with self._lock:
+                # Re-check: another thread may have refreshed while we waited
+                if not self._valid():
+                    self._refresh_locked()
+        self._start_renewer()
+        return self._token
+
+    def refresh(self, stale: str = None) -> str:
+        """
+        Fetch a new token unless another thread already replaced `stale`.
+
+        Args:
+            stale: The token the caller found rejected (None forces a fetch)
+        """
+        with self._lock:
+            if stale is None or self._token == stale or not self._valid():
+                self._refresh_locked()
+        self._start_renewer()
+        return self._token
+
+    def _valid(self) -> bool:
+        return bool(self._token) and time.time() < self._expires_at - self.HARD_MARGIN
+
+    def _refresh_locked(self):
+        token, expires_in = self._fetch()
+        self._token, self._expires_at = token, time.time() + expires_in
+        self._save_cache()
+        self._wake.set()
+        print(f"Access token refreshed, expires in {expires_in} seconds")
+
+    @property
+    def expires_at(self) -> float:
+        return self._expires_at
+
+    def _fetch(self):
+        payload = {"app_id": self.app_id, "app_secret": self.app_secret}
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                latency_stats.record("POST", self.url, time.perf_counter() - started,
+                                     ok=response.status_code < 400)
+                if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    time.sleep(_retry_delay(attempt, response))
+                    attempt += 1
+                    continue
+                response.raise_for_status()
+                data = response.json()
+                token = data.get("tenant_access_token")
+                if not token:
+                    raise requests.RequestException(f"no token in response: {data.get('msg')}")
+                # Lark tokens typically expire in 2 hours
+                return token, data.get("expire", 7200)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                latency_stats.record("POST", self.url, time.perf_counter() - started, ok=False)
+                if attempt >= self.max_retries:
+                    print(f"Failed to refresh access token: {e}")
+                    raise Exception(f"Token refresh failed: {e}")
+                time.sleep(_retry_delay(attempt))
+                attempt += 1
+            except requests.RequestException as e:
+                print(f"Failed to refresh access token: {e}")
+                raise Exception(f"Token refresh failed: {e}")
+
+    def _start_renewer(self):
+        if self._renewer is not None:
+            return
+        with self._lock:
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_loop, daemon=True,
+                                                 name="lark-token-renewer")
+                self._renewer.start()
+
+    def _renew_loop(self):
+        while True:
+            delay = self._expires_at - self.renew_margin - time.time()
+            if delay > 0:
+                # Woken early when a foreground refresh moves the expiry
+                self._wake.wait(delay)
+                self._wake.clear()
+                continue
+            try:
+                self.refresh(stale=self._token)
+            except Exception as e:
+                print(f"Background token renewal failed, retrying in 30s: {e}")
+                time.sleep(30)
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable token cache {self.cache_path}: {e}")
+            return
+        if data.get("app_id") == self.app_id and data.get("expires_at", 0) > time.time() + self.HARD_MARGIN:
+            self._token, self._expires_at = data.get("token"), float(data["expires_at"])
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        tmp = f"{self.cache_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"app_id": self.app_id, "token": self._token, "expires_at": self._expires_at}, f)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            print(f"Could not persist token cache {self.cache_path}: {e}")
+
+class FileKeyCache:
+    """
+    Persistent (content hash, file name) -> uploaded file key map with expiry.
+
+    Lets send_file skip re-uploading bytes that were uploaded recently, such as
+    the identical media zips a scheduled crawl produces every day.
+    """
+
+    MAX_ENTRIES = 5000
+
+    def __init__(self, path: str = LARK_FILE_KEY_CACHE, ttl: int = LARK_FILE_KEY_TTL):
+        self.path = path or None
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    @staticmethod
+    def digest(stream, filename) -> str:
+        """sha256 of the file name and the stream's bytes; the stream is left at position 0."""
+        h = hashlib.sha256(filename.encode("utf-8") + b"\0")
+        stream.seek(0)
+        for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+            h.update(chunk)
+        stream.seek(0)
+        return h.hexdigest()
+
+    def get(self, digest):
+        """Return (kind, key) for a live entry, else None."""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry and entry["expires_at"] > time.time():
+                return entry["kind"], entry["key"]
+            return None
+
+    def put(self, digest, kind, key):
+        with self._lock:
+            self._entries[digest] = {"kind": kind, "key": key, "expires_at": time.time() + self.ttl}
+            self._save_locked()
+
+    def discard_key(self, key) -> bool:
+        """Drop entries pointing at `key` (e.g. the server no longer accepts it)."""
+        with self._lock:
+            stale = [d for d, e in self._entries.items() if e["key"] == key]
+            for d in stale:
+                del self._entries[d]
+            if stale:
+                self._save_locked()
+            return bool(stale)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _save_locked(self):
+        now = time.time()
+        live = {d: e for d, e in self._entries.items() if e["expires_at"] > now}
+        if len(live) > self.MAX_ENTRIES:
+            newest = sorted(live.items(), key=lambda item: item[1]["expires_at"])[-self.MAX_ENTRIES:]
+            live = dict(newest)
+        self._entries = live
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(live, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not persist file key cache {self.path}: {e}")
+
+_file_key_cache = None
+
+def get_file_key_cache() -> FileKeyCache:
+    global _file_key_cache
+    with _session_lock:
+        if _file_key_cache is None:
+            _file_key_cache = FileKeyCache()
+        return _file_key_cache
+
+_token_providers = {}
+
+def get_token_provider(base_url: str = None, session: requests.Session = None) -> TenantTokenProvider:
+    """Return the shared token provider for this app and base URL (created on first use, no network)."""
+    base_url = (base_url or LARK_BASE_URL).rstrip("/")
+    key = (base_url, APP_ID)
+    with _session_lock:
+        provider = _token_providers.get(key)
+    if provider is None:
+        provider = TenantTokenProvider(base_url, APP_ID, APP_SECRET, session or get_shared_session())
+        with _session_lock:
+            provider = _token_providers.setdefault(key, provider)
+    return provider
+
 class LarkAPI:
-    def __init__(self):
-        self.access_token = None
-        self.token_expires_at = 0
-        self._refresh_access_token()
-        
-    
+    def __init__(self, base_url: str = None, session: requests.Session = None,
+                 pool_size: int = None, max_retries: int = None, timeout=None,
+                 token_provider: TenantTokenProvider = None, file_keys: FileKeyCache = None):
+        """
+        Args:
+            base_url: Open API root (default LARK_BASE_URL)
+            session: HTTP session to use (default: the process-wide pooled session)
+            pool_size: Build a dedicated session with this many pooled connections instead
+            max_retries: Retries on 429/5xx/connection errors (default LARK_MAX_RETRIES)
+            timeout: (connect, read) seconds applied to every call without an explicit timeout
+            token_provider: Token source (default: the shared provider for base_url)
+            file_keys: Uploaded-file cache (default: the shared LARK_FILE_KEY_CACHE)
+        """
+        self.base_url = (base_url or LARK_BASE_URL).rstrip("/")
+        if session is not None:
+            self.session = session
+        elif pool_size is not None:
+            self.session = _build_session(pool_size)
+        else:
+            self.session = get_shared_session()
+        self.max_retries = LARK_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = timeout or (LARK_CONNECT_TIMEOUT, LARK_READ_TIMEOUT)
+        self.latency = latency_stats
+        # No network here: the token is fetched lazily and shared across instances
+        self.tokens = token_provider or get_token_provider(self.base_url, self.session)
+        self.file_keys = file_keys or get_file_key_cache()
+
+    @property
+    def access_token(self):
+        return self.tokens.token()
+
+    @property
+    def token_expires_at(self):
+        return self.tokens.expires_at
+
     def _refresh_access_token(self):
-        """Get a new access token from Lark API"""
-        url = "https://open.larksuite.com/open-apis/auth/v3/tenant_access_token/internal"
-        payload = {"app_id": APP_ID, "app_secret": APP_SECRET}
-        
+        """Force a new access token from Lark API"""
+        return self.tokens.refresh()
+
+    def _ensure_valid_token(self):
+        """Return a valid token, refreshing if needed"""
+        return self.tokens.token()
+
+    def _retry_delay(self, attempt, response=None):
+        return _retry_delay(attempt, response)
+
+    def warm_up(self, valid_until: float = None):
+        """
+        Prepare for a burst of calls: a token valid past `valid_until` (plus a
+        margin) and a resolved, TLS-established pooled connection to the API host.
+
+        Args:
+            valid_until: Timestamp the calls are expected at (default: now)
+        """
+        horizon = (valid_until or time.time()) + 600
+        if self.tokens.expires_at - TenantTokenProvider.HARD_MARGIN < horizon:
+            self.tokens.refresh()
+        else:
+            self.tokens.token()
         try:
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.access_token = data.get("tenant_access_token")
-            
-            # Set expiration time (Lark tokens typically expire in 2 hours = 7200 seconds)
-            # We refresh 5 minutes early to be safe (7200 - 300 = 6900 seconds)
-            expires_in = data.get("expire", 7200)  # Default to 2 hours if not specified
-            self.token_expires_at = time.time() + expires_in - 300
-            
-            print(f"Access token refreshed, expires in {expires_in} seconds")
-            
+            # Any response will do; this only opens the connection the next request reuses
+            self.session.head(self.base_url, timeout=self.timeout)
         except requests.RequestException as e:
-            print(f"Failed to refresh access token: {e}")
-            raise Exception(f"Token refresh failed: {e}")
-    
-    def _ensure_valid_token(self):
-        """Check if token is still valid, refresh if needed"""
-        if not self.access_token or time.time() >= self.token_expires_at:
-            print("Token expired or missing, refreshing...")
-            self._refresh_access_token()
+            print(f"Lark connection warm-up failed: {e}")
+
+    def _send_with_retry(self, method, url, idempotent=None, **kwargs):
+        """
+        Send one request over the pooled session with explicit timeouts.
+
+        429 is always retried (the request was rejected, not processed). 5xx and
+        connection errors are retried only for idempotent calls, so a POST that
+        may have been applied is never sent twice.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            # Rewind file-like bodies so a retried upload resends from the start
+            for item in (kwargs.get("files") or {}).values():
+                stream = item[1] if isinstance(item, tuple) else item
+                if hasattr(stream, "seek"):
+                    stream.seek(0)
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.latency.record(method, url, time.perf_counter() - started, ok=False)
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                attempt += 1
+                continue
+            self.latency.record(method, url, time.perf_counter() - started, ok=response.status_code < 400)
+            retryable = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+            if not retryable or attempt >= self.max_retries:
+                return response
+            print(f"Lark {method} {url} returned {response.status_code}, retrying ({attempt + 1}/{self.max_retries})")
+            time.sleep(self._retry_delay(attempt, response))
+            attempt += 1
     
-    def _make_authenticated_request(self, method, url, **kwargs):
+    def _make_authenticated_request(self, method, url, idempotent=None, **kwargs):
         """Make a request with automatic token refresh on 401 errors"""
-        self._ensure_valid_token()
+        token = self._ensure_valid_token()
         
         # Add authorization header
         headers = kwargs.get('headers', {})
-        headers["Authorization"] = f"Bearer {self.access_token}"
+        headers["Authorization"] = f"Bearer {token}"
         kwargs['headers'] = headers
         
         # Make the request
-        response = requests.request(method, url, **kwargs)
+        response = self._send_with_retry(method, url, idempotent=idempotent, **kwargs)
         
         # If we get 401 (unauthorized), try refreshing token once
         if response.status_code == 401:
             print("Received 401, refreshing token and retrying...")
-            self._refresh_access_token()
-            headers["Authorization"] = f"Bearer {self.access_token}"
+            # Single-flight: threads rejected with the same token share one refresh
+            token = self.tokens.refresh(stale=token)
+            headers["Authorization"] = f"Bearer {token}"
             kwargs['headers'] = headers
-            response = requests.request(method, url, **kwargs)
+            response = self._send_with_retry(method, url, idempotent=idempotent, **kwargs)
         
         return response
 
@@ -83,7 +493,7 @@ class LarkAPI:
         Returns:
             str: Reply message ID if successful, None otherwise
         """
-        url = f"https://open.larksuite.com/open-apis/im/v1/messages/{message_id}/reply"
+        url = f"{self.base_url}/im/v1/messages/{message_id}/reply"
         headers = {
             "Content-Type": "application/json; charset=utf-8"
         }
@@ -149,7 +559,7 @@ class LarkAPI:
         Returns:
             bool: True if successful, False otherwise
         """
-        url = f"https://open.larksuite.com/open-apis/im/v1/messages/{message_id}"
+        url = f"{self.base_url}/im/v1/messages/{message_id}"
         headers = {
             "Content-Type": "application/json; charset=utf-8"
         }
@@ -176,7 +586,7 @@ class LarkAPI:
             return False
     
     def send_text(self, chat_id, text):
-        url = "https://open.larksuite.com/open-apis/message/v4/send/"
+        url = f"{self.base_url}/message/v4/send/"
         headers = {
             "Content-Type": "application/json; charset=utf-8"
         }
@@ -209,7 +619,7 @@ class LarkAPI:
         """
         Sends a clean text-based command menu card
         """
-        url = "https://open.larksuite.com/open-apis/message/v4/send/"
+        url = f"{self.base_url}/message/v4/send/"
         headers = {
             "Content-Type": "application/json; charset=utf-8"
         }
@@ -233,6 +643,7 @@ class LarkAPI:
                             "**Basic Commands:**\n"
                             "📙 **/help** : Show available commands\n"
                             "🔍 **/search** domain.com : Start scraping the target domain\n"
+                            "📥 **/search** domain.com --live : Also post partial results while crawling\n"
                             "⛔ **/cancel** : Cancel any in-progress search\n"
                         )
                     }
@@ -302,20 +713,108 @@ class LarkAPI:
         
     def send_file(self, message_id, file_buffer, filename, content_type, reply_in_thread = True):
         """
-        Uploads and sends in-memory file
+        Uploads and sends a file as a reply
+
+        Args:
+            message_id: Message to reply to
+            file_buffer: File path, bytes, or binary stream (read from its start)
+            filename: Name shown in the chat
+            content_type: MIME type of the file
+            reply_in_thread: Reply in thread or not
+
+        Files up to IM_FILE_LIMIT are sent as file messages. Larger files are
+        uploaded to LARK_DRIVE_FOLDER in parallel chunks and sent as a link.
+        Bytes uploaded recently are not uploaded again (see FileKeyCache).
+        """
+        uploaded = self._upload(file_buffer, filename, content_type)
+        self._deliver(message_id, file_buffer, filename, content_type, uploaded, reply_in_thread)
+
+    def send_files(self, message_id, files, reply_in_thread = True, max_parallel: int = LARK_UPLOAD_PARALLEL):
+        """
+        Upload several files concurrently and send them in their original order.
+
+        Args:
+            message_id: Message to reply to
+            files: Iterable of (filename, file_buffer, content_type); consumed lazily,
+                so at most `max_parallel` files are held at once
+            reply_in_thread: Reply in thread or not
+            max_parallel: Uploads in flight
+        """
+        window = deque()
+        with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as pool:
+            def drain(limit):
+                while len(window) > limit:
+                    item, fut = window.popleft()
+                    self._deliver(message_id, *item, fut.result(), reply_in_thread)
+            for filename, file_buffer, content_type in files:
+                window.append(((file_buffer, filename, content_type),
+                               pool.submit(self._upload, file_buffer, filename, content_type)))
+                drain(max_parallel - 1)
+            drain(0)
+
+    def upload_file(self, file_buffer, filename, content_type, use_cache: bool = True):
+        """
+        Upload a file; returns ("file", file_key) for IM uploads or ("drive", file_token).
+
+        With use_cache, identical bytes (and name) uploaded within LARK_FILE_KEY_TTL
+        reuse the earlier key instead of being uploaded again.
         """
-        # Step 1: Upload file directly from memory
-        upload_url = "https://open.larksuite.com/open-apis/im/v1/files"
+        kind, key, _ = self._upload(file_buffer, filename, content_type, use_cache)
+        return kind, key
+
+    def _upload(self, file_buffer, filename, content_type, use_cache=True):
+        """upload_file that also reports whether the key came from the cache."""
+        stream, size, owned = self._open_upload(file_buffer)
+        try:
+            digest = FileKeyCache.digest(stream, filename)
+            if use_cache:
+                cached = self.file_keys.get(digest)
+                if cached:
+                    print(f"Reusing uploaded {cached[0]} key for {filename}")
+                    return (*cached, True)
+            if size > IM_FILE_LIMIT:
+                if not LARK_DRIVE_FOLDER:
+                    raise Exception(f"{filename} is {size} bytes, over the {IM_FILE_LIMIT} byte IM limit "
+                                    "(set LARK_DRIVE_FOLDER to enable chunked uploads)")
+                uploaded = "drive", self.upload_to_drive(stream, size, filename)
+            else:
+                uploaded = "file", self._upload_im_file(stream, filename, content_type)
+            self.file_keys.put(digest, *uploaded)
+            return (*uploaded, False)
+        finally:
+            if owned:
+                stream.close()
+
+    def _deliver(self, message_id, file_buffer, filename, content_type, uploaded, reply_in_thread):
+        """Send an uploaded file; if a cached key is rejected, upload again and resend once."""
+        kind, key, cached = uploaded
+        try:
+            self._send_uploaded(message_id, kind, key, filename, reply_in_thread)
+        except Exception as e:
+            if not cached:
+                raise
+            self.file_keys.discard_key(key)
+            print(f"Cached key for {filename} rejected ({e}), uploading again")
+            kind, key = self.upload_file(file_buffer, filename, content_type, use_cache=False)
+            self._send_uploaded(message_id, kind, key, filename, reply_in_thread)
 
-          # Tính expire_time (UTC timestamp mili giây)
-        # expire_at = int((datetime.utcnow() + timedelta(minutes=5)).timestamp() * 1000)  # 5 phút sau
-        # NEW: detect content-type
-        # if not content_type:
-        #     guessed, _ = mimetypes.guess_type(filename)
-        #     content_type = guessed or "application/octet-stream"
+    @staticmethod
+    def _open_upload(file_buffer):
+        """Normalise a path / bytes / stream into (seekable stream, size, we_own_it)."""
+        if isinstance(file_buffer, (str, os.PathLike)):
+            stream = open(file_buffer, "rb")
+            return stream, os.fstat(stream.fileno()).st_size, True
+        if isinstance(file_buffer, (bytes, bytearray)):
+            return BytesIO(file_buffer), len(file_buffer), True
+        file_buffer.seek(0, os.SEEK_END)
+        size = file_buffer.tell()
+        file_buffer.seek(0)
+        return file_buffer, size, False
 
+    def _upload_im_file(self, stream, filename, content_type):
+        upload_url = f"{self.base_url}/im/v1/files"
         files = {
-            'file': (filename, file_buffer, content_type)
+            'file': (filename, stream, content_type)
         }
 
         data = {'file_type': 'stream', 
@@ -326,7 +825,8 @@ class LarkAPI:
             'POST',
             upload_url, 
             files=files, 
-            data=data
+            data=data,
+            timeout=(self.timeout[0], max(self.timeout[1], 120))
         )
         
         # Handle upload errors
@@ -337,14 +837,70 @@ class LarkAPI:
         
         if not file_key:
             raise Exception("File upload failed: No file_key in response")
-        
-           # Step 2: Send message with file
-        send_url = f"https://open.larksuite.com/open-apis/im/v1/messages/{message_id}/reply"
+        return file_key
+
+    def upload_to_drive(self, stream, size, filename, parallel: int = LARK_UPLOAD_PARALLEL):
+        """
+        Chunked Drive upload (upload_prepare -> upload_part x N -> upload_finish).
+
+        Blocks are read from `stream` one at a time per worker, so memory stays
+        at roughly `parallel` blocks. Each block is retried on its own.
+
+        Returns:
+            str: Drive file_token
+        """
+        def checked(response, step):
+            body = response.json() if response.content else {}
+            if response.status_code != 200 or body.get("code", 0) != 0:
+                raise Exception(f"Drive {step} failed for {filename}: {body.get('msg', response.text)}")
+            return body.get("data", {})
+
+        prepared = checked(self._make_authenticated_request(
+            'POST', f"{self.base_url}/drive/v1/files/upload_prepare",
+            json={"file_name": filename, "parent_type": "explorer",
+                  "parent_node": LARK_DRIVE_FOLDER, "size": size},
+        ), "upload_prepare")
+        upload_id, block_size, block_num = prepared["upload_id"], prepared["block_size"], prepared["block_num"]
+
+        read_lock = threading.Lock()
+
+        def put(seq):
+            with read_lock:
+                stream.seek(seq * block_size)
+                block = stream.read(block_size)
+            # Re-sending a seq replaces it server-side, so parts are safe to retry
+            checked(self._make_authenticated_request(
+                'POST', f"{self.base_url}/drive/v1/files/upload_part", idempotent=True,
+                data={"upload_id": upload_id, "seq": str(seq), "size": str(len(block)),
+                      "checksum": str(zlib.adler32(block))},
+                files={"file": (filename, block)},
+                timeout=(self.timeout[0], max(self.timeout[1], 120)),
+            ), f"upload_part {seq}")
+
+        with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+            list(pool.map(put, range(block_num)))
+
+        finished = checked(self._make_authenticated_request(
+            'POST', f"{self.base_url}/drive/v1/files/upload_finish",
+            json={"upload_id": upload_id, "block_num": block_num},
+        ), "upload_finish")
+        return finished["file_token"]
+
+    def _send_uploaded(self, message_id, kind, key, filename, reply_in_thread):
+        if kind == "drive":
+            link = LARK_DRIVE_FILE_URL.format(token=key)
+            if self.reply_to_message(message_id, text=f"📦 {filename}: {link}",
+                                     reply_in_thread=reply_in_thread) is None:
+                raise Exception(f"Failed to send link for {filename}")
+            return
+
+        # Send message with file
+        send_url = f"{self.base_url}/im/v1/messages/{message_id}/reply"
         headers = {"Content-Type": "application/json; charset=utf-8"}
         
         payload = {
             "msg_type": "file",
-            "content": json.dumps({"file_key": file_key}),
+            "content": json.dumps({"file_key": key}),
             "reply_in_thread": reply_in_thread
         }
         
@@ -360,4 +916,4 @@ class LarkAPI:
             send_error = send_response.json()
             error_msg = send_error.get('msg', 'Unknown send error')
             error_code = send_error.get('code', 'UNKNOWN')
-            raise Exception(f"Failed to send file: {error_msg} (Code: {error_code})")
\ No newline at end of file
+            raise Exception(f"Failed to send file: {error_msg} (Code: {error_code})")
@@ -0,0 +1,131 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pandas as pd
+
+from tools import FacebookAdsCrawler, partial_results_card
+
+logger = logging.getLogger(__name__)
+
+class ProgressiveReporter:
+    """
+    Opt-in partial result delivery for a running search.
+
+    Listens to the crawler's ad and advertiser events, and after each
+    advertiser (or every `every_n` new ads) updates a "Partial results" card.
+    With send_chunks, new rows are also posted as CSV files of at least
+    `chunk_rows` rows, so a domain with many advertisers does not fill the
+    chat with small files. Sends run on a single background thread so the
+    crawl never waits on Lark and chunks stay in order.
+    """
+
+    def __init__(self, lark_api, message_id, search_word,
+                 every_n: int = 25, send_chunks: bool = False, chunk_rows: int = 200, top_n: int = 5):
+        """
+        Args:
+            lark_api: LarkAPI used for the card and the CSV chunks
+            message_id: Message the partial results reply to
+            search_word: Domain being searched (card title and file names)
+            every_n: Flush after this many new ads even mid-advertiser
+            send_chunks: Also post new rows as CSV files
+            chunk_rows: Rows collected before a CSV file is posted
+            top_n: Rows previewed on the card
+        """
+        self.lark_api = lark_api
+        self.message_id = message_id
+        self.search_word = search_word
+        self.every_n = max(1, every_n)
+        self.send_chunks = send_chunks
+        self.chunk_rows = max(1, chunk_rows)
+        self.top_n = top_n
+
+        self._lock = threading.Lock()
+        self._seen = set()
+        self._rows = []
+        self._pending = []
+        self._unsent = []             # rows not yet posted in a CSV file
+        self._advertisers_done = 0
+        self._total_advertisers = 0
+        self._chunk_idx = 0
+        self._card_id = None
+        self._sender = ThreadPoolExecutor(max_workers=1)
+
+    def attach(self, crawler):
+        crawler.ad_listeners.append(self.on_ad)
+        crawler.advertiser_listeners.append(self.on_advertiser)
+
+    def on_ad(self, ad_data):
+        row = FacebookAdsCrawler.record_to_row(ad_data)
+        if row is None:
+            return
+        # Same de-duplication key as data_to_dataframe
+        key = (row["library_id"], row["company"])
+        with self._lock:
+            if key in self._seen:
+                return
+            self._seen.add(key)
+            self._rows.append(row)
+            self._pending.append(row)
+            due = len(self._pending) >= self.every_n
+        if due:
+            self.flush()
+
+    def on_advertiser(self, idx, total, page_name):
+        with self._lock:
+            self._advertisers_done = idx
+            self._total_advertisers = total
+        self.flush()
+
+    def flush(self):
+        """
+        Queue a card update for rows collected since the last flush, plus a
+        CSV chunk once `chunk_rows` rows are waiting for one.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            chunk = None
+            if self.send_chunks:
+                self._unsent.extend(self._pending)
+                if len(self._unsent) >= self.chunk_rows:
+                    chunk, self._unsent = self._unsent, []
+                    self._chunk_idx += 1
+            self._pending = []
+            snapshot = (self._chunk_idx, chunk, len(self._rows), self._rows[:self.top_n],
+                        self._advertisers_done, self._total_advertisers)
+        try:
+            self._sender.submit(self._send, *snapshot)
+        except RuntimeError:
+            pass  # closed
+
+    def _send(self, chunk_idx, chunk, num_results, top_rows, advertisers_done, total_advertisers):
+        card = partial_results_card(
+            search_word=self.search_word,
+            num_results=num_results,
+            advertisers_done=advertisers_done,
+            total_advertisers=total_advertisers,
+            top_rows=top_rows,
+        )
+        try:
+            if self._card_id is None:
+                self._card_id = self.lark_api.reply_to_message(
+                    message_id=self.message_id, card=card, reply_in_thread=True
+                )
+            else:
+                self.lark_api.update_card_message(self._card_id, card=card)
+
+            if chunk:
+                buf = BytesIO()
+                pd.DataFrame(chunk, columns=FacebookAdsCrawler.FINAL_COLUMNS).to_csv(buf, index=False)
+                buf.seek(0)
+                base = self.search_word.replace(".", "-").replace(" ", "_") or "results"
+                self.lark_api.send_file(self.message_id, buf, f"{base}_partial_{chunk_idx}.csv",
+                                        content_type="text/csv")
+        except Exception as e:
+            logger.warning(f"Partial result delivery failed for {self.search_word}: {e}")
+
+    def close(self, wait: bool = True):
+        """Stop accepting work; with wait=True, finish queued sends first (before the final report)."""
+        self._sender.shutdown(wait=wait, cancel_futures=not wait)
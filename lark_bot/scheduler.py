@@ -0,0 +1,306 @@
+import datetime
+import heapq
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+
+from .config import (SCHEDULER_LEASE_TTL, SCHEDULER_GRACE_SECONDS, SCHEDULER_CATCHUP_WINDOW,
+                     SCHEDULER_CATCHUP_SPACING, SCHEDULER_JITTER_WINDOW, SCHEDULER_MAX_BACKLOG,
+                     SCHEDULER_MAX_DEFER, SCHEDULER_PREWARM_MINUTES, SCHEDULE_BATCH_PARALLEL)
+from .state_managers import state_manager
+from tools.fb_scrape_bot import CrawlerQueue
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE = "scheduler_leader"
+
+def schedule_id(chat_id, hour, minute, tz_offset) -> str:
+    return f"{chat_id}:{hour:02d}:{minute:02d}:tz{tz_offset}"
+
+def chat_jitter(chat_id, window: float) -> int:
+    """Fixed offset in [0, window) seconds for a chat, the same in every process and restart."""
+    if window <= 0:
+        return 0
+    return zlib.crc32(str(chat_id).encode("utf-8")) % int(window)
+
+class ScheduleService:
+    """
+    Fires per-chat schedules from exactly one process.
+
+    Every server process starts this service (main_app.start_scheduler),
+    but only the holder of the "scheduler_leader" lease in the state backend
+    fires schedules; the others keep trying to take the lease, so a new leader
+    takes over within `lease_ttl` seconds when the old one dies. Each fire
+    is recorded durably (ChatConfigStore.schedule_fires) before the run
+    starts, so neither a new leader nor a restarted process fires the same
+    schedule-minute again, whatever STATE_BACKEND is.
+
+    The leader keeps a min-heap of each schedule's next fire instant and
+    sleeps until the earliest one (or the next lease renewal). Adding or
+    removing a schedule, in any worker, makes it rebuild the heap. A fire
+    that comes up late, e.g. after a pause, still runs if it is within
+    `grace` seconds.
+
+    To spread chats that share a round time, each chat fires at its nominal
+    time plus a fixed per-chat offset within `jitter_window`. A due batch is
+    admitted only while the crawl queue's estimated drain time (the running
+    and queued crawls) is under `max_backlog`; otherwise it is retried every
+    minute for up to `max_defer` seconds. A batch's later domains are not
+    counted: they only reach the queue as its earlier ones finish.
+
+    With a `prewarm` callback, prewarm(chat_id, fire_at) runs on its own
+    thread `prewarm_lead` seconds before each fire.
+
+    When a process becomes leader it also reconciles against the fire
+    records: a schedule whose latest occurrence is older than `grace` but
+    within `catchup_window`, and that was not fired, gets a catch-up run.
+    Catch-ups run one at a time, only while the crawl queue is idle, so a
+    restart does not stampede the queue ahead of interactive searches.
+    """
+
+    def __init__(self, fire, lease_ttl: float = SCHEDULER_LEASE_TTL, grace: float = SCHEDULER_GRACE_SECONDS,
+                 catchup_window: float = SCHEDULER_CATCHUP_WINDOW, catchup_spacing: float = SCHEDULER_CATCHUP_SPACING,
+                 jitter_window: float = SCHEDULER_JITTER_WINDOW, max_backlog: float = SCHEDULER_MAX_BACKLOG,
+                 max_defer: float = SCHEDULER_MAX_DEFER, prewarm=None,
+                 prewarm_lead: float = SCHEDULER_PREWARM_MINUTES * 60):
+        """
+        Args:
+            fire: Called as fire(chat_id, hour, minute, tz_offset) on its own thread
+            lease_ttl: Seconds the leader lease lasts without renewal
+            grace: How late (seconds) a fire may still run
+            catchup_window: How old (seconds) a missed run may be and still be caught up; 0 disables
+            catchup_spacing: Seconds between consecutive catch-up runs
+            jitter_window: Per-chat fire offsets are spread over this many seconds; 0 disables
+            max_backlog: Estimated crawl-queue drain time (seconds) above which batches wait
+            max_defer: Longest a batch waits for the backlog to drain before running anyway
+            prewarm: Optional warm-up, called as prewarm(chat_id, fire_at)
+            prewarm_lead: Seconds before a fire to start its warm-up; 0 disables
+        """
+        self.fire = fire
+        self.lease_ttl = lease_ttl
+        self.renew_every = lease_ttl / 3
+        self.grace = grace
+        self.catchup_window = catchup_window
+        self.catchup_spacing = catchup_spacing
+        self._reconciled = False
+        self.jitter_window = jitter_window
+        self.max_backlog = max_backlog
+        self.max_defer = max_defer
+        self.prewarm = prewarm
+        self.prewarm_lead = prewarm_lead
+        self._warmed = set()          # (chat_id, nominal due) already warmed up
+        self.backend = state_manager.backend
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._heap = []
+        self._dirty = True
+        self._schedules_version = None
+        self._wake = threading.Event()
+        self._thread = None
+        state_manager.schedule_listeners.append(self.reload)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True, name="scheduler")
+            self._thread.start()
+        return self
+
+    def reload(self, *args):
+        """Rebuild the heap from chat_schedules at the next wake-up (and wake now)."""
+        self._dirty = True
+        self._wake.set()
+
+    def _lead(self) -> bool:
+        leader = self.backend.claim(LEADER_LEASE, self.owner, self.lease_ttl)
+        if leader != self.is_leader:
+            logger.info(f"[Scheduler] {self.owner} {'became' if leader else 'is no longer'} the leader")
+            self.is_leader = leader
+            self._dirty = True
+            self._reconciled = False
+        return leader
+
+    def _loop(self):
+        logger.info("Scheduler thread has started successfully.")
+        while True:
+            timeout = self.renew_every
+            try:
+                if self._lead():
+                    timeout = min(timeout, self.run_due(time.time()))
+            except Exception as e:
+                logger.error(f"Scheduler error: {e}")
+            self._wake.wait(max(0.0, timeout))
+            self._wake.clear()
+
+    @staticmethod
+    def next_fire(hour, minute, tz_offset, after: float) -> float:
+        """First UTC timestamp >= `after` at which local time (UTC+tz_offset) is hour:minute."""
+        tz = datetime.timezone(datetime.timedelta(hours=tz_offset))
+        local = datetime.datetime.fromtimestamp(after, tz)
+        due = local.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if due.timestamp() < after:
+            due += datetime.timedelta(days=1)
+        return due.timestamp()
+
+    def _entry(self, due: float, cid, h, m, tz):
+        # (fire_at, nominal due, ...): the heap orders by jittered time, records use the nominal one
+        return (due + chat_jitter(cid, self.jitter_window), due, cid, h, m, tz)
+
+    def _rebuild(self, now: float):
+        heap = []
+        # Batches held back by the backlog check keep their place across rebuilds
+        deferred = {e[2:]: e for e in self._heap if e[0] != e[1] + chat_jitter(e[2], self.jitter_window)}
+        for cid, schedules in list(state_manager.chat_schedules.items()):
+            # Start from now - grace (before jitter) so a fire we are only slightly late for is still picked up
+            since = now - self.grace - chat_jitter(cid, self.jitter_window)
+            for s in schedules or []:
+                h = int(s.get("hour", 0))
+                m = int(s.get("minute", 0))
+                tz = int(s.get("tz_offset", 0))
+                heap.append(deferred.get((cid, h, m, tz))
+                            or self._entry(self.next_fire(h, m, tz, since), cid, h, m, tz))
+        heapq.heapify(heap)
+        self._heap = heap
+        self._dirty = False
+
+    def run_due(self, now: float) -> float:
+        """Fire every heap entry that is due; return seconds until the next one."""
+        # Schedules changed by another worker do not reach our listener; the store's counter shows them
+        version = state_manager.chat_config.schedules_version()
+        if version != self._schedules_version:
+            self._schedules_version = version
+            self._dirty = True
+        if self._dirty:
+            self._rebuild(now)
+        if not self._reconciled:
+            self._reconciled = True
+            self._start_catchup(self.missed_runs(now))
+        admitted = 0                  # first domains of batches fired below that may not be queued yet
+        while self._heap and self._heap[0][0] <= now:
+            at, due, cid, h, m, tz = heapq.heappop(self._heap)
+            if now - at > self.grace:
+                heapq.heappush(self._heap, self._entry(self.next_fire(h, m, tz, due + 60), cid, h, m, tz))
+                logger.warning(f"[Scheduler] Skipping {schedule_id(cid, h, m, tz)} due "
+                               f"{datetime.datetime.utcfromtimestamp(at).isoformat()}Z, {now - at:.0f}s late")
+                continue
+            backlog = self.projected_backlog(admitted)
+            if backlog > self.max_backlog:
+                if now - due < self.max_defer:
+                    logger.info(f"[Scheduler] Deferring {schedule_id(cid, h, m, tz)}: "
+                                f"crawl backlog ~{backlog:.0f}s > {self.max_backlog}s")
+                    # Keep the nominal due so the fire record and the deferral limit still refer to it
+                    heapq.heappush(self._heap, (now + 60, due, cid, h, m, tz))
+                    continue
+                logger.warning(f"[Scheduler] Running {schedule_id(cid, h, m, tz)} despite ~{backlog:.0f}s "
+                               f"backlog after deferring {now - due:.0f}s")
+            heapq.heappush(self._heap, self._entry(self.next_fire(h, m, tz, due + 60), cid, h, m, tz))
+            if self._fire_once(cid, h, m, tz, due):
+                admitted += min(SCHEDULE_BATCH_PARALLEL, len(state_manager.get_domains(cid)))
+        wait = self._heap[0][0] - now if self._heap else self.renew_every
+        return min(wait, self._start_prewarms(now))
+
+    def _start_prewarms(self, now: float) -> float:
+        """Start warm-ups for fires within prewarm_lead; return seconds until the next one is due."""
+        if not self.prewarm or self.prewarm_lead <= 0:
+            return self.renew_every
+        next_in = self.renew_every
+        for at, due, cid, h, m, tz in self._heap:
+            start = at - self.prewarm_lead
+            if start > now:
+                next_in = min(next_in, start - now)
+            elif (cid, due) not in self._warmed:
+                self._warmed.add((cid, due))
+                threading.Thread(target=self._run_prewarm, args=(cid, at), daemon=True,
+                                 name=f"prewarm-{cid}").start()
+        self._warmed = {(cid, due) for cid, due in self._warmed if due > now - 86400}
+        return next_in
+
+    def _run_prewarm(self, cid, fire_at: float):
+        try:
+            self.prewarm(cid, fire_at)
+        except Exception as e:
+            logger.warning(f"[Scheduler] Warm-up for {cid} failed: {e}")
+
+    def projected_backlog(self, extra_items: int = 0) -> float:
+        """Estimated seconds for the running and queued crawls (plus `extra_items`) to finish."""
+        return CrawlerQueue().estimated_drain_seconds(extra_items)
+
+    def missed_runs(self, now: float):
+        """Latest occurrences older than grace but within the catch-up window that never fired."""
+        if self.catchup_window <= 0:
+            return []
+        missed = []
+        for cid, schedules in list(state_manager.chat_schedules.items()):
+            for s in schedules or []:
+                h = int(s.get("hour", 0))
+                m = int(s.get("minute", 0))
+                tz = int(s.get("tz_offset", 0))
+                latest = self.next_fire(h, m, tz, now - 86400)
+                if not (self.grace < now - latest <= self.catchup_window):
+                    continue
+                record = state_manager.chat_config.get_fire(schedule_id(cid, h, m, tz))
+                # Without a record we cannot tell whether the schedule existed at that time
+                if not record or record.get("at", 0) >= latest:
+                    continue
+                missed.append((latest, cid, h, m, tz))
+        return sorted(missed)
+
+    def _start_catchup(self, missed):
+        if not missed:
+            return
+        logger.info(f"[Scheduler] {len(missed)} missed run(s) to catch up")
+        threading.Thread(target=self._catchup, args=(missed,), daemon=True, name="scheduler-catchup").start()
+
+    def _crawler_idle(self) -> bool:
+        return self.backend.holder(CrawlerQueue.SLOT) is None and not self.backend.qitems(CrawlerQueue.QUEUE)
+
+    def _catchup(self, missed):
+        for i, (due, cid, h, m, tz) in enumerate(missed):
+            if i:
+                time.sleep(self.catchup_spacing)
+            # Low priority: never start while interactive or scheduled crawls are running or queued
+            while not self._crawler_idle():
+                if not self.is_leader:
+                    return
+                time.sleep(5)
+            if not self.is_leader:
+                return
+            logger.info(f"[Scheduler] Catching up {schedule_id(cid, h, m, tz)} missed by {time.time() - due:.0f}s")
+            self._fire_once(cid, h, m, tz, due, catchup=True)
+
+    def _fire_once(self, cid, h, m, tz, due: float, catchup: bool = False):
+        """Record and start one run unless that schedule-minute already fired; True if started.
+
+        Catch-up runs execute on the calling thread so they run one after another.
+        """
+        sid = schedule_id(cid, h, m, tz)
+        local_due = datetime.datetime.fromtimestamp(due, datetime.timezone(datetime.timedelta(hours=tz)))
+        minute_stamp = local_due.strftime('%Y%m%d%H%M')
+        if (state_manager.chat_config.get_fire(sid) or {}).get("minute") == minute_stamp:
+            return False
+        # The claim guards the short overlap where an old leader has not yet noticed it lost the lease
+        if not state_manager.claim_schedule_fire(f"{sid}:{minute_stamp}"):
+            return False
+        if not state_manager.chat_config.record_fire(sid, minute_stamp, time.time(), self.owner, catchup):
+            return False
+        logger.info(f"[Scheduler] FIRING! chat_id={cid}, schedule={h:02d}:{m:02d}, tz={tz}, "
+                    f"due_local={local_due.isoformat()}, late_by={time.time() - due:.1f}s")
+        if catchup:
+            self._run(cid, h, m, tz, wait=True)
+            return True
+        # Runs can take a long time; keep renewing the lease meanwhile
+        threading.Thread(target=self._run, args=(cid, h, m, tz), daemon=True,
+                         name=f"scheduled-{sid}").start()
+        return True
+
+    def _run(self, cid, h, m, tz, wait: bool = False):
+        try:
+            run = self.fire(cid, h, m, tz)
+            # fire may return a batch that finishes later (run_scheduled_crawl does)
+            if wait and hasattr(run, "wait"):
+                run.wait()
+        except Exception as e:
+            logger.error(f"[Scheduler] Scheduled run {schedule_id(cid, h, m, tz)} failed: {e}")
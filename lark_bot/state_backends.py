@@ -0,0 +1,300 @@
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .config import STATE_BACKEND
+
+# Seconds between sweeps of expired leases in the memory and SQLite backends
+LEASE_PURGE_INTERVAL = 60
+
+class StateBackend(abc.ABC):
+    """
+    Storage for state that every bot process must agree on.
+
+    Three primitives cover user states, cancel flags, the crawl queue and
+    schedule debouncing:
+
+    - maps: hget/hset/hdel/hgetall of JSON values under a namespace
+    - leases: claim/release/holder, a named key owned by one owner until it expires
+    - queues: qpush/qremove/qitems, an ordered list of unique strings
+
+    MemoryBackend keeps the single-process behaviour; SQLiteBackend (WAL)
+    and RedisBackend share state between gunicorn workers or hosts.
+    """
+
+    @abc.abstractmethod
+    def hget(self, ns, key, default=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def hset(self, ns, key, value):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def hdel(self, ns, key):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def hgetall(self, ns) -> dict:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def claim(self, name, owner, ttl: float) -> bool:
+        """Take or renew lease `name` for `owner`; False if someone else holds it."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def release(self, name, owner):
+        """Drop lease `name` if `owner` still holds it."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def holder(self, name):
+        """Current owner of lease `name`, or None."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def qpush(self, queue, item):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def qremove(self, queue, item) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def qitems(self, queue) -> list:
+        raise NotImplementedError
+
+class MemoryBackend(StateBackend):
+    """In-process backend; state is lost on restart and not shared between workers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._maps = {}
+        self._leases = {}
+        self._queues = {}
+        self._next_purge = 0.0
+
+    def hget(self, ns, key, default=None):
+        with self._lock:
+            return self._maps.get(ns, {}).get(key, default)
+
+    def hset(self, ns, key, value):
+        with self._lock:
+            self._maps.setdefault(ns, {})[key] = value
+
+    def hdel(self, ns, key):
+        with self._lock:
+            self._maps.get(ns, {}).pop(key, None)
+
+    def hgetall(self, ns) -> dict:
+        with self._lock:
+            return dict(self._maps.get(ns, {}))
+
+    def claim(self, name, owner, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            if now >= self._next_purge:
+                # One-shot claims (schedule fires, webhook events) are never released
+                self._leases = {k: v for k, v in self._leases.items() if v[1] > now}
+                self._next_purge = now + LEASE_PURGE_INTERVAL
+            current = self._leases.get(name)
+            if current and current[0] != owner and current[1] > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+    def release(self, name, owner):
+        with self._lock:
+            current = self._leases.get(name)
+            if current and current[0] == owner:
+                del self._leases[name]
+
+    def holder(self, name):
+        with self._lock:
+            current = self._leases.get(name)
+            return current[0] if current and current[1] > time.time() else None
+
+    def qpush(self, queue, item):
+        with self._lock:
+            q = self._queues.setdefault(queue, [])
+            if item not in q:
+                q.append(item)
+
+    def qremove(self, queue, item) -> bool:
+        with self._lock:
+            q = self._queues.get(queue, [])
+            if item in q:
+                q.remove(item)
+                return True
+            return False
+
+    def qitems(self, queue) -> list:
+        with self._lock:
+            return list(self._queues.get(queue, []))
+
+class SQLiteBackend(StateBackend):
+    """
+    SQLite in WAL mode: readers never block the writer, so several gunicorn
+    workers on one host can share state through a single file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._next_purge = 0.0
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS kv (
+                    ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT,
+                    PRIMARY KEY (ns, key));
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS queues (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, item TEXT NOT NULL,
+                    UNIQUE (queue, item));
+            """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def hget(self, ns, key, default=None):
+        row = self._conn().execute("SELECT value FROM kv WHERE ns=? AND key=?", (ns, str(key))).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def hset(self, ns, key, value):
+        self._conn().execute(
+            "INSERT INTO kv (ns, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT(ns, key) DO UPDATE SET value=excluded.value",
+            (ns, str(key), json.dumps(value)))
+
+    def hdel(self, ns, key):
+        self._conn().execute("DELETE FROM kv WHERE ns=? AND key=?", (ns, str(key)))
+
+    def hgetall(self, ns) -> dict:
+        rows = self._conn().execute("SELECT key, value FROM kv WHERE ns=?", (ns,)).fetchall()
+        return {k: json.loads(v) for k, v in rows}
+
+    def claim(self, name, owner, ttl: float) -> bool:
+        now = time.time()
+        if now >= self._next_purge:
+            # One-shot claims (schedule fires, webhook events) are never released
+            self._next_purge = now + LEASE_PURGE_INTERVAL
+            self._conn().execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+        cur = self._conn().execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at "
+            "WHERE leases.owner=excluded.owner OR leases.expires_at <= ?",
+            (name, owner, now + ttl, now))
+        return cur.rowcount == 1
+
+    def release(self, name, owner):
+        self._conn().execute("DELETE FROM leases WHERE name=? AND owner=?", (name, owner))
+
+    def holder(self, name):
+        row = self._conn().execute(
+            "SELECT owner FROM leases WHERE name=? AND expires_at > ?", (name, time.time())).fetchone()
+        return row[0] if row else None
+
+    def qpush(self, queue, item):
+        self._conn().execute("INSERT OR IGNORE INTO queues (queue, item) VALUES (?, ?)", (queue, item))
+
+    def qremove(self, queue, item) -> bool:
+        return self._conn().execute("DELETE FROM queues WHERE queue=? AND item=?", (queue, item)).rowcount > 0
+
+    def qitems(self, queue) -> list:
+        rows = self._conn().execute("SELECT item FROM queues WHERE queue=? ORDER BY id", (queue,)).fetchall()
+        return [r[0] for r in rows]
+
+class RedisBackend(StateBackend):
+    """Redis (or any RESP-compatible server) for workers spread over several hosts."""
+
+    # Renew if we own it, otherwise take it only when free
+    _CLAIM = """
+        local cur = redis.call('GET', KEYS[1])
+        if cur == ARGV[1] or not cur then
+            redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+            return 1
+        end
+        return 0
+    """
+    # Append unless already queued, in one step so two workers cannot both push it
+    _QPUSH = """
+        if not redis.call('LPOS', KEYS[1], ARGV[1]) then
+            redis.call('RPUSH', KEYS[1], ARGV[1])
+        end
+    """
+    _RELEASE = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, url: str, prefix: str = "fbbot"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("STATE_BACKEND=redis://... requires the 'redis' package") from e
+        self.r = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._claim = self.r.register_script(self._CLAIM)
+        self._release = self.r.register_script(self._RELEASE)
+        self._qpush = self.r.register_script(self._QPUSH)
+
+    def _k(self, *parts):
+        return ":".join((self.prefix,) + tuple(str(p) for p in parts))
+
+    def hget(self, ns, key, default=None):
+        raw = self.r.hget(self._k("h", ns), str(key))
+        return json.loads(raw) if raw is not None else default
+
+    def hset(self, ns, key, value):
+        self.r.hset(self._k("h", ns), str(key), json.dumps(value))
+
+    def hdel(self, ns, key):
+        self.r.hdel(self._k("h", ns), str(key))
+
+    def hgetall(self, ns) -> dict:
+        return {k: json.loads(v) for k, v in self.r.hgetall(self._k("h", ns)).items()}
+
+    def claim(self, name, owner, ttl: float) -> bool:
+        # PX makes every lease key, including never-released one-shot claims, expire on its own
+        return bool(self._claim(keys=[self._k("lease", name)], args=[owner, max(1, int(ttl * 1000))]))
+
+    def release(self, name, owner):
+        self._release(keys=[self._k("lease", name)], args=[owner])
+
+    def holder(self, name):
+        return self.r.get(self._k("lease", name))
+
+    def qpush(self, queue, item):
+        self._qpush(keys=[self._k("q", queue)], args=[item])
+
+    def qremove(self, queue, item) -> bool:
+        return self.r.lrem(self._k("q", queue), 0, item) > 0
+
+    def qitems(self, queue) -> list:
+        return self.r.lrange(self._k("q", queue), 0, -1)
+
+def make_backend(url: str = STATE_BACKEND) -> StateBackend:
+    """
+    Build a backend from a URL: "memory", "sqlite:///logs/state.db" or "redis://host:6379/0".
+    """
+    if not url or url == "memory":
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unknown STATE_BACKEND: {url}")
@@ -1,95 +1,194 @@
 import threading
 import time
-from collections import defaultdict
 from typing import Optional
-import json, os
+import os
+import uuid
 
+from .state_backends import StateBackend, make_backend
+from .chat_config import ChatConfigStore
+
+# Legacy JSON stores, imported into the chat config database on first start
 DOMAINS_FILE = "logs/domains.json"
 SCHEDULES_FILE = "logs/schedules.json"
 
-class UserStateManager:
+class CancelToken:
+    """
+    Cancellation flag for one job, created when the job starts.
+
+    Checking it is a plain attribute read (no lock), cheap enough for the
+    crawler to test before every element. cancel() sets the flag once and
+    then runs the registered callbacks (e.g. the crawler's force_stop). A
+    small lock around registration and dispatch makes sure each callback
+    runs exactly once, even when on_cancel() and cancel() race.
+    """
+    __slots__ = ("cancelled", "_callbacks", "_lock")
+
     def __init__(self):
-        self.user_states = {}
+        self.cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, callback):
+        """Run `callback()` on cancel (immediately if already cancelled)."""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        self._run(callback)
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._run(callback)
+
+    @staticmethod
+    def _run(callback):
+        try:
+            callback()
+        except Exception as e:
+            print(f"Cancel callback failed: {e}")
+
+class UserStateManager:
+    """
+    Per-user conversation state, running processes, cancel flags and the
+    per-chat domain/schedule configuration.
+
+    States, chat/message mappings, cancel flags and schedule fire claims live
+    in a StateBackend (STATE_BACKEND), so several workers see the same values.
+    Process handles and their CancelTokens are local objects and stay in
+    this process; a cancel requested in another worker reaches them through
+    the backend "cancel" flags, which a watcher thread fans out to the local
+    tokens. Domains and schedules are kept in a ChatConfigStore (SQLite).
+    """
+
+    def __init__(self, backend: StateBackend = None, chat_config: ChatConfigStore = None):
+        self.backend = backend or make_backend()
+        self.chat_config = chat_config or ChatConfigStore(domains_json=DOMAINS_FILE, schedules_json=SCHEDULES_FILE)
         self.active_processes = {}
-        self.cancel_events = {}
-        self.user_chat_mapping = {}
-        self.user_message_mapping = defaultdict(lambda: {'message_id': None, 'root_id': None})
+        self.cancel_tokens = {}
         self.lock = threading.RLock()  # Use reentrant lock for nested operations
         self.cleanup_thread = threading.Thread(target=self.cleanup_stale_processes, daemon=True)
         self.cleanup_thread.start()
+        self.cancel_watch_thread = threading.Thread(target=self.watch_remote_cancels, daemon=True)
+        self.cancel_watch_thread.start()
 
-        self.chat_domains = self._load_json(DOMAINS_FILE)
-        self.chat_schedules = self._load_json(SCHEDULES_FILE)
-        self.last_run_key = {}
+        # Called with chat_id after a schedule is added or removed (the scheduler re-plans)
+        self.schedule_listeners = []
     
     def set_state(self, user_id, state, chat_id=None, message_id=None, root_id=None):
         with self.lock:
-            self.user_states[user_id] = state
+            if state is None:
+                self.backend.hdel("user_state", user_id)
+            else:
+                self.backend.hset("user_state", user_id, state)
             if chat_id:
-                self.user_chat_mapping[user_id] = chat_id
+                self.backend.hset("user_chat", user_id, chat_id)
             if message_id or root_id:
-                self.user_message_mapping[user_id] = {
+                self.backend.hset("user_message", user_id, {
                     'message_id': message_id,
                     'root_id': root_id
-                }
+                })
     
     def get_state(self, user_id) -> Optional[str]:
-        with self.lock:
-            return self.user_states.get(user_id)
+        return self.backend.hget("user_state", user_id)
     
     def clear_state(self, user_id):
         with self.lock:
-            if user_id in self.user_states:
-                del self.user_states[user_id]
-            if user_id in self.cancel_events:
-                del self.cancel_events[user_id]
+            self.backend.hdel("user_state", user_id)
+            self.backend.hdel("cancel", user_id)
+            self.backend.hdel("active", user_id)
+            self.cancel_tokens.pop(user_id, None)
     
     def get_chat_id(self, user_id) -> Optional[str]:
-        with self.lock:
-            return self.user_chat_mapping.get(user_id)
+        return self.backend.hget("user_chat", user_id)
     
     def get_message_info(self, user_id) -> dict:
-        with self.lock:
-            return self.user_message_mapping[user_id]
+        return self.backend.hget("user_message", user_id) or {'message_id': None, 'root_id': None}
 
-    def register_process(self, user_id, process, chat_id=None, message_id=None, root_id=None):
+    def register_process(self, user_id, process, chat_id=None, message_id=None, root_id=None) -> CancelToken:
+        """
+        Track a running job and return its cancel token (the process's own
+        `cancel_token` if it has one). request_cancel() calls process.force_stop().
+        """
+        token = getattr(process, "cancel_token", None) or CancelToken()
+        if hasattr(process, "force_stop"):
+            token.on_cancel(process.force_stop)
         with self.lock:
             self.active_processes[user_id] = {
                 'process': process,
                 'timestamp': time.time()
             }
-            self.cancel_events[user_id] = threading.Event()
+            self.cancel_tokens[user_id] = token
+            self.backend.hdel("cancel", user_id)
+            self.backend.hset("active", user_id, {"pid": os.getpid(), "timestamp": time.time()})
             if chat_id:
-                self.user_chat_mapping[user_id] = chat_id
+                self.backend.hset("user_chat", user_id, chat_id)
             if message_id or root_id:
-                self.user_message_mapping[user_id] = {
+                self.backend.hset("user_message", user_id, {
                     'message_id': message_id,
                     'root_id': root_id
-                }
+                })
+        return token
             
     def request_cancel(self, user_id) -> bool:
-        """Cancel active process for the given user_id"""
-        with self.lock:
-            if user_id not in self.active_processes:
+        """Cancel active process for the given user_id (in this or any other worker)"""
+        token = self.cancel_tokens.get(user_id)
+        if token is None:
+            if self.backend.hget("active", user_id) is None:
                 return False
-                
-            # Signal cancellation
-            if user_id in self.cancel_events:
-                self.cancel_events[user_id].set()
-            
-            # Force stop the process
-            process_info = self.active_processes[user_id]
-            process_info['process'].force_stop()
-            
-            # Clean up
-            del self.active_processes[user_id]
+            # Running in another worker: its watcher cancels the job's token
+            self.backend.hset("cancel", user_id, True)
             return True
 
-    def should_cancel(self, user_id) -> bool:
-        """Check if cancellation was requested"""
+        # Signal cancellation; the token fans out to the process (force_stop)
+        self.backend.hset("cancel", user_id, True)
+        token.cancel()
+
+        # Clean up
         with self.lock:
-            event = self.cancel_events.get(user_id)
-            return event and event.is_set()
+            self.active_processes.pop(user_id, None)
+        return True
+
+    def should_cancel(self, user_id) -> bool:
+        """Check if cancellation was requested (no lock; one backend read unless already cancelled)"""
+        token = self.cancel_tokens.get(user_id)
+        if token is not None and token.cancelled:
+            return True
+        if self.backend.hget("cancel", user_id):
+            if token is not None:
+                token.cancel()
+            return True
+        return False
+
+    def watch_remote_cancels(self, interval: float = 1.0):
+        """Cancel local jobs whose cancel was requested from another worker."""
+        while True:
+            time.sleep(interval)
+            if not self.cancel_tokens:
+                continue
+            try:
+                flags = self.backend.hgetall("cancel")
+            except Exception as e:
+                print(f"Cancel watcher failed: {e}")
+                continue
+            for user_id, flag in flags.items():
+                token = self.cancel_tokens.get(user_id)
+                if flag and token is not None and not token.cancelled:
+                    token.cancel()
+
+    def claim_schedule_fire(self, key, ttl: float = 120) -> bool:
+        """
+        Debounce a schedule firing across workers: True for exactly one caller per key.
+
+        Args:
+            key: Identifies the schedule and the local minute it fires in
+            ttl: Seconds the claim is kept (longer than the firing window)
+        """
+        return self.backend.claim(f"fire:{key}", uuid.uuid4().hex, ttl)
     
     def cleanup_stale_processes(self):
         """Periodically clean up stale processes"""
@@ -104,122 +203,77 @@ class UserStateManager:
                 for user_id in stale_keys:
                     if user_id in self.active_processes:
                         del self.active_processes[user_id]
-                    if user_id in self.cancel_events:
-                        del self.cancel_events[user_id]
-    # --- persistence helpers ---
-    def _load_json(self, path):
-        if not os.path.exists(path):
-            return {}
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {}
-
-    def _save_json(self, path, data):
-        tmp = path + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        os.replace(tmp, path)
-
+                    self.cancel_tokens.pop(user_id, None)
+                    self.backend.hdel("active", user_id)
     # ---------------- Domain management ----------------
+    @property
+    def chat_domains(self) -> dict:
+        """Snapshot {chat_id: [domain, ...]} of every chat."""
+        return self.chat_config.all_domains()
+
     def add_domain(self, chat_id, domain) -> bool:
-        with self.lock:
-            cid = str(chat_id)
-            domains = self.chat_domains.setdefault(cid, [])
-            if domain in domains:
-                return False
-            domains.append(domain)
-            self._save_json(DOMAINS_FILE, self.chat_domains)
-            return True
+        return bool(self.chat_config.add_domains(chat_id, [domain]))
+
+    def add_domains(self, chat_id, domains) -> list:
+        """Add several domains in one write; return those that were new."""
+        return self.chat_config.add_domains(chat_id, domains)
 
     def remove_domain(self, chat_id, domain) -> bool:
-        with self.lock:
-            cid = str(chat_id)
-            domains = self.chat_domains.get(cid, [])
-            new_domains = [d for d in domains if d != domain]
-            if len(new_domains) == len(domains):
-                return False
-            self.chat_domains[cid] = new_domains
-            self._save_json(DOMAINS_FILE, self.chat_domains)
-            return True
+        return bool(self.chat_config.remove_domains(chat_id, [domain]))
+
+    def remove_domains(self, chat_id, domains=None) -> list:
+        """Remove several domains (all with None) in one write; return those removed."""
+        return self.chat_config.remove_domains(chat_id, domains)
 
     def get_domains(self, chat_id):
-        with self.lock:
-            return list(self.chat_domains.get(str(chat_id), []))
+        return self.chat_config.get_domains(chat_id)
 
     # ---------------- Schedule management (multi) ----------------
-    def _normalize_sched_container(self, chat_id: str):
-        cid = str(chat_id)
-        sched = self.chat_schedules.get(cid)
-        if sched is None:
-            self.chat_schedules[cid] = []
-        elif isinstance(sched, dict):
-            self.chat_schedules[cid] = [sched]
-            self._save_json(SCHEDULES_FILE, self.chat_schedules)
-        elif isinstance(sched, list):
-            pass
-        else:
-            self.chat_schedules[cid] = []
-            self._save_json(SCHEDULES_FILE, self.chat_schedules)
-
-    def _dedupe_contains(self, arr, hour: int, minute: int, tz_offset: int) -> bool:
-        for it in arr:
-            if int(it.get("hour", -1)) == hour and int(it.get("minute", -1)) == minute and int(it.get("tz_offset", 0)) == tz_offset:
-                return True
-        return False
-    
-    # def _make_label(self, hour: int, minute: int, tz_offset: int) -> str:
-    #     return f"{hour:02d}:{minute:02d}GMT{tz_offset:+d}"
+    @property
+    def chat_schedules(self) -> dict:
+        """Snapshot {chat_id: [{hour, minute, tz_offset}, ...]} of every chat."""
+        return self.chat_config.all_schedules()
 
     def add_schedule(self, chat_id, when_time, tz_offset_hours: int, allow_duplicate: bool = False) -> bool:
-        with self.lock:
-            cid = str(chat_id)
-            self._normalize_sched_container(cid)
-            arr = self.chat_schedules[cid]
-            h, m, tz = int(when_time.hour), int(when_time.minute), int(tz_offset_hours)
-            if not allow_duplicate and self._dedupe_contains(arr, h, m, tz):
-                return False
-            arr.append({"hour": h, "minute": m, "tz_offset": tz})
-            arr.sort(key=lambda x: (int(x.get("tz_offset", 0)), int(x.get("hour", 0)), int(x.get("minute", 0))))
-            self._save_json(SCHEDULES_FILE, self.chat_schedules)
-            return True
+        cid = str(chat_id)
+        if not self.chat_config.add_schedule(cid, int(when_time.hour), int(when_time.minute),
+                                             int(tz_offset_hours), allow_duplicate=allow_duplicate):
+            return False
+        self._notify_schedule_change(cid)
+        return True
 
     # Back-compat (if anything still calls set_schedule)
     def set_schedule(self, chat_id, when_time, tz_offset_hours: int):
         self.add_schedule(chat_id, when_time, tz_offset_hours, allow_duplicate=False)
 
     def remove_schedule(self, chat_id, hour: int, minute: int, tz_offset: int) -> bool:
-        with self.lock:
-            cid = str(chat_id)
-            self._normalize_sched_container(cid)
-            arr = self.chat_schedules.get(cid, [])
-            orig = len(arr)
-            self.chat_schedules[cid] = [
-                s for s in arr
-                if not (int(s.get("hour", -1)) == hour and int(s.get("minute", -1)) == minute and int(s.get("tz_offset", 0)) == tz_offset)
-            ]
-            if len(self.chat_schedules[cid]) != orig:
-                self._save_json(SCHEDULES_FILE, self.chat_schedules)
-                return True
-            return False
+        return self.remove_schedules(chat_id, [(hour, minute, tz_offset)]) > 0
+
+    def remove_schedules(self, chat_id, entries=None) -> int:
+        """Remove several (hour, minute, tz_offset) schedules (all with None) in one write; return the count."""
+        cid = str(chat_id)
+        removed = self.chat_config.remove_schedules(cid, entries)
+        if removed:
+            self._notify_schedule_change(cid)
+        return removed
+
+    def _notify_schedule_change(self, chat_id):
+        for listener in self.schedule_listeners:
+            try:
+                listener(chat_id)
+            except Exception as e:
+                print(f"Schedule listener failed: {e}")
 
     def get_schedule(self, chat_id):
-        with self.lock:
-            cid = str(chat_id)
-            self._normalize_sched_container(cid)
-            arr = self.chat_schedules.get(cid, [])
-            if not arr:
-                return None
-            if len(arr) == 1:
-                return arr[0]
-            return list(arr)
+        arr = self.chat_config.get_schedules(chat_id)
+        if not arr:
+            return None
+        if len(arr) == 1:
+            return arr[0]
+        return arr
 
     def get_schedules(self, chat_id):
-        with self.lock:
-            cid = str(chat_id)
-            self._normalize_sched_container(cid)
-            return list(self.chat_schedules.get(cid, []))
+        return self.chat_config.get_schedules(chat_id)
         
 # Shared instance
 state_manager = UserStateManager()
\ No newline at end of file
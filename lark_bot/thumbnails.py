@@ -0,0 +1,127 @@
+"""
+Thumbnail encoding and the process pool it runs on.
+
+Pool workers start from forkserver/spawn and import this module to unpickle
+make_thumbnail, so it must stay free of import-time side effects: no state
+manager, scheduler or network clients, only PIL.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# Upper bound on thumbnail worker processes, shared by every search in the process
+_CPU_POOL_MAX_WORKERS = 4
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+_cpu_pool_lock = threading.Lock()
+
+def make_thumbnail(raw: bytes,
+                   image_size: Tuple[int, int],
+                   fmt: str = "PNG",
+                   quality: int = 85) -> Optional[bytes]:
+    """
+    Decode, resize and re-encode one image. CPU-bound; safe to run in a worker process.
+
+    Args:
+        raw: Original image bytes
+        image_size: Bounding box (width, height) for the thumbnail
+        fmt: Output format - "PNG", "JPEG" or "WEBP"
+        quality: Encoder quality for JPEG/WEBP (ignored for PNG)
+
+    Returns:
+        Encoded thumbnail bytes, or None if the image could not be decoded
+    """
+    fmt = fmt.upper()
+    try:
+        with Image.open(BytesIO(raw)) as img:
+            if img.format == "JPEG":
+                # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full size
+                img.draft("RGB", image_size)
+            if img.mode in ('RGBA', 'LA', 'P') or (fmt == "JPEG" and img.mode != "RGB"):
+                img = img.convert('RGB')
+
+            img.thumbnail(image_size, Image.Resampling.LANCZOS)
+
+            with BytesIO() as buffer:
+                if fmt == "PNG":
+                    img.save(buffer, format="PNG", optimize=True)
+                else:
+                    img.save(buffer, format=fmt, quality=quality)
+                return buffer.getvalue()
+    except Exception:
+        return None
+
+def get_cpu_pool() -> ProcessPoolExecutor:
+    """
+    The process pool for thumbnail work, created on first use.
+
+    Workers come from a forkserver (spawn where unavailable) rather than fork,
+    so they never inherit the bot's threads, locks or open sockets.
+    """
+    global _cpu_pool
+    with _cpu_pool_lock:
+        if _cpu_pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _cpu_pool = ProcessPoolExecutor(
+                max_workers=max(1, min(os.cpu_count() or 1, _CPU_POOL_MAX_WORKERS)),
+                mp_context=multiprocessing.get_context(method),
+            )
+        return _cpu_pool
+
+def _reset_cpu_pool(broken: ProcessPoolExecutor):
+    """Forget `broken` (it shuts itself down) so the next get_cpu_pool() starts a fresh one."""
+    global _cpu_pool
+    with _cpu_pool_lock:
+        if _cpu_pool is broken:
+            _cpu_pool = None
+
+def submit_thumbnail(raw: bytes,
+                     image_size: Tuple[int, int],
+                     fmt: str = "PNG",
+                     quality: int = 85) -> Future:
+    """
+    make_thumbnail on the shared pool; the future resolves to the bytes or None.
+
+    A worker that dies (OOM, a crash inside a decoder) breaks the whole pool.
+    The broken pool is then replaced for later calls: a failed submit is
+    retried once on the new pool, and a resize lost with the old one is
+    redone inline.
+    """
+    args = (raw, image_size, fmt, quality)
+    out = Future()
+    for _ in range(2):
+        pool = get_cpu_pool()
+        try:
+            resize = pool.submit(make_thumbnail, *args)
+            break
+        except BrokenProcessPool:
+            _reset_cpu_pool(pool)
+    else:
+        out.set_result(make_thumbnail(*args))
+        return out
+
+    def finish(f: Future):
+        if f.cancelled():
+            out.set_result(None)
+        elif isinstance(f.exception(), BrokenProcessPool):
+            _reset_cpu_pool(pool)
+            out.set_result(make_thumbnail(*args))
+        else:
+            out.set_result(None if f.exception() else f.result())
+
+    resize.add_done_callback(finish)
+    return out
+
+@atexit.register
+def _shutdown_cpu_pool():
+    global _cpu_pool
+    with _cpu_pool_lock:
+        pool, _cpu_pool = _cpu_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from .config import WEBHOOK_WORKERS, WEBHOOK_MAX_QUEUE
+
+logger = logging.getLogger(__name__)
+
+class ChatWorkerPool:
+    """
+    Bounded executor for inbound webhook events.
+
+    A fixed set of worker threads serves one FIFO lane per chat, so messages
+    from the same chat are handled in arrival order while different chats
+    run in parallel. At most `max_queue` events may wait; submit() returns
+    False beyond that so the caller can answer "busy" instead of spawning
+    more threads. Queue wait and handler time are kept for the last
+    `window` events.
+    """
+
+    def __init__(self, workers: int = WEBHOOK_WORKERS, max_queue: int = WEBHOOK_MAX_QUEUE,
+                 window: int = 1000):
+        """
+        Args:
+            workers: Handler threads
+            max_queue: Events allowed to wait before submit() refuses new ones
+            window: Recent events kept for the latency stats
+        """
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._lanes = {}        # chat -> deque[(fn, args, enqueued_at)]
+        self._ready = deque()
+        self._busy = set()
+        self._queued = 0
+        self._rejected = 0
+        self._waits = deque(maxlen=window)
+        self._runs = deque(maxlen=window)
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._worker, daemon=True, name=f"webhook-{i}")
+            for i in range(max(1, workers))
+        ]
+        for t in self._workers:
+            t.start()
+
+    def submit(self, chat_id, fn, *args) -> bool:
+        """Queue fn(*args) on chat_id's lane; False if the pool is full or closed."""
+        with self._cond:
+            if self._closed or self._queued >= self.max_queue:
+                self._rejected += 1
+                return False
+            lane = self._lanes.setdefault(chat_id, deque())
+            lane.append((fn, args, time.perf_counter()))
+            self._queued += 1
+            if chat_id not in self._busy and len(lane) == 1:
+                self._ready.append(chat_id)
+                self._cond.notify()
+            return True
+
+    def stats(self) -> dict:
+        """Queue depth, rejections and p50/p95 queue-wait / handler time in ms."""
+        with self._cond:
+            waits, runs = sorted(self._waits), sorted(self._runs)
+            out = {"queued": self._queued, "running": len(self._busy),
+                   "rejected": self._rejected, "handled": len(runs)}
+        for name, samples in (("wait", waits), ("handler", runs)):
+            for label, q in (("p50", 0.50), ("p95", 0.95)):
+                value = samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+                out[f"{name}_{label}_ms"] = round(value * 1000, 1)
+        return out
+
+    def close(self, wait: bool = True):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._workers:
+                t.join()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._closed:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                chat_id = self._ready.popleft()
+                self._busy.add(chat_id)
+                fn, args, enqueued_at = self._lanes[chat_id].popleft()
+                self._queued -= 1
+
+            started = time.perf_counter()
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"Webhook handler for chat {chat_id} failed: {e}")
+            finished = time.perf_counter()
+
+            with self._cond:
+                self._waits.append(started - enqueued_at)
+                self._runs.append(finished - started)
+                self._busy.discard(chat_id)
+                if self._lanes[chat_id]:
+                    self._ready.append(chat_id)
+                    self._cond.notify()
+                else:
+                    del self._lanes[chat_id]
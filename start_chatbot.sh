@@ -6,7 +6,20 @@ VENV_DIR="$APP_DIR/venv"
 LOG_DIR="$APP_DIR/logs"
 BOT_LOG="$LOG_DIR/bot.log"
 CLOUDFLARED_LOG="$LOG_DIR/cloudflared.log"
-GUNICORN_CMD="gunicorn -w 1 -b 0.0.0.0:5000 --timeout 120 --log-level info main_app:app"
+# More than one worker needs a shared STATE_BACKEND (sqlite:///... or redis://...)
+WORKERS="${WORKERS:-1}"
+if [ "$WORKERS" -gt 1 ] && [ "${STATE_BACKEND:-memory}" = "memory" ]; then
+    echo "WORKERS=$WORKERS requires STATE_BACKEND=sqlite:///... or redis://..." >&2
+    exit 1
+fi
+GUNICORN_CMD="gunicorn -w $WORKERS -b 0.0.0.0:5000 --timeout 120 --log-level info main_app:create_app()"
+ASYNC_CMD="python async_app.py --host 0.0.0.0 --port 5000"
+# SERVER=async runs the aiohttp entry point instead of Flask under gunicorn
+if [ "${SERVER:-gunicorn}" = "async" ]; then
+    BOT_CMD="$ASYNC_CMD"
+else
+    BOT_CMD="$GUNICORN_CMD"
+fi
 CLOUDFLARED_CMD="cloudflared tunnel --config /home/ubuntu/.cloudflared/config.yml run kzg-chat"
 
 # Setup environment
@@ -29,21 +42,23 @@ source "$VENV_DIR/bin/activate" || { echo "Failed to activate virtualenv"; exit
 
 # Kill old processes more reliably
 echo "Stopping existing processes..."
-pkill -f "$GUNICORN_CMD" || true
+# Match stable patterns: the full commands embed settings (e.g. -w $WORKERS) that may have changed
+pkill -f "main_app:create_app" || true
+pkill -f "async_app.py" || true
 pkill -f "$CLOUDFLARED_CMD" || true
 
 # Wait for ports to free up
 
-# Start Gunicorn with more verbose logging
-echo "Starting Gunicorn..."
-nohup $GUNICORN_CMD >> "$BOT_LOG" 2>&1 &
+# Start the bot server with more verbose logging
+echo "Starting bot server: $BOT_CMD"
+nohup $BOT_CMD >> "$BOT_LOG" 2>&1 &
 GUNICORN_PID=$!
-echo "Gunicorn started with PID $GUNICORN_PID"
+echo "Bot server started with PID $GUNICORN_PID"
 
 # Verify Gunicorn started properly
 sleep 10  # Increased wait time
 if ! ps -p $GUNICORN_PID > /dev/null; then
-    echo "Error: Gunicorn failed to start!" >&2
+    echo "Error: Bot server failed to start!" >&2
     echo "Last 20 lines of log:" >&2
     tail -n 20 "$BOT_LOG" >&2
     exit 1
@@ -0,0 +1,62 @@
+import time
+
+from lark_bot.file_processor import pack_media_parts
+from lark_bot.lark_api import LarkAPI, FileKeyCache
+
+
+class _StaticTokens:
+    expires_at = float("inf")
+
+    def token(self):
+        return "t-test"
+
+    def refresh(self, stale=None):
+        return "t-test"
+
+
+def _build(prefix):
+    blobs = [(1, "https://cdn.example/a.jpg", b"a" * 4096), (2, "https://cdn.example/b.mp4", b"b" * 8192)]
+    return pack_media_parts(blobs, col="ad_url", zip_basename_prefix=prefix)
+
+
+def _api(uploads):
+    api = LarkAPI(base_url="http://127.0.0.1:9/open-apis", token_provider=_StaticTokens(),
+                  file_keys=FileKeyCache(path=None))
+
+    def fake_upload(stream, filename, content_type):
+        uploads.append(filename)
+        return f"file_key_{len(uploads)}"
+
+    api._upload_im_file = fake_upload
+    return api
+
+
+def test_rebuilt_media_zip_reuses_file_key(monkeypatch):
+    uploads = []
+    api = _api(uploads)
+
+    # Two runs of the same search a day apart; process_search_async names parts after the search term only
+    [(name1, part1)] = _build("shop-com")
+    real_time = time.time
+    monkeypatch.setattr(time, "time", lambda: real_time() + 86400)
+    [(name2, part2)] = _build("shop-com")
+
+    assert name1 == name2 == "shop-com_ad_url_media_part1.zip"
+    assert part1.getvalue() == part2.getvalue()
+    assert api.upload_file(part1, name1, "application/zip") == ("file", "file_key_1")
+    assert api.upload_file(part2, name2, "application/zip") == ("file", "file_key_1")
+    assert uploads == [name1]
+
+
+def test_same_bytes_under_another_name_are_uploaded_again():
+    uploads = []
+    api = _api(uploads)
+
+    [(name1, part1)] = _build("shop-com")
+    [(name2, part2)] = _build("other-com")
+
+    assert part1.getvalue() == part2.getvalue()
+    assert api.upload_file(part1, name1, "application/zip") == ("file", "file_key_1")
+    # A reused key would show up in chat under the first upload's name
+    assert api.upload_file(part2, name2, "application/zip") == ("file", "file_key_2")
+    assert uploads == [name1, name2]
@@ -0,0 +1,27 @@
+import os
+import signal
+from io import BytesIO
+
+from PIL import Image
+
+from lark_bot import thumbnails
+
+
+def _png(size=(300, 200)):
+    buf = BytesIO()
+    Image.new("RGB", size, "red").save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_dead_worker_does_not_break_later_thumbnails():
+    raw = _png()
+    assert thumbnails.submit_thumbnail(raw, (100, 100)).result(timeout=60)
+
+    pool = thumbnails.get_cpu_pool()
+    for pid in list(pool._processes):
+        os.kill(pid, signal.SIGKILL)
+
+    # The resize caught by the crash is redone inline, later ones get a fresh pool
+    for _ in range(3):
+        assert thumbnails.submit_thumbnail(raw, (100, 100)).result(timeout=60)
+    assert thumbnails.get_cpu_pool() is not pool
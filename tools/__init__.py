@@ -1,2 +1,2 @@
-from .fb_scrape_bot import FacebookAdsCrawler
+from .fb_scrape_bot import FacebookAdsCrawler, prewarm_crawl
 from .interactive_card_library import *
\ No newline at end of file
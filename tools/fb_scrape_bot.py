@@ -10,8 +10,10 @@ from selenium.common.exceptions import TimeoutException
 
 from selenium.webdriver.chrome.service import Service
 
-from lark_bot import LarkAPI
-from lark_bot.state_managers import state_manager
+from lark_bot import LarkAPI, get_dispatcher
+from lark_bot.state_managers import state_manager, CancelToken
+from lark_bot.config import (CRAWL_LEASE_TTL, CRAWL_ESTIMATE_SECONDS, PREWARM_BROWSERS, PREWARM_DRIVER_TTL,
+                             ADVERTISER_LIST_TTL)
 from .interactive_card_library import *
 
 import logging
@@ -21,7 +23,7 @@ import pandas as pd
 # from datetime import datetime
 import time
 import threading
-import queue
+import uuid
 # import requests
 from selenium_stealth import stealth
 # import io
@@ -35,6 +37,9 @@ logger = logging.getLogger(__name__)
 import os
 import zipfile
 
+# Advertiser list CSVs refreshed by prewarm_crawl: path -> {at, mtime}
+WARMED_LISTS = "warmed_advertiser_lists"
+
 PROXY_STRING = "r_f0752d77b7:aab4b4ed1c:v2.proxyempire.io:5000"
 
 def create_proxy_extension(host, port, user, pw, file_path):
@@ -97,86 +102,242 @@ def create_proxy_extension(host, port, user, pw, file_path):
     
     return file_path
 
+def launch_driver():
+    """Start a headless Chrome with the crawler's options (and stealth patches)."""
+    options = Options()
+    logger.info("✅ Initialize Success.")
+    # --- Essential EC2/Headless Options ---
+    options.add_argument("--headless=new")      # 必須 for server
+    options.add_argument("--no-sandbox")        # 必須 for Linux environments (like EC2/Docker)
+    options.add_argument("--disable-dev-shm-usage") # 必須 for Linux environments (like EC2/Docker)
+    options.add_argument("--disable-gpu")       # Often recommended with headless
+
+    # --- Stability & Resource Options ---
+    options.add_argument("--disable-extensions") # Temporarily disable extensions to isolate the issue. Enable later if needed.
+    options.add_argument("--disable-infobars")
+    options.add_argument("--disable-features=TranslateUI") # Minor optimization
+    options.add_argument("--mute-audio")          # Minor optimization
+
+    # options.add_argument("--blink-settings=imagesEnabled=false") # Keep commented initially, enable if needed
+
+    # --- Optionally limit logs ---
+    # options.add_argument("--log-level=3")
+    # options.add_experimental_option("excludeSwitches", ["enable-logging"])
+    # user, pw, host, port = PROXY_STRING.split(":")
+    # print(user, pw, host ,port)
+    # options.add_argument(f"--proxy-server=http://{user}:{pw}@{host}:{port}")
+
+    service = Service()
+    driver = webdriver.Chrome(service=service, options=options)
+    logger.info("✅ Finished Initialized.")
+
+    # (Tuỳ chọn) stealth để tránh bị phát hiện tự động hoá
+    try:
+        stealth(driver,
+                languages=["en-US", "en"],
+                vendor="Google Inc.",
+                platform="Win32",
+                webgl_vendor="Intel Inc.",
+                renderer="Intel Iris OpenGL Engine",
+                fix_hairline=True)
+    except Exception:
+        pass
+
+    # --- CRUCIAL: Add Timeouts ---
+    # driver.set_page_load_timeout(30)
+    # driver.implicitly_wait(5)
+    return driver
+
+class WarmDriverPool:
+    """
+    Chrome instances started ahead of scheduled crawls.
+
+    initialize_driver() takes one instead of launching Chrome; drivers not
+    taken within `ttl` seconds are quit so an unused warm-up costs nothing
+    for long.
+    """
+
+    def __init__(self, ttl: float = PREWARM_DRIVER_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._drivers = []            # (driver, expires_at), oldest first
+
+    def __len__(self):
+        with self._lock:
+            return len(self._drivers)
+
+    def put(self, driver):
+        with self._lock:
+            self._drivers.append((driver, time.time() + self.ttl))
+        timer = threading.Timer(self.ttl + 1, self._expire)
+        timer.daemon = True
+        timer.start()
+
+    def take(self):
+        """Return a live warm driver, or None."""
+        self._expire()
+        while True:
+            with self._lock:
+                if not self._drivers:
+                    return None
+                driver, _ = self._drivers.pop(0)
+            try:
+                driver.current_url  # Chrome may have died while idle
+                return driver
+            except Exception:
+                self._quit(driver)
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [d for d, expires_at in self._drivers if expires_at <= now]
+            self._drivers = [(d, e) for d, e in self._drivers if e > now]
+        for driver in expired:
+            self._quit(driver)
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f"Error while quitting warm WebDriver: {e}")
+
+warm_drivers = WarmDriverPool()
+
 class CrawlerQueue:
+    """
+    One-crawl-at-a-time queue shared by every worker process.
+
+    The order of waiting requests and the "crawl slot" live in the state
+    backend; each process only runs the crawlers it created. A heartbeat
+    thread renews this process's slot and queue entries, and drops entries
+    whose worker stopped renewing them so a dead worker cannot block the queue.
+    """
     _instance = None
     _lock = threading.Lock()
+    QUEUE = "crawl_queue"
+    SLOT = "crawl_slot"
+    STATS = "crawl_stats"
     
     def __new__(cls):
         with cls._lock:
             if cls._instance is None:
                 cls._instance = super().__new__(cls)
-                cls._instance.queue = queue.Queue()
-                cls._instance.active = False
+                cls._instance.backend = state_manager.backend
+                cls._instance.local = {}          # chat_id -> crawler queued in this process
+                cls._instance.slot_owner = None   # lease owner while this process runs a crawl
                 cls._instance.current_chat_id = None
-                cls._instance.queue_list = []  # Thêm list để track thứ tự
+                threading.Thread(target=cls._instance._heartbeat, daemon=True,
+                                 name="crawl-queue-heartbeat").start()
         return cls._instance
+
+    @property
+    def active(self):
+        return self.backend.holder(self.SLOT) is not None
+
+    @property
+    def queue_list(self):
+        return self.backend.qitems(self.QUEUE)
     
     def add_request(self, crawler):
         """Thêm yêu cầu vào hàng đợi"""
         with self._lock:
-            self.queue.put(crawler)
-            self.queue_list.append(crawler.chat_id)  # Track thứ tự
+            self.local[crawler.chat_id] = crawler
+            self.backend.claim(f"crawl_waiter:{crawler.chat_id}", str(os.getpid()), CRAWL_LEASE_TTL)
+            self.backend.qpush(self.QUEUE, crawler.chat_id)  # Track thứ tự
             
             # Gửi message về vị trí trong queue
             position = len(self.queue_list)
-            if self.active:
-                # Nếu đang có request chạy, vị trí sẽ là position + 1 (vì có 1 đang chạy)
-                # crawler.lark_api.reply_to_message(
-                #     crawler.message_id,
-                #     f"⏳ You’re queued at spot #{position}. I’ll ping you when it starts."
-                # )
-                crawler.lark_api.update_card_message(crawler.message_id, 
+            # Decided from shared state: another worker may hold the slot or have requests ahead of ours
+            if self.active or position > 1:
+                crawler.outbox.update_card(crawler.lark_api, crawler.message_id,
                                         card= queue_card(search_word= crawler.keyword,
-                                         position= position)
+                                         position= position),
+                                        chat=crawler.lark_chat_id
                                          )
         
-        if not self.active:
-            self._process_next()
+        self._process_next()
 
     def _process_next(self):
-        """Xử lý yêu cầu tiếp theo trong hàng đợi"""
+        """Xử lý yêu cầu tiếp theo trong hàng đợi (nếu nó thuộc process này)"""
         with self._lock:
-            if not self.queue.empty():
-                self.active = True
-                next_crawler = self.queue.get()
-                self.current_chat_id = next_crawler.chat_id
-                
-                # Remove từ queue_list
-                if next_crawler.chat_id in self.queue_list:
-                    self.queue_list.remove(next_crawler.chat_id)
-                
-                # Update position cho các request còn lại
-                self._update_queue_positions()
-                
-                # Tạo thread mới để chạy crawler
-                threading.Thread(
-                    target=self._run_crawler, 
-                    args=(next_crawler,),
-                    daemon=True
-                ).start()
-            else:
-                self.active = False
-                self.current_chat_id = None
+            if self.slot_owner is not None:
+                return
+            pending = self.queue_list
+            if not pending:
+                return
+            head = pending[0]
+            next_crawler = self.local.get(head)
+            if next_crawler is None:
+                # Another worker's request; it starts it from its own heartbeat
+                return
+            owner = f"{head}|{uuid.uuid4().hex}"
+            if not self.backend.claim(self.SLOT, owner, CRAWL_LEASE_TTL):
+                return
+            self.slot_owner = owner
+            self.current_chat_id = head
+            self.backend.qremove(self.QUEUE, head)
+            self.backend.release(f"crawl_waiter:{head}", str(os.getpid()))
+            del self.local[head]
+            
+            # Update position cho các request còn lại
+            self._update_queue_positions()
+            
+            # Tạo thread mới để chạy crawler
+            threading.Thread(
+                target=self._run_crawler, 
+                args=(next_crawler,),
+                daemon=True
+            ).start()
+
+    def _heartbeat(self):
+        """Renew this process's leases, drop orphaned entries and start our turn when it comes."""
+        pid = str(os.getpid())
+        while True:
+            time.sleep(max(1, CRAWL_LEASE_TTL // 10))
+            try:
+                with self._lock:
+                    if self.slot_owner is not None:
+                        self.backend.claim(self.SLOT, self.slot_owner, CRAWL_LEASE_TTL)
+                    for chat_id in list(self.local):
+                        self.backend.claim(f"crawl_waiter:{chat_id}", pid, CRAWL_LEASE_TTL)
+                    if self.backend.holder(self.SLOT) is None:
+                        for chat_id in self.queue_list:
+                            if chat_id in self.local or self.backend.holder(f"crawl_waiter:{chat_id}"):
+                                break
+                            logger.warning(f"Dropping orphaned queue entry {chat_id}")
+                            self.backend.qremove(self.QUEUE, chat_id)
+                self._process_next()
+            except Exception as e:
+                logger.warning(f"Crawl queue heartbeat failed: {e}")
     
     def _update_queue_positions(self):
         """Cập nhật và thông báo vị trí mới cho các request trong queue"""
         for i, chat_id in enumerate(self.queue_list, 1):
-            # Tìm crawler tương ứng trong queue để gửi message
-            temp_queue = list(self.queue.queue)
-            for crawler in temp_queue:
-                if crawler.chat_id == chat_id:
-                    # crawler.lark_api.reply_to_message(
-                    #     crawler.message_id,
-                    #     f"📍 Current position in queue: #{i}"
-                    # )
-                    crawler.lark_api.update_card_message(crawler.message_id, 
-                        card= queue_card(search_word= crawler.keyword,
-                            position= i)
-                            )
-                    break
+            crawler = self.local.get(chat_id)
+            if crawler is not None:
+                crawler.outbox.update_card(crawler.lark_api, crawler.message_id,
+                    card= queue_card(search_word= crawler.keyword,
+                        position= i),
+                    chat=crawler.lark_chat_id
+                        )
     
+    def average_crawl_seconds(self) -> float:
+        """Moving average of finished crawl durations, shared by all workers."""
+        return self.backend.hget(self.STATS, "avg_seconds", CRAWL_ESTIMATE_SECONDS)
+
+    def estimated_drain_seconds(self, extra_items: int = 0) -> float:
+        """Seconds until the running crawl, the queue and `extra_items` more crawls are done."""
+        items = len(self.queue_list) + (1 if self.active else 0) + extra_items
+        return items * self.average_crawl_seconds()
+
+    def _record_duration(self, seconds: float):
+        avg = self.average_crawl_seconds()
+        self.backend.hset(self.STATS, "avg_seconds", round(0.8 * avg + 0.2 * seconds, 1))
+
     def _run_crawler(self, crawler):
         """Chạy crawler và xử lý yêu cầu tiếp theo khi hoàn thành"""
+        started = time.time()
         try:
             
             crawler.crawl()  # Gọi phương thức crawl chính
@@ -189,45 +350,39 @@ class CrawlerQueue:
                 
         except Exception as e:
             if not crawler.should_stop():
-                crawler.lark_api.reply_to_message(
-                    crawler.message_id, 
-                    f"❌ Error during processing: {str(e)}"
+                crawler.outbox.reply(
+                    crawler.lark_api, crawler.message_id,
+                    f"❌ Error during processing: {str(e)}",
+                    chat=crawler.lark_chat_id
                 )
         finally:
+            if not crawler.should_stop():
+                # Cancelled crawls end early and would skew the estimate
+                self._record_duration(time.time() - started)
             with self._lock:
-                self.active = False
+                self.backend.release(self.SLOT, self.slot_owner)
+                self.slot_owner = None
                 self.current_chat_id = None
             self._process_next()  # Xử lý yêu cầu tiếp theo
     
     def get_queue_position(self, chat_id):
         """Kiểm tra vị trí trong hàng đợi"""
-        with self._lock:
-            if self.current_chat_id == chat_id:
-                return 0  # Đang chạy
-            
-            try:
-                position = self.queue_list.index(chat_id) + 1
-                return position
-            except ValueError:
-                return None  # Không có trong hàng đợi
+        holder = self.backend.holder(self.SLOT)
+        if holder is not None and holder.split("|", 1)[0] == str(chat_id):
+            return 0  # Đang chạy
+        
+        try:
+            position = self.queue_list.index(chat_id) + 1
+            return position
+        except ValueError:
+            return None  # Không có trong hàng đợi
     
     def remove_from_queue(self, chat_id):
         """Remove request khỏi queue khi bị cancel"""
         with self._lock:
-            # Remove từ queue_list
-            if chat_id in self.queue_list:
-                self.queue_list.remove(chat_id)
-            
-            # Remove từ queue (phức tạp hơn vì queue.Queue không support remove trực tiếp)
-            temp_items = []
-            while not self.queue.empty():
-                item = self.queue.get()
-                if item.chat_id != chat_id:
-                    temp_items.append(item)
-            
-            # Put lại các items không bị remove
-            for item in temp_items:
-                self.queue.put(item)
+            self.backend.qremove(self.QUEUE, chat_id)
+            self.local.pop(chat_id, None)
+            self.backend.release(f"crawl_waiter:{chat_id}", str(os.getpid()))
             
             # Update positions cho các request còn lại
             self._update_queue_positions()
@@ -238,22 +393,47 @@ class FacebookAdsCrawler:
     _LIBRARY_ID_PATTERN = re.compile(r'Library ID:\s*(\d+)')
     _DATE_PATTERN = re.compile(r'\b\d{1,2}\s\w{3}\s\d{4}\b')
 
+    FINAL_COLUMNS = [
+        "library_id",
+        "ad_start_date",
+        "company",
+        "pixel_id",
+        "destination_url",
+        "ad_type",
+        "ad_url",
+        "thumbnail_url",
+        "primary_text",     # 👈 now placed here
+        "headline_text"     # 👈 now placed here
+        ]
+
     def __init__(self, keyword, chat_id, message_id = False):
         self.keyword = keyword
         self.ad_card_class = "x1plvlek xryxfnj x1gzqxud x178xt8z x1lun4ml xso031l xpilrb4 xb9moi8 xe76qn7 x21b0me x142aazg x1i5p2am x1whfx0g xr2y4jy x1ihp6rs x1kmqopl x13fuv20 x18b5jzi x1q0q8m5 x1t7ytsu x9f619"
         self.driver = None
         self.ads_data = []
         self.lark_api = LarkAPI()
+        # Chat I/O goes through the shared dispatcher so crawl threads never block on Lark
+        self.outbox = get_dispatcher()
+        # Queue key: the job's card message id (unique per job), not the Lark chat id
         self.chat_id = message_id
-        self._stop_event = threading.Event()
+        # The Lark chat itself: the dispatcher lane that orders and rate-limits this chat's messages
+        self.lark_chat_id = chat_id
+        # Created once per job; request_cancel() (in any worker) and force_stop() set it
+        self.cancel_token = CancelToken()
         self.queue_manager = CrawlerQueue()  # Thêm dòng này
         self.message_id = message_id
         self.user_data_dir = None
+        # Called with each ad record as soon as it is scraped (e.g. MediaPrefetcher.feed_ad)
+        self.ad_listeners = []
+        # Called with (idx, total, page_name) after each advertiser page is scraped
+        self.advertiser_listeners = []
 
     def force_stop(self):
         """More reliable stopping mechanism"""
         print(f"🛑 Force stopping crawler for {self.chat_id}")
-        self._stop_event.set()
+        self.cancel_token.cancel()
+        # A job still waiting for its turn leaves the queue right away
+        self.queue_manager.remove_from_queue(self.chat_id)
         try:
             if self.driver:
                 self.driver.quit()
@@ -262,57 +442,20 @@ class FacebookAdsCrawler:
             print(f"Error during force stop: {e}")
 
     def should_stop(self):
-        """Check if we should stop (either internal or external cancellation)"""
-        return self._stop_event.is_set() or state_manager.should_cancel(self.chat_id)
+        """Check if we should stop (either internal or external cancellation); lock-free"""
+        return self.cancel_token.cancelled
     
     def initialize_driver(self):
         """Initializes the driver using a specific Chrome profile and adds timeouts."""
         if self.should_stop():
             return False
 
-        options = Options()
-        logger.info("✅ Initialize Success.")
-        # --- Essential EC2/Headless Options ---
-        options.add_argument("--headless=new")      # 必須 for server
-        options.add_argument("--no-sandbox")        # 必須 for Linux environments (like EC2/Docker)
-        options.add_argument("--disable-dev-shm-usage") # 必須 for Linux environments (like EC2/Docker)
-        options.add_argument("--disable-gpu")       # Often recommended with headless
-
-        # --- Stability & Resource Options ---
-        options.add_argument("--disable-extensions") # Temporarily disable extensions to isolate the issue. Enable later if needed.
-        options.add_argument("--disable-infobars")
-        options.add_argument("--disable-features=TranslateUI") # Minor optimization
-        options.add_argument("--mute-audio")          # Minor optimization
-    
-        # options.add_argument("--blink-settings=imagesEnabled=false") # Keep commented initially, enable if needed
-
-        # --- Optionally limit logs ---
-        # options.add_argument("--log-level=3")
-        # options.add_experimental_option("excludeSwitches", ["enable-logging"])
-        # user, pw, host, port = PROXY_STRING.split(":")
-        # print(user, pw, host ,port)
-        # options.add_argument(f"--proxy-server=http://{user}:{pw}@{host}:{port}")
-
-        service = Service()
-        self.driver = webdriver.Chrome(service=service, options=options)
-        logger.info("✅ Finished Initialized.")
-
-        # (Tuỳ chọn) stealth để tránh bị phát hiện tự động hoá
-        try:
-            stealth(self.driver,
-                    languages=["en-US", "en"],
-                    vendor="Google Inc.",
-                    platform="Win32",
-                    webgl_vendor="Intel Inc.",
-                    renderer="Intel Iris OpenGL Engine",
-                    fix_hairline=True)
-        except Exception:
-            pass
-
-        # --- CRUCIAL: Add Timeouts ---
-        # self.driver.set_page_load_timeout(30)
-        # self.driver.implicitly_wait(5)
-
+        # A browser started ahead of a scheduled batch skips Chrome start-up and DNS/TLS set-up
+        self.driver = warm_drivers.take()
+        if self.driver is not None:
+            logger.info("✅ Using pre-warmed WebDriver.")
+            return True
+        self.driver = launch_driver()
         print("\n✅ Driver initialized successfully.")
         return True
 
@@ -326,9 +469,10 @@ class FacebookAdsCrawler:
             if position == 0:
                 return
             else:
-                self.lark_api.reply_to_message(
-                    self.message_id,
-                    f"⏳ Your request is in waiting list (No #{position})"
+                self.outbox.reply(
+                    self.lark_api, self.message_id,
+                    f"⏳ Your request is in waiting list (No #{position})",
+                    chat=self.lark_chat_id
                 )
             return
         
@@ -358,10 +502,12 @@ class FacebookAdsCrawler:
         except TimeoutException:
             print("❌ Timed out waiting for initial ads. The page may be empty or the selector is wrong.")
             return False
-    def get_dim_keyword(self) -> pd.DataFrame:
+    def get_dim_keyword(self, refresh: bool = False) -> pd.DataFrame:
         """
-        If a dim_keyword CSV exists for this search word, read it.
-        Otherwise, open the page, open Filters → Advertisers, scroll all, save CSV, and return it.
+        If the pre-fire warm-up scraped this search word's dim_keyword CSV less than
+        ADVERTISER_LIST_TTL ago, read it. Otherwise (or with refresh=True), open
+        Filters → Advertisers, scroll all, save CSV, and return it.
+        Expects the search page to be open already (fetch_ads_page).
         """
         # Try both naming styles (you mentioned ".com" in the key)
         # csv_candidates = [
@@ -389,12 +535,27 @@ class FacebookAdsCrawler:
         # print("DONE GET URL")
         # time.sleep(1)
 
-        dim_keyword = self.scrape_advertiser_list_from_filters()
         out_path = f"ref_data//dim_keyword_{self.keyword}.csv"
+        # Only lists the warm-up recorded are reused; a file's mtime alone says nothing
+        # (a checkout or deploy makes committed lists look new)
+        warmed = state_manager.backend.hget(WARMED_LISTS, out_path)
+        if (not refresh and ADVERTISER_LIST_TTL > 0 and warmed and os.path.exists(out_path)
+                and os.path.getmtime(out_path) == warmed["mtime"]
+                and time.time() - warmed["at"] < ADVERTISER_LIST_TTL):
+            dim_keyword = pd.read_csv(out_path, dtype=str)
+            if not dim_keyword.empty:
+                print(f"✅ Using cached advertiser list {out_path}")
+                return dim_keyword
+
+        dim_keyword = self.scrape_advertiser_list_from_filters()
 
         os.makedirs(os.path.dirname(out_path), exist_ok=True) # Đảm bảo thư mục tồn tại
         dim_keyword.to_csv(out_path, index=False)
         print(f"✅ Saved new advertiser list to {out_path}")
+        if refresh:
+            # The file's mtime ties the record to this host's copy
+            state_manager.backend.hset(WARMED_LISTS, out_path,
+                                       {"at": time.time(), "mtime": os.path.getmtime(out_path)})
         
         return dim_keyword
     
@@ -465,9 +626,10 @@ class FacebookAdsCrawler:
         self.driver.get(url)
         print("Search for:", search_word)
         if not self.should_stop():
-            self.lark_api.update_card_message(
-                self.message_id,
-                card=domain_processing_card(search_word=self.keyword, progress_percent=10)
+            self.outbox.update_card(
+                self.lark_api, self.message_id,
+                card=domain_processing_card(search_word=self.keyword, progress_percent=10),
+                chat=self.lark_chat_id
             )
 
         try:
@@ -492,6 +654,11 @@ class FacebookAdsCrawler:
             if ad_data:
                 ad_data["ad_number"] = len(self.ads_data) + 1
                 self.ads_data.append(ad_data)
+                for listener in self.ad_listeners:
+                    try:
+                        listener(ad_data)
+                    except Exception as e:
+                        logger.warning(f"[{self.chat_id}] Ad listener failed: {e}")
 
     def scroll_to_bottom(self):
         """
@@ -841,12 +1008,12 @@ class FacebookAdsCrawler:
                 # Slight progress feedback via your Lark card (optional)
                 pct = int(10 + 60 * idx / max(1, total_ids))  # 10→70%
                 try:
-                    # Reducing frequency of updates slightly to avoid rate limiting
-                    if idx % 5 == 0 or idx == total_ids:
-                         self.lark_api.update_card_message(
-                            self.message_id,
-                            card=domain_processing_card(search_word=self.keyword, progress_percent=pct)
-                        )
+                    # Queued, not sent inline: pending updates coalesce and are rate limited
+                    self.outbox.update_card(
+                        self.lark_api, self.message_id,
+                        card=domain_processing_card(search_word=self.keyword, progress_percent=pct),
+                        chat=self.lark_chat_id
+                    )
                 except Exception as lark_e:
                     logger.warning(f"[{self.chat_id}] Failed to update Lark card progress: {lark_e}")
                     pass # Continue even if card update fails
@@ -866,6 +1033,11 @@ class FacebookAdsCrawler:
                 logger.debug(f"[{self.chat_id}] Scraping ads for advertiser: '{page}'")
                 self.scrape_current_page_ads() # Assuming this function handles its own errors/stops
                 logger.info(f"[{self.chat_id}] Finished processing advertiser {idx}/{total_ids}: {page_name}. Total ads collected so far: {len(self.ads_data)}")
+                for listener in self.advertiser_listeners:
+                    try:
+                        listener(idx, total_ids, page_name)
+                    except Exception as e:
+                        logger.warning(f"[{self.chat_id}] Advertiser listener failed: {e}")
 
 
             # 3) Convert to DataFrame, clean, de-dupe, and save once
@@ -909,6 +1081,22 @@ class FacebookAdsCrawler:
                  logger.info(f"[{self.chat_id}] WebDriver was already None or closed.")
 
 
+    @classmethod
+    def record_to_row(cls, ad_data):
+        """
+        Per-ad equivalent of data_to_dataframe for streaming consumers.
+        Returns the cleaned row dict, or None if the ad would be filtered out.
+        """
+        image_url, video_url = ad_data.get("image_url"), ad_data.get("video_url")
+        if (image_url is None) == (video_url is None):
+            return None
+        row = {col: ad_data.get(col) for col in cls.FINAL_COLUMNS}
+        row["ad_url"] = image_url if image_url is not None else video_url
+        row["ad_type"] = "image" if image_url is not None else "video"
+        if row["pixel_id"] is not None:
+            row["pixel_id"] = str(row["pixel_id"]).replace("%3D", "")
+        return row
+
     def data_to_dataframe(self):  
         """Convert collected ads data to a DataFrame"""
         if self.should_stop():
@@ -933,20 +1121,35 @@ class FacebookAdsCrawler:
         df_cleaned["ad_type"] = df_cleaned["image_url"].notnull().replace({True: "image", False: "video"})
         df_cleaned["pixel_id"] = df_cleaned["pixel_id"].str.replace("%3D", "")
 
-        final_columns = [
-            "library_id",
-            "ad_start_date",
-            "company",
-            "pixel_id",
-            "destination_url",
-            "ad_type",
-            "ad_url",
-            "thumbnail_url",
-            "primary_text",     # 👈 now placed here
-            "headline_text"     # 👈 now placed here
-            ]
-
-        # print(f"--DataFrame created with rows: {df_cleaned.shape[0]} columns:", final_columns)
+        # print(f"--DataFrame created with rows: {df_cleaned.shape[0]} columns:", self.FINAL_COLUMNS)
         df_cleaned.drop_duplicates(subset = ["library_id", "company"], inplace = True)
-        self.df = df_cleaned[final_columns]
-        print(self.df.columns)
\ No newline at end of file
+        self.df = df_cleaned[self.FINAL_COLUMNS]
+        print(self.df.columns)
+
+
+_prewarm_lock = threading.Lock()
+
+def prewarm_crawl(domains, deadline: float = None):
+    """
+    Warm up ahead of a scheduled batch: start Chrome (left in warm_drivers for
+    the first crawl) and refresh the advertiser lists of `domains` in order,
+    stopping at `deadline`. Warm-ups run one at a time.
+    """
+    with _prewarm_lock:
+        # Reuse an idle warm browser when we already hold PREWARM_BROWSERS of them
+        driver = warm_drivers.take() if len(warm_drivers) >= max(1, PREWARM_BROWSERS) else None
+        driver = driver or launch_driver()
+        warmer = FacebookAdsCrawler(keyword="", chat_id=None)
+        try:
+            for domain in domains:
+                if deadline and time.time() >= deadline:
+                    break
+                warmer.keyword = domain
+                warmer.driver = driver
+                try:
+                    if warmer.fetch_ads_page():
+                        warmer.get_dim_keyword(refresh=True)
+                except Exception as e:
+                    logger.warning(f"Advertiser list warm-up failed for {domain}: {e}")
+        finally:
+            warm_drivers.put(driver)
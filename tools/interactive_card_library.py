@@ -315,6 +315,125 @@ def queue_card(search_word, position):
     }
 
 
+def partial_results_card(search_word, num_results, advertisers_done, total_advertisers, top_rows):
+    """
+    Creates a card summarizing results collected so far while the crawl continues.
+    
+    Args:
+        search_word (str): The domain being processed
+        num_results (int): Ads collected so far
+        advertisers_done (int): Advertisers already crawled
+        total_advertisers (int): Advertisers to crawl in total (0 if not known yet)
+        top_rows (list): A few result rows (dicts) to preview
+    
+    Returns:
+        dict: Card configuration
+    """
+    scope = f"{advertisers_done}/{total_advertisers} advertisers" if total_advertisers else f"{advertisers_done} advertisers"
+    preview = "\n".join(
+        f"{i}. {row.get('company') or '-'} · {row.get('ad_type') or '-'} · {row.get('library_id') or '-'}"
+        for i, row in enumerate(top_rows, 1)
+    ) or "(no rows yet)"
+
+    return {
+        "elements": [
+            {
+                "tag": "div",
+                "text": {
+                    "content": f"**🎯 Domain**\n{search_word}",
+                    "tag": "lark_md"
+                }
+            },
+            {
+                "tag": "div",
+                "text": {
+                    "content": f"**Found so far:** {num_results} ads from {scope}",
+                    "tag": "lark_md"
+                }
+            },
+            {
+                "tag": "div",
+                "text": {
+                    "content": f"**Preview:**\n{preview}",
+                    "tag": "lark_md"
+                }
+            },
+            {
+                "tag": "hr"
+            },
+            {
+                "tag": "div",
+                "text": {
+                    "content": "💡 The full Excel report follows when the crawl completes",
+                    "tag": "lark_md"
+                }
+            }
+        ],
+        "header": {
+            "template": "turquoise",
+            "title": {
+                "content": "📥 Partial results",
+                "tag": "plain_text"
+            }
+        }
+    }
+
+
+def schedule_batch_card(schedule_time, results, total):
+    """
+    Creates a card tracking a scheduled batch of domain searches.
+    
+    Args:
+        schedule_time (str): Schedule time that fired, e.g. "09:00 GMT+7"
+        results (dict): Finished domains mapped to (status, num_results);
+            status is "done", "no_results", "failed", "cancelled" or "skipped"
+        total (int): Number of domains in the batch
+    
+    Returns:
+        dict: Card configuration (a summary once every domain finished)
+    """
+    icons = {"done": "✅", "no_results": "➖", "failed": "❌", "cancelled": "⛔", "skipped": "⏭️"}
+    finished = len(results) >= total
+    lines = "\n".join(
+        f"{icons.get(status, '•')} {domain}" + (f" · {count} ads" if status == "done" else f" · {status.replace('_', ' ')}")
+        for domain, (status, count) in results.items()
+    ) or "(no domain finished yet)"
+    num_ads = sum(count for status, count in results.values() if status == "done")
+
+    return {
+        "elements": [
+            {
+                "tag": "div",
+                "text": {
+                    "content": f"**🕘 Schedule**\n{schedule_time}",
+                    "tag": "lark_md"
+                }
+            },
+            {
+                "tag": "div",
+                "text": {
+                    "content": f"**Domains finished:** {len(results)}/{total} · **Ads found:** {num_ads}",
+                    "tag": "lark_md"
+                }
+            },
+            {
+                "tag": "div",
+                "text": {
+                    "content": lines,
+                    "tag": "lark_md"
+                }
+            }
+        ],
+        "header": {
+            "template": "green" if finished else "blue",
+            "title": {
+                "content": "📋 Scheduled search summary" if finished else "⏳ Scheduled search in progress",
+                "tag": "plain_text"
+            }
+        }
+    }
+
+
 # Convenience function to get all available cards
 def get_available_cards():
     """
@@ -327,7 +446,9 @@ def get_available_cards():
         'domain_processing_card',
         'search_complete_card', 
         'search_no_result_card',
-        'queue_card'
+        'queue_card',
+        'partial_results_card',
+        'schedule_batch_card'
     ]
 
 